@@ -0,0 +1,849 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站评论异步抓取引擎
+功能：在同一个 aiohttp 连接池上并发抓取多个视频的评论，
+带全局并发上限和单主机并发上限
+"""
+
+import asyncio
+import math
+import os
+import sys
+import time
+
+import aiohttp
+import pandas as pd
+
+# 添加当前目录到Python路径，以便复用已有爬虫的解析与保存逻辑
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from auto_comments_crawler import get_random_headers
+from comments_crawler import (
+    API_BASE,
+    extract_top_comments,
+    get_next_offset,
+    main_comments_params,
+    parse_comments_to_dataframe,
+    parse_sub_replies_to_dataframe,
+    save_to_excel,
+)
+from cookie_pool import get_cookie_pool
+from crawl_checkpoint import DEFAULT_CHECKPOINT_PATH, CrawlCheckpoint
+from crawler_metrics import get_metrics
+from rate_limiter import RISK_CONTROL_STATUS, get_rate_limiter
+from response_archive import enable_archive, get_response_archive
+from rpid_index import RpidIndex, get_rpid_index
+from video_cache import get_video_cache
+
+VIEW_URL = f"{API_BASE}/x/web-interface/view"
+REPLY_URL = f"{API_BASE}/x/v2/reply"
+REPLY_MAIN_URL = f"{API_BASE}/x/v2/reply/main"
+REPLY_REPLY_URL = f"{API_BASE}/x/v2/reply/reply"
+
+# crawl_comments 的默认抓取方式：游标翻页抓取全部评论，按时间排序，补全回复，增量抓取
+DEFAULT_CRAWL_OPTIONS = {
+    "pagination": "cursor",
+    "sort_mode": 2,
+    "max_pages": None,
+    "expand_replies": True,
+    "incremental": True,
+}
+
+
+def new_progress():
+    """
+    新的翻页进度
+    next_page: 下一页页码；cursor: 下一页游标；total: 总评论数；done: 是否已到末页
+    """
+    return {"next_page": 1, "cursor": "", "total": 0, "done": False}
+
+
+def filter_new_comments(page_df, newest_ctime, newest_rpid):
+    """
+    增量抓取：从按时间倒序的一页评论中挑出比已保存评论更新的主评论（连同其回复）
+    :param newest_ctime: 已保存的最新主评论时间（"%Y-%m-%d %H:%M:%S" 字符串），None表示尚无记录
+    :param newest_rpid: 已保存的最新主评论ID
+    :return: (新评论DataFrame, 本页是否已出现已保存过的评论)
+    """
+    if newest_ctime is None:
+        return page_df, False
+
+    newest_ctime = pd.Timestamp(newest_ctime)
+    is_root = page_df['层级'] == '主评论'
+    group = is_root.cumsum()
+    roots = page_df[is_root & (page_df['评论类型'] != '置顶')]
+    is_new = (roots['评论时间'] > newest_ctime) | (
+        (roots['评论时间'] == newest_ctime) & (roots['评论ID'] > (newest_rpid or 0))
+    )
+    new_groups = group[roots.index[is_new]]
+    return page_df[group.isin(new_groups)], bool((~is_new).any())
+
+
+def replace_sub_replies(df, expanded):
+    """
+    用完整回复替换对应主评论下的预览回复，并按原主评论顺序插入
+    :param df: 一页评论（parse_comments_to_dataframe 格式）
+    :param expanded: {主评论ID: /x/v2/reply/reply 返回的回复列表}
+    :return: (合并后的DataFrame, 插入的回复数)
+    """
+    frames = []
+    previews = (df['层级'] == '子评论') & df['父评论ID'].isin(list(expanded))
+    kept = df[~previews]
+    for _, group in kept.groupby((kept['层级'] == '主评论').cumsum(), sort=False):
+        frames.append(group)
+        root_rpid = group['评论ID'].iloc[0]
+        if root_rpid in expanded:
+            frames.append(parse_sub_replies_to_dataframe(expanded[root_rpid], root_rpid))
+
+    return pd.concat(frames, ignore_index=True), sum(len(f) for f in frames) - len(kept)
+
+
+class AsyncCommentCrawler:
+    """基于共享 aiohttp 会话的多视频评论抓取器"""
+
+    def __init__(self, cookie="", max_concurrency=16, per_host_limit=8,
+                 video_concurrency=4, max_pages=200, sort_mode=0,
+                 pagination="page", page_window=6, page_size=20,
+                 expand_replies=False, reply_workers=4,
+                 timeout=20, max_retries=3, rate_limiter=None, checkpoint=None,
+                 incremental=False, output_dir="B站评论数据", video_cache=None,
+                 rpid_index=None, archive=None, cookie_pool=None):
+        """
+        :param cookie: B站Cookie
+        :param max_concurrency: 全局同时在途的请求数上限
+        :param per_host_limit: 单个主机的连接数上限
+        :param video_concurrency: 同时处理的视频数
+        :param max_pages: 每个视频最多抓取的页数，None表示不限
+        :param sort_mode: 排序模式 (0=按热度, 2=按时间)
+        :param pagination: 翻页方式 ("page"=页码翻页 /x/v2/reply，"cursor"=游标翻页 /x/v2/reply/main)
+        :param page_window: 单个视频同时在途的分页请求数
+        :param page_size: 每页评论数
+        :param expand_replies: 是否通过 /x/v2/reply/reply 补全每条主评论下的全部回复
+        :param reply_workers: 补全回复时每个视频的并发工作协程数
+        :param timeout: 单次请求超时（秒）
+        :param max_retries: 触发风控后的最大重试次数
+        :param rate_limiter: 自适应限速器，默认使用进程内共享实例
+        :param checkpoint: CrawlCheckpoint 实例，用于断点续抓
+        :param incremental: 增量模式：已抓取完成的视频只补抓上次之后的新评论（需配合检查点和 sort_mode=2）
+        :param output_dir: crawl_many 保存Excel文件的目录
+        :param video_cache: 视频元数据缓存，默认使用进程内共享实例
+        :param rpid_index: 全局评论ID索引（见 rpid_index），提供时只写出以前从未写出过的评论；
+                           不提供时只在单个视频的本次抓取内去重（如置顶评论在第1页重复出现）
+        :param archive: 原始响应归档（见 response_archive），默认使用 enable_archive 开启的共享归档
+        :param cookie_pool: 多账号Cookie池（见 cookie_pool），默认使用配置文件中的共享Cookie池；
+                            未配置时所有请求使用 cookie
+        """
+        self.cookie = cookie
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.video_concurrency = video_concurrency
+        self.max_pages = max_pages
+        self.sort_mode = sort_mode
+        self.pagination = pagination
+        self.page_window = page_window
+        self.page_size = page_size
+        self.expand_replies = expand_replies
+        self.reply_workers = reply_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.checkpoint = checkpoint
+        self.incremental = incremental
+        self.output_dir = output_dir
+        self.video_cache = video_cache or get_video_cache()
+        self.rpid_index = rpid_index
+        self.archive = archive or get_response_archive()
+        self.cookie_pool = cookie_pool or get_cookie_pool()
+
+        self._session = None
+        self._request_semaphore = None
+        self._video_semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency,
+            limit_per_host=self.per_host_limit,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self._request_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._video_semaphore = asyncio.Semaphore(self.video_concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_json(self, url, params, bvid):
+        """
+        在限速器和全局并发上限内发起GET请求并返回JSON
+        触发风控时由限速器降速暂停，随后重试
+        """
+        metrics = get_metrics()
+        for attempt in range(self.max_retries + 1):
+            retry = attempt < self.max_retries
+            if attempt:
+                metrics.record_retry(url)
+            await self.rate_limiter.acquire_async(url)
+            account = None
+            if self.cookie_pool is not None:
+                account = await self.cookie_pool.acquire_async()
+
+            async with self._request_semaphore:
+                start = time.perf_counter()
+                async with self._session.get(
+                    url,
+                    params=params,
+                    headers=get_random_headers(bvid, account.cookie if account else self.cookie)
+                ) as response:
+                    body = await response.read()
+                    elapsed = time.perf_counter() - start
+                    if response.status != 200:
+                        metrics.observe_request(url, elapsed, response.status, None, len(body))
+                        if self.cookie_pool is not None:
+                            self.cookie_pool.feedback(account, response.status, None)
+                    if response.status in RISK_CONTROL_STATUS:
+                        self.rate_limiter.feedback(url, response.status, None)
+                        if retry:
+                            continue
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+                    metrics.observe_request(url, elapsed, response.status, data.get("code"), len(body))
+
+            if self.cookie_pool is not None:
+                self.cookie_pool.feedback(account, response.status, data.get("code"))
+            if self.rate_limiter.feedback(url, response.status, data.get("code")) and retry:
+                continue
+            if self.archive is not None:
+                self.archive.record(url, bvid, params, data)
+            return data
+
+    async def fetch_video_info(self, bvid):
+        """
+        获取视频信息(AID和标题)
+        :return: (aid, title) 或 (None, None)
+        """
+        info = self.video_cache.get(bvid)
+        if info is not None:
+            return info["aid"], info["title"]
+
+        try:
+            data = await self._get_json(VIEW_URL, {"bvid": bvid}, bvid)
+        except Exception as e:
+            print(f"[{bvid}] 获取视频信息时出错: {e}")
+            return None, None
+
+        if data.get("code") != 0:
+            print(f"[{bvid}] 获取视频信息失败: {data.get('message', '未知错误')}")
+            return None, None
+
+        info = self.video_cache.put(bvid, data["data"])
+        return info["aid"], info["title"]
+
+    async def fetch_video_stats(self, bvid):
+        """
+        获取视频统计数据（播放、弹幕、点赞、投币、收藏、转发、评论数和发布时间）
+        统计数据未过期时直接使用视频元数据缓存
+        :return: 视频信息字典（格式同 video_cache.parse_view_data），失败时返回 None
+        """
+        info = self.video_cache.get(bvid, need_stats=True)
+        if info is not None:
+            return info
+
+        try:
+            data = await self._get_json(VIEW_URL, {"bvid": bvid}, bvid)
+        except Exception as e:
+            print(f"[{bvid}] 获取视频统计数据时出错: {e}")
+            return None
+
+        if data.get("code") != 0:
+            print(f"[{bvid}] 获取视频统计数据失败: {data.get('message', '未知错误')}")
+            return None
+
+        return self.video_cache.put(bvid, data["data"])
+
+    async def fetch_main_page(self, aid, bvid, offset=""):
+        """
+        使用游标API获取一页评论
+        :param offset: 上一页返回的游标，空字符串表示第一页
+        :return: API返回数据，失败时返回 None
+        """
+        mode = 2 if self.sort_mode == 2 else 3
+        params = main_comments_params(aid, offset, mode)
+        try:
+            data = await self._get_json(REPLY_MAIN_URL, params, bvid)
+        except Exception as e:
+            print(f"[{bvid}] 游标翻页请求失败: {e}")
+            return None
+
+        if data.get("code") != 0:
+            print(f"[{bvid}] API返回错误: {data.get('message')} (代码: {data.get('code')})")
+            return None
+        return data
+
+    async def fetch_top_comments(self, aid, bvid):
+        """获取置顶评论"""
+        data = await self.fetch_main_page(aid, bvid)
+        if data is None:
+            return []
+        return extract_top_comments(data)
+
+    async def fetch_comment_page(self, aid, bvid, page):
+        """
+        获取一页评论
+        :return: (API返回数据, 总评论数)，失败时返回 (None, 0)
+        """
+        params = {"pn": page, "ps": self.page_size, "type": 1, "oid": aid, "sort": self.sort_mode}
+        try:
+            data = await self._get_json(REPLY_URL, params, bvid)
+        except Exception as e:
+            print(f"[{bvid}] 获取第 {page} 页评论失败: {e}")
+            return None, 0
+
+        if data.get("code") != 0:
+            print(f"[{bvid}] API返回错误: {data.get('message')} (代码: {data.get('code')})")
+            return None, 0
+
+        total = (data.get("data") or {}).get("page", {}).get("count", 0)
+        return data, total
+
+    async def _fetch_pages_ordered(self, aid, bvid, pages):
+        """
+        并发抓取多页评论，按页码顺序产出结果
+        同时在途的请求不超过 page_window 个，消费方停止迭代时取消剩余请求
+        :return: 异步生成器，产出 (页码, API返回数据)
+        """
+        pages = list(pages)
+        tasks = {}
+        submitted = 0
+        try:
+            for i, page in enumerate(pages):
+                # 补满窗口：始终只提前提交 page_window 个页面
+                while submitted < len(pages) and submitted < i + self.page_window:
+                    next_page = pages[submitted]
+                    tasks[next_page] = asyncio.ensure_future(
+                        self.fetch_comment_page(aid, bvid, next_page)
+                    )
+                    submitted += 1
+
+                data, _ = await tasks.pop(page)
+                yield page, data
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def iter_comment_pages(self, aid, bvid, progress=None):
+        """
+        按页码顺序抓取评论
+        第1页返回后根据 data.page.count 计算总页数，其余页面并发抓取
+        :param progress: 翻页进度，见 new_progress；从 next_page 开始抓取，并随每页更新
+        :return: 异步生成器，产出 (页码, 评论DataFrame, 总评论数)
+        """
+        progress = progress if progress is not None else new_progress()
+        start_page = progress["next_page"]
+
+        if start_page == 1:
+            data, total = await self.fetch_comment_page(aid, bvid, 1)
+            if data is None:
+                return
+
+            page_df = parse_comments_to_dataframe(data)
+            if page_df.empty:
+                progress["done"] = True
+                return
+
+            page_size = data["data"].get("page", {}).get("size") or self.page_size
+            progress.update(next_page=2, total=total, page_size=page_size)
+            yield 1, page_df, total
+            start_page = 2
+
+        total = progress["total"]
+        page_size = progress.get("page_size") or self.page_size
+        total_pages = math.ceil(total / page_size)
+        if self.max_pages is not None:
+            total_pages = min(self.max_pages, total_pages)
+
+        pages = self._fetch_pages_ordered(aid, bvid, range(start_page, total_pages + 1))
+        try:
+            async for page, data in pages:
+                # 失败页之后的结果不再使用，保证进度中的 next_page 之前没有缺页
+                if data is None:
+                    print(f"[{bvid}] 第 {page} 页获取失败，停止抓取")
+                    return
+
+                page_df = parse_comments_to_dataframe(data)
+                if page_df.empty:
+                    print(f"[{bvid}] 第 {page} 页无评论数据，停止抓取")
+                    break
+                progress["next_page"] = page + 1
+                yield page, page_df, total
+        finally:
+            await pages.aclose()
+        progress["done"] = True
+
+    async def iter_cursor_pages(self, aid, bvid, progress=None):
+        """
+        沿 next/pagination_str 游标顺序抓取全部评论，直到 is_end
+        第一页中的置顶评论会合并到第1页结果中
+        :param progress: 翻页进度，见 new_progress；从 cursor 开始抓取，并随每页更新
+        :return: 异步生成器，产出 (页码, 评论DataFrame, 总评论数)
+        """
+        progress = progress if progress is not None else new_progress()
+        offset = progress["cursor"]
+        page = progress["next_page"] - 1
+        while self.max_pages is None or page < self.max_pages:
+            data = await self.fetch_main_page(aid, bvid, offset)
+            if data is None:
+                return
+            page += 1
+
+            page_df = parse_comments_to_dataframe(data)
+            if page == 1:
+                top_comments = extract_top_comments(data)
+                if top_comments:
+                    top_df = parse_comments_to_dataframe(top_comments, is_top=True)
+                    page_df = pd.concat([top_df, page_df], ignore_index=True)
+            if page_df.empty:
+                break
+
+            total = data["data"].get("cursor", {}).get("all_count", 0)
+            next_offset = get_next_offset(data)
+            progress.update(next_page=page + 1, cursor=next_offset or "", total=total)
+            yield page, page_df, total
+
+            if next_offset is None or next_offset == offset:
+                break
+            offset = next_offset
+        progress["done"] = True
+
+    def iter_pages(self, aid, bvid, progress=None):
+        """按 pagination 设置选择页码翻页或游标翻页"""
+        if self.pagination == "cursor":
+            return self.iter_cursor_pages(aid, bvid, progress)
+        return self.iter_comment_pages(aid, bvid, progress)
+
+    async def fetch_reply_page(self, aid, bvid, root, page):
+        """
+        获取某条主评论下的一页回复
+        :return: API返回数据，失败时返回 None
+        """
+        params = {"oid": aid, "type": 1, "root": root, "pn": page, "ps": self.page_size}
+        try:
+            data = await self._get_json(REPLY_REPLY_URL, params, bvid)
+        except Exception as e:
+            print(f"[{bvid}] 获取评论 {root} 的第 {page} 页回复失败: {e}")
+            return None
+
+        if data.get("code") != 0:
+            print(f"[{bvid}] 获取评论 {root} 的回复失败: {data.get('message')} (代码: {data.get('code')})")
+            return None
+        return data
+
+    async def fetch_sub_replies(self, aid, bvid, root):
+        """
+        翻页获取某条主评论下的全部回复
+        :return: 回复对象列表；任意一页失败时返回 None，保留原有预览回复
+        """
+        replies = []
+        page = 1
+        while True:
+            data = await self.fetch_reply_page(aid, bvid, root, page)
+            if data is None:
+                return None
+
+            page_replies = data["data"].get("replies") or []
+            replies.extend(page_replies)
+
+            count = data["data"].get("page", {}).get("count", 0)
+            if not page_replies or len(replies) >= count:
+                return replies
+            page += 1
+
+    async def expand_sub_replies(self, aid, bvid, df):
+        """
+        补全回复：把回复数多于已内嵌预览回复的主评论放入队列，
+        由多个工作协程并发翻页 /x/v2/reply/reply，结果合并到对应的父评论ID下
+        :param df: parse_comments_to_dataframe 格式的评论数据
+        :return: 补全回复后的DataFrame；任意一条主评论的回复未能补全时返回 None，
+                 调用方不应保存这一页，以免只带预览回复的评论被当作已完整抓取
+        """
+        if df.empty:
+            return df
+
+        main_rows = df[df['层级'] == '主评论']
+        reply_counts = pd.to_numeric(main_rows['回复数'], errors='coerce').fillna(0)
+        embedded_counts = df.loc[df['层级'] == '子评论', '父评论ID'].value_counts()
+        embedded = main_rows['评论ID'].map(embedded_counts).fillna(0)
+        roots = list(dict.fromkeys(main_rows.loc[reply_counts > embedded, '评论ID']))
+        if not roots:
+            return df
+
+        print(f"[{bvid}] 需要补全回复的主评论: {len(roots)} 条")
+        queue = asyncio.Queue()
+        for root in roots:
+            queue.put_nowait(root)
+
+        expanded = {}
+        failed = []
+
+        async def worker():
+            while not failed:
+                try:
+                    root = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                replies = await self.fetch_sub_replies(aid, bvid, root)
+                if replies is None:
+                    failed.append(root)
+                else:
+                    expanded[root] = replies
+
+        workers = min(self.reply_workers, len(roots))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if failed:
+            print(f"[{bvid}] 评论 {failed[0]} 的回复未能补全")
+            return None
+
+        merged, sub_total = replace_sub_replies(df, expanded)
+        print(f"[{bvid}] 已补全 {len(roots)} 条主评论下的 {sub_total} 条回复")
+        return merged
+
+    async def crawl_video(self, bvid, on_page=None, sink=None):
+        """
+        抓取单个视频的全部评论
+        每页评论（补全回复后）逐页交给检查点、sink 或内存列表，
+        配置了检查点时，每页评论与翻页进度在同一事务中落盘，再次运行会从中断处继续
+        :param on_page: 每页完成后按页码顺序调用的回调 on_page(页码, 本页DataFrame, 总评论数)
+        :param sink: comment_sinks 中的流式写出对象；提供时评论只写入 sink，不在内存中累积，
+                     返回结果中的 df 为空，rows 为写出的评论数
+        :return: {'bvid', 'title', 'total', 'rows', 'df'}，获取视频信息失败时 df 为空
+        """
+        result = {"bvid": bvid, "title": None, "total": 0, "rows": 0, "df": pd.DataFrame()}
+
+        aid, title = await self.fetch_video_info(bvid)
+        if not aid:
+            return result
+        result["title"] = title
+
+        progress = new_progress()
+        if self.checkpoint is not None:
+            state = self.checkpoint.start_video(bvid, aid, title, self.pagination, self.sort_mode)
+            if state["done"]:
+                if self.incremental and self.sort_mode == 2:
+                    result["total"] = await self.crawl_new_comments(aid, bvid, state)
+                else:
+                    print(f"[{bvid}] 检查点显示该视频已抓取完成，直接读取已保存的评论")
+                    result["total"] = state["total"]
+                return self._collect_saved(bvid, result, sink)
+            if state["next_page"] > 1:
+                print(f"[{bvid}] 从检查点继续抓取: 第 {state['next_page']} 页")
+            progress.update(next_page=state["next_page"], cursor=state["cursor"], total=state["total"])
+        if progress["next_page"] == 1 and self.rpid_index is not None:
+            # 从头完整抓取（首次抓取、检查点已重置或不使用检查点），结果会覆盖以前的完整导出，
+            # 该视频以前记录的评论ID不再作数，否则重新运行时只会写出新增的评论
+            self.rpid_index.forget(bvid)
+
+        frames = []
+        seen = RpidIndex(None, capacity=100000)
+        top_df = None
+        if self.pagination == "page" and progress["next_page"] == 1:
+            top_comments = await self.fetch_top_comments(aid, bvid)
+            if top_comments:
+                top_df = parse_comments_to_dataframe(top_comments, is_top=True)
+
+        pages = self.iter_pages(aid, bvid, progress)
+        try:
+            async for page, page_df, total in pages:
+                # 置顶评论与第1页一起落盘，避免中断后重复写入
+                if top_df is not None:
+                    page_df = pd.concat([top_df, page_df], ignore_index=True)
+                    top_df = None
+                # 回复只挂在本页主评论下，逐页补全即可，无需先汇总全部评论
+                if self.expand_replies:
+                    expanded_df = await self.expand_sub_replies(aid, bvid, page_df)
+                    if expanded_df is None:
+                        # 与评论页请求失败一样停止抓取该视频：本页不落盘、视频不标记完成，
+                        # 下次运行从这一页重新抓取
+                        print(f"[{bvid}] 第 {page} 页的回复未能全部补全，停止抓取该视频，下次运行从这一页继续")
+                        break
+                    page_df = expanded_df
+                page_df = self._drop_duplicates(page_df, seen)
+
+                result["total"] = total
+                if self.checkpoint is not None:
+                    self.checkpoint.save_page(bvid, page_df, progress)
+                elif sink is not None:
+                    sink.write(page_df)
+                    result["rows"] += len(page_df)
+                else:
+                    frames.append(page_df)
+                # 写出之后再记录评论ID，中断时未写出的评论不会被误判为重复
+                if self.rpid_index is not None:
+                    self.rpid_index.add_frame(page_df, bvid=bvid)
+                if on_page is not None:
+                    on_page(page, page_df, total)
+        finally:
+            await pages.aclose()
+
+        if self.checkpoint is not None:
+            if progress["done"]:
+                self.checkpoint.mark_done(bvid)
+            return self._collect_saved(bvid, result, sink)
+
+        if sink is None:
+            result["df"] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            result["rows"] = len(result["df"])
+        return result
+
+    def _drop_duplicates(self, page_df, seen):
+        """
+        丢弃本次抓取中已出现过的评论（置顶评论重复、热度排序翻页时评论位置变化等），
+        配置了全局评论ID索引时同时丢弃以前已写出过的评论
+        """
+        page_df = seen.drop_seen(page_df, record=True)
+        if self.rpid_index is not None:
+            page_df = self.rpid_index.drop_seen(page_df)
+        return page_df
+
+    def _collect_saved(self, bvid, result, sink):
+        """把检查点中已保存的评论放入结果；提供 sink 时分批写出，不整体载入内存"""
+        if sink is None:
+            result["df"] = self.checkpoint.load_comments(bvid)
+            result["rows"] = len(result["df"])
+        else:
+            for batch in self.checkpoint.iter_comments(bvid):
+                sink.write(batch)
+                result["rows"] += len(batch)
+        return result
+
+    async def crawl_new_comments(self, aid, bvid, state):
+        """
+        增量抓取：按时间倒序翻页，遇到已保存过的主评论即停止，只追加新评论
+        中途有页面获取失败时不保存本次结果：最新评论记录一旦推进，
+        失败页与上次保存位置之间的新评论以后就不会再被抓取
+        注意：已保存主评论下新增的回复不会被补抓
+        :param state: 检查点中的视频进度（含 newest_ctime/newest_rpid）
+        :return: 当前总评论数
+        """
+        total = state["total"]
+        frames = []
+        progress = new_progress()
+        reached_old = False
+        pages = self.iter_pages(aid, bvid, progress)
+        try:
+            async for page, page_df, total in pages:
+                new_df, reached_old = filter_new_comments(
+                    page_df, state["newest_ctime"], state["newest_rpid"]
+                )
+                if not new_df.empty:
+                    frames.append(new_df)
+                if reached_old:
+                    break
+        finally:
+            await pages.aclose()
+
+        if not (reached_old or progress["done"]):
+            print(f"[{bvid}] 增量抓取中途失败，未翻到上次保存的评论，本次不保存，下次运行重新抓取")
+            return total
+
+        new_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if self.expand_replies and not new_df.empty:
+            new_df = await self.expand_sub_replies(aid, bvid, new_df)
+            if new_df is None:
+                # 不追加、不推进最新评论记录，下次增量抓取时重新获取这些新评论
+                print(f"[{bvid}] 新评论的回复未能全部补全，本次不保存，下次运行重新抓取")
+                return total
+        new_df = self._drop_duplicates(new_df, RpidIndex(None, capacity=100000))
+
+        self.checkpoint.append_comments(bvid, new_df)
+        if self.rpid_index is not None:
+            self.rpid_index.add_frame(new_df, bvid=bvid)
+        print(f"[{bvid}] 增量抓取完成: 新增 {len(new_df)} 条评论")
+        return total
+
+    async def _crawl_and_save(self, bvid, index, total):
+        """在视频并发上限内抓取并保存一个视频的评论"""
+        async with self._video_semaphore:
+            start_time = time.time()
+            print(f"[{index}/{total}] 开始抓取视频 {bvid}")
+            result = await self.crawl_video(bvid)
+
+            df = result["df"]
+            if df.empty:
+                print(f"[{index}/{total}] 视频 {bvid} 未获取到评论")
+                return result
+
+            df.insert(0, '层级标识', df['层级'].apply(
+                lambda x: "▶" if x == "主评论" else "└└─"
+            ))
+            df.sort_values(by='点赞数', ascending=False, inplace=True)
+
+            # Excel写入是阻塞操作，放到线程池中执行，避免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            result["path"] = await loop.run_in_executor(
+                None, save_to_excel, df, bvid, result["title"] or "未知视频", self.output_dir
+            )
+
+            elapsed = time.time() - start_time
+            print(f"[{index}/{total}] 视频 {bvid} 完成: {len(df)} 条评论, 耗时 {elapsed:.2f} 秒")
+            return result
+
+    async def crawl_many(self, bvids):
+        """
+        并发抓取多个视频的评论并分别保存
+        :param bvids: BV号列表
+        :return: 每个视频的抓取结果列表（与输入顺序一致）
+        """
+        total = len(bvids)
+        tasks = [
+            self._crawl_and_save(bvid, i, total)
+            for i, bvid in enumerate(bvids, 1)
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        normalized = []
+        for bvid, result in zip(bvids, results):
+            if isinstance(result, Exception):
+                print(f"视频 {bvid} 抓取出错: {result}")
+                result = {"bvid": bvid, "title": None, "total": 0, "rows": 0, "df": pd.DataFrame()}
+            normalized.append(result)
+        return normalized
+
+
+async def crawl_bvids(bvids, cookie="", **options):
+    """
+    并发抓取多个视频评论的便捷入口
+    :param bvids: BV号列表
+    :param cookie: B站Cookie
+    :param options: 传给 AsyncCommentCrawler 的其他参数
+    :return: 每个视频的抓取结果列表
+    """
+    async with AsyncCommentCrawler(cookie=cookie, **options) as crawler:
+        return await crawler.crawl_many(bvids)
+
+
+def fetch_bvids_stats(bvids, cookie="", **options):
+    """
+    同步入口：在同一个连接池上并发获取多个视频的统计数据
+    :param bvids: BV号列表
+    :param cookie: B站Cookie
+    :param options: 传给 AsyncCommentCrawler 的其他参数（如 max_concurrency）
+    :return: {BV号: 视频信息字典，失败时为 None}
+    """
+    bvids = list(dict.fromkeys(bvids))
+
+    async def _fetch():
+        async with AsyncCommentCrawler(cookie=cookie, **options) as crawler:
+            return await asyncio.gather(*(crawler.fetch_video_stats(bvid) for bvid in bvids))
+
+    return dict(zip(bvids, asyncio.run(_fetch())))
+
+
+def crawl_video_comments(bvid, cookie="", on_page=None, sink=None, **options):
+    """
+    同步入口：抓取单个视频的全部评论
+    :param bvid: BV号
+    :param cookie: B站Cookie
+    :param on_page: 每页完成后按页码顺序调用的回调 on_page(页码, 本页DataFrame, 总评论数)
+    :param sink: 流式写出对象，见 AsyncCommentCrawler.crawl_video
+    :param options: 传给 AsyncCommentCrawler 的其他参数
+    :return: {'bvid', 'title', 'total', 'rows', 'df'}
+    """
+    async def _crawl():
+        async with AsyncCommentCrawler(cookie=cookie, **options) as crawler:
+            return await crawler.crawl_video(bvid, on_page=on_page, sink=sink)
+
+    return asyncio.run(_crawl())
+
+
+def crawl_comments(bvids, cookie="", checkpoint_path=DEFAULT_CHECKPOINT_PATH, dedup=True, **options):
+    """
+    进程内批量抓取评论的库接口
+    所有视频共享同一个连接池、限速器和检查点，每个视频的评论保存为一个Excel文件
+    :param bvids: BV号或BV号列表
+    :param cookie: B站Cookie
+    :param checkpoint_path: 检查点数据库路径，None表示不使用检查点
+    :param dedup: 是否通过全局评论ID索引跨运行去重，只写出以前从未写出过的评论
+    :param options: 传给 AsyncCommentCrawler 的参数，未指定的按 DEFAULT_CRAWL_OPTIONS 设置
+    :return: 每个视频的抓取结果列表 {'bvid', 'title', 'total', 'rows', 'df', 'path'}
+    """
+    if isinstance(bvids, str):
+        bvids = [bvids]
+    # 去重并保持原有顺序
+    bvids = list(dict.fromkeys(
+        bv.strip() for bv in bvids if isinstance(bv, str) and bv.strip()
+    ))
+    if not bvids:
+        return []
+
+    options = dict(DEFAULT_CRAWL_OPTIONS, **options)
+    if dedup and options.get("rpid_index") is None:
+        options["rpid_index"] = get_rpid_index()
+    if checkpoint_path is None:
+        options["incremental"] = False
+        return asyncio.run(crawl_bvids(bvids, cookie=cookie, **options))
+
+    with CrawlCheckpoint(checkpoint_path) as checkpoint:
+        return asyncio.run(crawl_bvids(bvids, cookie=cookie, checkpoint=checkpoint, **options))
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("B站视频评论异步批量抓取工具")
+    print("=" * 60)
+
+    from crawl_scheduler import plan_crawl, print_plan
+    from extract_and_crawl_comments import get_bilibili_cookie
+
+    if len(sys.argv) < 2:
+        print("使用方法: python async_comments_crawler.py [--archive] <BV号...|bilibili_results_*.csv>")
+        print("  --archive  同时把原始API响应归档到 B站原始数据/，之后可用 replay_archive.py 离线重建")
+        return
+
+    args = sys.argv[1:]
+    if "--archive" in args:
+        args = [arg for arg in args if arg != "--archive"]
+        enable_archive()
+        print("已开启原始响应归档")
+
+    bvids = []
+    for arg in args:
+        if arg.endswith(".csv"):
+            # CSV中的视频按每个请求能获得的评论数和播放量排列抓取顺序
+            plan = plan_crawl(arg)
+            print_plan(plan)
+            bvids.extend(plan['BV号'].tolist() if not plan.empty else [])
+        else:
+            bvids.append(arg)
+    if not any(isinstance(bv, str) and bv.strip() for bv in bvids):
+        print("未提供任何BV号，程序退出")
+        return
+
+    # 配置了多账号Cookie池时使用池中的账号
+    cookie = "" if get_cookie_pool() is not None else get_bilibili_cookie()
+
+    start_time = time.time()
+    # 游标翻页不受页数上限限制，可获取全部评论；检查点用于中断后续抓，
+    # 按时间排序时已抓取完成的视频只补抓新增评论
+    results = crawl_comments(bvids, cookie=cookie)
+    elapsed = time.time() - start_time
+    get_rate_limiter().print_report()
+    if get_cookie_pool() is not None:
+        get_cookie_pool().print_report()
+    get_metrics().finish_run("async_comments_crawler")
+
+    success = sum(1 for r in results if r.get("path"))
+    rows = sum(r["rows"] for r in results)
+    print("\n" + "=" * 60)
+    print(f"批量抓取完成! 成功: {success}/{len(results)}, 共 {rows} 条评论, 耗时 {elapsed:.1f} 秒")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
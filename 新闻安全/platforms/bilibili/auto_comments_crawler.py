@@ -4,11 +4,8 @@
 自动爬取B站视频评论的脚本
 """
 
-import requests
 import json
-import time
 import pandas as pd
-from datetime import datetime
 import os
 import sys
 import traceback
@@ -20,6 +17,15 @@ import re
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 sys.path.insert(0, project_root)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from comments_crawler import API_BASE, request_json
+from comment_schema import parse_replies
+from cookie_pool import get_cookie_pool
+from crawler_metrics import get_metrics
+from rate_limiter import get_rate_limiter
+from rpid_index import RpidIndex
+from video_cache import get_video_cache
 
 # 用户代理列表，用于随机选择
 USER_AGENTS = [
@@ -66,17 +72,21 @@ def get_bvid_info(bvid, cookie=""):
     :return: (aid, title) 或 (None, None)
     """
     try:
-        url = f"https://api.bilibili.com/x/web-interface/view"
+        # 同一视频的信息只请求一次，之后从缓存读取
+        cache = get_video_cache()
+        info = cache.get(bvid)
+        if info is not None:
+            return info["aid"], info["title"]
+
+        url = f"{API_BASE}/x/web-interface/view"
         params = {"bvid": bvid}
         headers = get_random_headers(bvid, cookie)
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        data = response.json()
+        data = request_json(url, params, headers, timeout=10, bvid=bvid)
         
         if data.get("code") == 0:
-            aid = data["data"]["aid"]
-            title = data["data"]["title"]
-            return aid, title
+            info = cache.put(bvid, data["data"])
+            return info["aid"], info["title"]
         else:
             print(f"获取视频信息失败: {data.get('message', '未知错误')}")
             return None, None
@@ -88,82 +98,70 @@ def get_bvid_info(bvid, cookie=""):
 
 def parse_comment_data(comment_data):
     """
-    解析评论数据为DataFrame格式
+    解析评论数据为DataFrame格式（与 comments_crawler 使用同一套列，见 comment_schema）
     :param comment_data: 评论数据字典
     :return: DataFrame
     """
-    comments = []
-    
-    # 主评论
-    if "replies" in comment_data and comment_data["replies"]:
-        for reply in comment_data["replies"]:
-            # 主评论信息
-            main_comment = {
-                "层级": "主评论",
-                "用户名": reply.get("member", {}).get("uname", ""),
-                "性别": reply.get("member", {}).get("sex", ""),
-                "评论时间": datetime.fromtimestamp(reply.get("ctime", 0)).strftime('%Y-%m-%d %H:%M:%S') if reply.get("ctime") else "",
-                "点赞数": reply.get("like", 0),
-                "评论内容": reply.get("content", {}).get("message", ""),
-                "评论类型": "置顶" if reply.get("is_up_top", False) else "普通",
-                "用户等级": reply.get("member", {}).get("level_info", {}).get("current_level", 0),
-                "用户头像": reply.get("member", {}).get("avatar", ""),
-                "用户ID": reply.get("member", {}).get("mid", ""),
-                "回复数": reply.get("rcount", 0),
-                "评论ID": reply.get("rpid", "")
-            }
-            comments.append(main_comment)
-            
-            # 子评论（回复）
-            if "replies" in reply and reply["replies"]:
-                for sub_reply in reply["replies"]:
-                    sub_comment = {
-                        "层级": "子评论",
-                        "用户名": sub_reply.get("member", {}).get("uname", ""),
-                        "性别": sub_reply.get("member", {}).get("sex", ""),
-                        "评论时间": datetime.fromtimestamp(sub_reply.get("ctime", 0)).strftime('%Y-%m-%d %H:%M:%S') if sub_reply.get("ctime") else "",
-                        "点赞数": sub_reply.get("like", 0),
-                        "评论内容": sub_reply.get("content", {}).get("message", ""),
-                        "评论类型": "普通",
-                        "用户等级": sub_reply.get("member", {}).get("level_info", {}).get("current_level", 0),
-                        "用户头像": sub_reply.get("member", {}).get("avatar", ""),
-                        "用户ID": sub_reply.get("member", {}).get("mid", ""),
-                        "回复数": 0,
-                        "评论ID": sub_reply.get("rpid", "")
-                    }
-                    comments.append(sub_comment)
-                    
-    return pd.DataFrame(comments)
-
-
-def get_video_comments(bvid, cookie="", max_pages=50, sort_mode=0):
+    return parse_replies(comment_data.get("replies"))
+
+
+def get_video_comments_by_cursor(aid, bvid, cookie="", sort_mode=0):
     """
-    获取视频评论
+    使用游标API获取视频的全部评论
+    :param aid: 视频AID
+    :param bvid: BV号
+    :param cookie: B站Cookie
+    :param sort_mode: 排序模式 (0=按热度, 2=按时间)
+    :return: 生成器，逐页产出评论DataFrame
+    """
+    from comments_crawler import get_main_comments, get_next_offset
+
+    offset = ""
+    page = 1
+    mode = 2 if sort_mode == 2 else 3
+
+    while True:
+        try:
+            print(f"正在获取第 {page} 页评论 (游标翻页)...")
+            data = get_main_comments(aid, bvid, cookie, offset, mode)
+            if not data or not data.get("data") or not data["data"].get("replies"):
+                print(f"第 {page} 页无评论数据或请求失败")
+                break
+
+            df = parse_comment_data(data["data"])
+            print(f"第 {page} 页获取到 {len(df)} 条评论")
+            yield df
+
+            next_offset = get_next_offset(data)
+            if next_offset is None or next_offset == offset:
+                print("已到达最后一页")
+                break
+            offset = next_offset
+            page += 1
+
+        except Exception as e:
+            print(f"处理第 {page} 页时出错: {e}")
+            break
+
+
+def get_video_comments_by_page(aid, bvid, cookie="", max_pages=50, sort_mode=0):
+    """
+    使用页码API获取视频评论
+    :param aid: 视频AID
     :param bvid: BV号
     :param cookie: B站Cookie
     :param max_pages: 最大页数
     :param sort_mode: 排序模式 (0=按热度, 2=按时间)
-    :return: DataFrame
+    :return: 生成器，逐页产出评论DataFrame
     """
-    print(f"开始获取视频 {bvid} 的评论...")
-    
-    # 获取视频信息
-    aid, video_title = get_bvid_info(bvid, cookie)
-    if not aid:
-        print("无法获取视频信息")
-        return pd.DataFrame()
-        
-    print(f"视频标题: {video_title}")
-    
-    all_comments = []
     page = 1
     
     while page <= max_pages:
         try:
             print(f"正在获取第 {page} 页评论...")
             
-            # 构造API请求
-            url = "https://api.bilibili.com/x/v2/reply"
+            # 构造API请求；限速、多账号Cookie、指标和归档由 request_json 统一处理
+            url = f"{API_BASE}/x/v2/reply"
             params = {
                 "pn": page,
                 "type": 1,
@@ -172,36 +170,75 @@ def get_video_comments(bvid, cookie="", max_pages=50, sort_mode=0):
             }
             
             headers = get_random_headers(bvid, cookie)
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            data = request_json(url, params, headers, timeout=10, bvid=bvid)
             
-            if response.status_code == 200:
-                data = response.json()
-                
-                # 检查是否有评论数据
-                if data.get("code") == 0 and data.get("data") and data["data"].get("replies"):
-                    # 解析评论数据
-                    df = parse_comment_data(data["data"])
-                    if not df.empty:
-                        all_comments.append(df)
-                        print(f"第 {page} 页获取到 {len(df)} 条评论")
-                    else:
-                        print(f"第 {page} 页无评论数据")
-                        break
+            # 检查是否有评论数据
+            if data.get("code") == 0 and data.get("data") and data["data"].get("replies"):
+                # 解析评论数据
+                df = parse_comment_data(data["data"])
+                if not df.empty:
+                    print(f"第 {page} 页获取到 {len(df)} 条评论")
+                    yield df
                 else:
-                    print(f"第 {page} 页无评论数据或请求失败")
+                    print(f"第 {page} 页无评论数据")
                     break
             else:
-                print(f"请求失败，状态码: {response.status_code}")
+                print(f"第 {page} 页无评论数据或请求失败")
                 break
                 
             page += 1
-            # 添加延迟避免请求过快
-            time.sleep(random.uniform(0.5, 1.5))
             
         except Exception as e:
             print(f"处理第 {page} 页时出错: {e}")
             break
+
+
+def _drop_duplicate_pages(pages, bvid, rpid_index=None):
+    """逐页去掉重复评论：置顶评论重复出现、翻页时评论位置变化等"""
+    seen = RpidIndex(None, capacity=100000)
+    for df in pages:
+        df = seen.drop_seen(df, record=True)
+        if rpid_index is not None:
+            df = rpid_index.drop_seen(df, record=True, bvid=bvid)
+        yield df
+
+
+def get_video_comments(bvid, cookie="", max_pages=50, sort_mode=0, pagination="cursor", sink=None,
+                       rpid_index=None):
+    """
+    获取视频评论
+    :param bvid: BV号
+    :param cookie: B站Cookie
+    :param max_pages: 最大页数（仅页码翻页时生效）
+    :param sort_mode: 排序模式 (0=按热度, 2=按时间)
+    :param pagination: 翻页方式 ("cursor"=游标翻页，可获取全部评论；"page"=页码翻页)
+    :param sink: comment_sinks 中的流式写出对象；提供时每页评论直接写入 sink，返回空DataFrame
+    :param rpid_index: 全局评论ID索引，提供时跳过以前已写出过的评论（本次抓取内的重复评论总会被去掉）
+    :return: DataFrame
+    """
+    print(f"开始获取视频 {bvid} 的评论...")
+    
+    # 获取视频信息
+    aid, video_title = get_bvid_info(bvid, cookie)
+    if not aid:
+        print("无法获取视频信息")
+        return pd.DataFrame()
+        
+    print(f"视频标题: {video_title}")
     
+    if pagination == "cursor":
+        pages = get_video_comments_by_cursor(aid, bvid, cookie, sort_mode)
+    else:
+        pages = get_video_comments_by_page(aid, bvid, cookie, max_pages, sort_mode)
+    pages = _drop_duplicate_pages(pages, bvid, rpid_index)
+
+    if sink is not None:
+        for df in pages:
+            sink.write(df)
+        print(f"总共获取到 {sink.rows} 条评论，已写入 {sink.path}")
+        return pd.DataFrame()
+
+    all_comments = list(pages)
     if all_comments:
         # 合并所有评论数据
         combined_df = pd.concat(all_comments, ignore_index=True)
@@ -304,6 +341,11 @@ def main():
     # 爬取评论
     result = crawl_comments(bvid)
     
+    get_rate_limiter().print_report()
+    if get_cookie_pool() is not None:
+        get_cookie_pool().print_report()
+    get_metrics().finish_run("auto_comments_crawler")
+
     if result:
         print(f"\n评论数据已保存至: {result}")
     else:
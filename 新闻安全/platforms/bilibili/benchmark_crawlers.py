@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫吞吐量基准测试
+功能：启动本地模拟B站API服务器（mock_bilibili_server.py），让 comments_crawler（异步引擎）、
+auto_comments_crawler 和 danmu_crawler 分别抓取相同规模的模拟视频，统计每秒请求数和每秒解析行数。
+修改并发、限速或解析逻辑后运行一次，对比结果即可判断是否变快。
+使用方法: python benchmark_crawlers.py [视频数]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# 添加当前目录到Python路径，以便导入各个爬虫
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bilibili_server import MockBilibiliServer
+
+
+def _bench_async_engine(bvids, pagination):
+    """comments_crawler.main 使用的异步引擎"""
+    from async_comments_crawler import AsyncCommentCrawler
+
+    async def run():
+        async with AsyncCommentCrawler(pagination=pagination, sort_mode=2, max_pages=None,
+                                       expand_replies=True) as crawler:
+            return await asyncio.gather(*(crawler.crawl_video(bvid) for bvid in bvids))
+
+    return sum(result["rows"] for result in asyncio.run(run()))
+
+
+def _bench_auto_crawler(bvids, pagination):
+    """auto_comments_crawler 的同步逐页抓取"""
+    from auto_comments_crawler import get_video_comments
+
+    rows = 0
+    for bvid in bvids:
+        rows += len(get_video_comments(bvid, max_pages=1000, sort_mode=2, pagination=pagination))
+    return rows
+
+
+def _bench_danmu_crawler(bvids, mode="xml"):
+    """danmu_crawler 在共享会话上并发获取CID和弹幕"""
+    from danmu_crawler import DANMU_CONCURRENCY, create_session, fetch_video_danmu
+
+    async def run():
+        semaphore = asyncio.Semaphore(DANMU_CONCURRENCY)
+        async with create_session() as session:
+            async def fetch(bvid):
+                async with semaphore:
+                    parts_data = await fetch_video_danmu(bvid, session, mode)
+                    return sum(len(danmu_data) for _, danmu_data in parts_data)
+
+            return sum(await asyncio.gather(*(fetch(bvid) for bvid in bvids)))
+
+    return asyncio.run(run())
+
+
+BENCHMARKS = [
+    ("comments_crawler 异步引擎 (游标)", lambda bvids: _bench_async_engine(bvids, "cursor")),
+    ("comments_crawler 异步引擎 (页码)", lambda bvids: _bench_async_engine(bvids, "page")),
+    ("auto_comments_crawler (游标)", lambda bvids: _bench_auto_crawler(bvids, "cursor")),
+    ("auto_comments_crawler (页码)", lambda bvids: _bench_auto_crawler(bvids, "page")),
+    ("danmu_crawler (XML)", lambda bvids: _bench_danmu_crawler(bvids, "xml")),
+    ("danmu_crawler (分段protobuf)", lambda bvids: _bench_danmu_crawler(bvids, "seg")),
+]
+
+
+def run_benchmarks(server, video_count=5, unlimited_rate=True):
+    """
+    依次运行各个基准
+    :param server: 已启动的 MockBilibiliServer
+    :param video_count: 每个基准抓取的视频数
+    :param unlimited_rate: 是否放开共享限速器（只测爬虫本身的吞吐量）；
+                           False 时使用默认限速，结果接近真实抓取速度
+    :return: [{'name', 'seconds', 'requests', 'errors', 'rows', 'requests_per_second', 'rows_per_second'}]
+    """
+    # 爬虫在导入时读取 API 地址
+    os.environ["BILI_API_BASE"] = server.base_url
+
+    from rate_limiter import get_rate_limiter
+    if unlimited_rate:
+        get_rate_limiter().bucket_options.update(rate=10000.0, capacity=10000, max_rate=10000.0)
+
+    results = []
+    for index, (name, bench) in enumerate(BENCHMARKS):
+        # 每个基准使用不同的BV号，避免视频元数据缓存影响请求数
+        bvids = [f"BVbench{index}x{i:04d}" for i in range(video_count)]
+        server.reset_stats()
+        print(f"\n>>> 运行基准: {name}")
+        start = time.perf_counter()
+        try:
+            rows = bench(bvids)
+        except Exception as e:
+            print(f"基准 {name} 运行失败: {e}")
+            continue
+        seconds = time.perf_counter() - start
+
+        requests_count = sum(server.requests.values())
+        results.append({
+            "name": name,
+            "seconds": round(seconds, 3),
+            "requests": requests_count,
+            "errors": sum(server.errors.values()),
+            "rows": rows,
+            "requests_per_second": round(requests_count / seconds, 1),
+            "rows_per_second": round(rows / seconds, 1),
+        })
+    return results
+
+
+def print_results(results):
+    print("\n" + "=" * 90)
+    print(f"{'基准':<36}{'耗时(秒)':>10}{'请求数':>8}{'风控':>6}{'行数':>9}{'请求/秒':>10}{'行/秒':>10}")
+    print("-" * 90)
+    for item in results:
+        print(f"{item['name']:<36}{item['seconds']:>10.2f}{item['requests']:>8}{item['errors']:>6}"
+              f"{item['rows']:>9}{item['requests_per_second']:>10.1f}{item['rows_per_second']:>10.1f}")
+    print("=" * 90)
+
+
+def main():
+    """主函数"""
+    video_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    latency = 0.02  # 模拟网络延迟（秒）
+    error_rate = 0.0  # 返回 -412 风控错误的比例，用于测试重试和降速
+    comments_per_video = 500  # 每个模拟视频的主评论数
+    unlimited_rate = True  # 放开限速，只测爬虫本身的吞吐量
+
+    print("=" * 60)
+    print("B站爬虫吞吐量基准测试")
+    print("=" * 60)
+    print(f"视频数: {video_count}, 延迟: {latency * 1000:.0f} 毫秒, 风控比例: {error_rate:.0%}, "
+          f"每个视频主评论数: {comments_per_video}")
+
+    server = MockBilibiliServer(port=0, latency=latency, error_rate=error_rate,
+                                comments_per_video=comments_per_video)
+    # 缓存、检查点等文件写入临时目录，不影响正式数据
+    work_dir = tempfile.mkdtemp(prefix="bili_bench_")
+    original_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with server:
+            results = run_benchmarks(server, video_count, unlimited_rate)
+    finally:
+        os.chdir(original_dir)
+
+    print_results(results)
+    print(f"临时文件目录: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
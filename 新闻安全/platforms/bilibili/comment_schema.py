@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评论数据统一格式与解析
+功能：把B站评论接口返回的 replies 列表一次遍历解析为列式的 DataFrame，
+所有评论爬虫共用同一套列和类型：评论ID/父评论ID/用户ID/点赞数/回复数为 int64，
+评论时间为 datetime64（本机时区），层级和评论类型为分类类型。
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from crawler_metrics import get_metrics
+
+LEVEL_CATEGORIES = ["主评论", "子评论"]
+TYPE_CATEGORIES = ["置顶", "普通", "回复"]
+
+# 列名与类型；主评论的父评论ID为0
+COMMENT_SCHEMA = {
+    "评论ID": "int64",
+    "父评论ID": "int64",
+    "用户ID": "int64",
+    "用户名": "object",
+    "性别": "object",
+    "用户等级": "int64",
+    "评论内容": "object",
+    "点赞数": "int64",
+    "回复数": "int64",
+    "评论时间": "datetime64[ns]",
+    "层级": pd.CategoricalDtype(LEVEL_CATEGORIES),
+    "评论类型": pd.CategoricalDtype(TYPE_CATEGORIES),
+}
+COMMENT_COLUMNS = list(COMMENT_SCHEMA)
+
+# 时区偏移只会在整刻钟变化（夏令时切换都在整点或半点），同一刻钟内的时间戳只需查询一次偏移
+_OFFSET_BUCKET = 900
+
+
+def empty_comments():
+    """空的评论DataFrame（含全部列和类型）"""
+    return pd.DataFrame({
+        column: pd.Series(dtype=dtype) for column, dtype in COMMENT_SCHEMA.items()
+    })
+
+
+def to_local_datetime(timestamps, unit="s"):
+    """
+    把Unix时间戳整列转换为本机时区的本地时间，与逐条调用 datetime.fromtimestamp 一致；
+    每个时间戳按它所在时刻的UTC偏移换算，夏令时前后的时间不会差一小时
+    :param timestamps: 整数时间戳序列
+    :param unit: 时间戳单位 s / ms
+    :return: datetime64[unit] 数组
+    """
+    values = np.asarray(timestamps, dtype=np.int64)
+    per_second = {"s": 1, "ms": 1000}[unit]
+    buckets, inverse = np.unique(values // (_OFFSET_BUCKET * per_second), return_inverse=True)
+    offsets = np.fromiter((time.localtime(int(bucket) * _OFFSET_BUCKET).tm_gmtoff for bucket in buckets),
+                          dtype=np.int64, count=len(buckets))
+    return (values + offsets[inverse.reshape(-1)] * per_second).astype(f"datetime64[{unit}]")
+
+
+def parse_replies(replies, root_rpid=None, top=False):
+    """
+    解析一页评论
+    :param replies: 接口返回的评论对象列表（data.replies、data.upper.top 或 /x/v2/reply/reply 的回复）
+    :param root_rpid: 为 None 时 replies 是主评论，其内嵌的预览回复一并解析；
+                      否则 replies 都是该主评论下的回复
+    :param top: replies 是否为置顶评论
+    :return: 统一格式的评论DataFrame
+    """
+    rpid, parent, mid, uname, sex, level_num = [], [], [], [], [], []
+    message, like, rcount, ctime, level, kind = [], [], [], [], [], []
+
+    def append(reply, parent_rpid, level_code, type_code):
+        member = reply.get("member") or {}
+        rpid.append(reply.get("rpid", 0))
+        parent.append(parent_rpid)
+        mid.append(int(member.get("mid") or 0))
+        uname.append(member.get("uname", ""))
+        sex.append(member.get("sex", ""))
+        level_num.append((member.get("level_info") or {}).get("current_level", 0))
+        message.append((reply.get("content") or {}).get("message", ""))
+        like.append(reply.get("like", 0))
+        rcount.append(reply.get("rcount", 0) if level_code == 0 else 0)
+        ctime.append(reply.get("ctime", 0))
+        level.append(level_code)
+        kind.append(type_code)
+
+    for reply in replies or []:
+        if root_rpid is not None:
+            append(reply, root_rpid, 1, 2)
+            continue
+        append(reply, 0, 0, 0 if top else 1)
+        for sub_reply in reply.get("replies") or []:
+            append(sub_reply, reply.get("rpid", 0), 1, 2)
+
+    if not rpid:
+        return empty_comments()
+
+    get_metrics().record_rows(len(rpid), "comments")
+    return pd.DataFrame({
+        "评论ID": np.asarray(rpid, dtype=np.int64),
+        "父评论ID": np.asarray(parent, dtype=np.int64),
+        "用户ID": np.asarray(mid, dtype=np.int64),
+        "用户名": uname,
+        "性别": sex,
+        "用户等级": np.asarray(level_num, dtype=np.int64),
+        "评论内容": message,
+        "点赞数": np.asarray(like, dtype=np.int64),
+        "回复数": np.asarray(rcount, dtype=np.int64),
+        "评论时间": to_local_datetime(ctime).astype("datetime64[ns]"),
+        "层级": pd.Categorical.from_codes(level, dtype=COMMENT_SCHEMA["层级"]),
+        "评论类型": pd.Categorical.from_codes(kind, dtype=COMMENT_SCHEMA["评论类型"]),
+    })
+
+
+def to_canonical(df):
+    """
+    把从检查点、CSV、JSONL、SQLite 等读回的评论数据恢复为统一的列和类型
+    缺少的列补默认值，多出的列保留在末尾
+    """
+    if df.empty and not len(df.columns):
+        return empty_comments()
+
+    df = df.copy()
+    for column, dtype in COMMENT_SCHEMA.items():
+        if column not in df.columns:
+            df[column] = pd.Series(dtype=dtype) if df.empty else _default(dtype)
+        if dtype == "int64":
+            df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0).astype("int64")
+        elif dtype == "datetime64[ns]":
+            df[column] = _parse_datetime(df[column])
+        elif dtype == "object":
+            df[column] = df[column].fillna("").astype(str)
+        else:
+            df[column] = df[column].astype(dtype)
+
+    extra = [column for column in df.columns if column not in COMMENT_SCHEMA]
+    return df[COMMENT_COLUMNS + extra]
+
+
+def _default(dtype):
+    if dtype == "int64":
+        return 0
+    if dtype == "object":
+        return ""
+    return None
+
+
+def _parse_datetime(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_numeric_dtype(values):
+        # JSON 序列化后的时间为毫秒时间戳
+        return pd.to_datetime(values, unit="ms")
+    return pd.to_datetime(values, errors="coerce")
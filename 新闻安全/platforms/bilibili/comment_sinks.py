@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评论数据流式写出
+功能：爬虫每解析完一页评论就交给 sink 追加写盘，内存占用与评论总数无关。
+支持 CSV、JSONL、Parquet（需要 pyarrow）和 SQLite 四种格式，
+写完后可通过 iter_batches 分批读回，用于排序和汇总。
+"""
+
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+
+class CommentSink:
+    """评论流式写出的基类"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, df):
+        """追加一批评论"""
+        if df is None or df.empty:
+            return
+        self._write(df)
+        self.rows += len(df)
+
+    def _write(self, df):
+        raise NotImplementedError
+
+    def iter_batches(self, batch_size=50000):
+        """分批读回已写出的评论"""
+        raise NotImplementedError
+
+    def read(self):
+        """读回全部评论（会把所有数据载入内存）"""
+        batches = list(self.iter_batches())
+        return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CsvSink(CommentSink):
+    """追加写出 CSV（utf-8-sig，可直接用 Excel 打开）"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(path, "w", newline="", encoding="utf-8-sig")
+        self._columns = None
+
+    def _write(self, df):
+        if self._columns is None:
+            self._columns = list(df.columns)
+            df.to_csv(self._file, index=False)
+        else:
+            df.reindex(columns=self._columns).to_csv(self._file, index=False, header=False)
+
+    def iter_batches(self, batch_size=50000):
+        self.flush()
+        if self.rows == 0:
+            return
+        yield from pd.read_csv(self.path, encoding="utf-8-sig", chunksize=batch_size)
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class JsonlSink(CommentSink):
+    """追加写出 JSON Lines，每行一条评论"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def _write(self, df):
+        for row in json.loads(df.to_json(orient="records", force_ascii=False, date_format="iso")):
+            self._file.write(json.dumps(row, ensure_ascii=False))
+            self._file.write("\n")
+
+    def iter_batches(self, batch_size=50000):
+        self.flush()
+        if self.rows == 0:
+            return
+        yield from pd.read_json(self.path, lines=True, chunksize=batch_size, dtype=False)
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class ParquetSink(CommentSink):
+    """
+    追加写出 Parquet，每批评论写成一个 row group
+    列类型以第一批为准：文本列统一存为字符串，数值列在后续批次中按数值转换
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ImportError("写出Parquet需要安装 pyarrow: pip install pyarrow")
+        super().__init__(path)
+        self._writer = None
+        self._schema = None
+
+    def _to_table(self, df):
+        import pyarrow as pa
+
+        df = df.copy()
+        if self._schema is None:
+            for column in df.columns:
+                if df[column].dtype == object:
+                    df[column] = df[column].astype(str)
+            return pa.Table.from_pandas(df, preserve_index=False)
+
+        df = df.reindex(columns=self._schema.names)
+        for field in self._schema:
+            if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+                df[field.name] = df[field.name].astype(str)
+            elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+                df[field.name] = pd.to_numeric(df[field.name], errors="coerce")
+        return pa.Table.from_pandas(df, preserve_index=False).cast(self._schema, safe=False)
+
+    def _write(self, df):
+        import pyarrow.parquet as pq
+
+        table = self._to_table(df)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        self._writer.write_table(table)
+
+    def iter_batches(self, batch_size=50000):
+        import pyarrow.parquet as pq
+
+        self.close()
+        if self.rows == 0:
+            return
+        for batch in pq.ParquetFile(self.path).iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class SqliteSink(CommentSink):
+    """追加写入 SQLite 表"""
+
+    def __init__(self, path, table="comments"):
+        super().__init__(path)
+        self.table = table
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+    def _write(self, df):
+        with self.conn:
+            df.to_sql(self.table, self.conn, if_exists="append", index=False)
+
+    def iter_batches(self, batch_size=50000, order_by=None):
+        """
+        :param order_by: 可选的排序列名（降序），排序在 SQLite 中完成
+        """
+        if self.rows == 0:
+            return
+        query = f'SELECT * FROM "{self.table}"'
+        if order_by:
+            query += f' ORDER BY "{order_by}" DESC'
+        yield from pd.read_sql_query(query, self.conn, chunksize=batch_size)
+
+    def close(self):
+        self.conn.close()
+
+
+SINK_TYPES = {
+    "csv": CsvSink,
+    "jsonl": JsonlSink,
+    "parquet": ParquetSink,
+    "sqlite": SqliteSink,
+}
+
+SINK_EXTENSIONS = {
+    "csv": ".csv",
+    "jsonl": ".jsonl",
+    "parquet": ".parquet",
+    "sqlite": ".db",
+}
+
+
+def open_sink(path, output_format=None):
+    """
+    按格式创建 sink
+    :param path: 输出文件路径
+    :param output_format: csv / jsonl / parquet / sqlite，不指定时按扩展名判断
+    """
+    if output_format is None:
+        ext = os.path.splitext(path)[1].lower()
+        output_format = {v: k for k, v in SINK_EXTENSIONS.items()}.get(ext, ext.lstrip("."))
+        if ext == ".sqlite":
+            output_format = "sqlite"
+
+    if output_format not in SINK_TYPES:
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    return SINK_TYPES[output_format](path)
@@ -2,7 +2,6 @@ import requests
 import json
 import time
 import pandas as pd
-from datetime import datetime
 import os
 import sys
 import traceback
@@ -11,6 +10,16 @@ from openpyxl.utils import get_column_letter
 import random
 import re
 
+from comment_schema import empty_comments, parse_replies, to_canonical
+from cookie_pool import get_cookie_pool
+from crawler_metrics import get_metrics
+from rate_limiter import get_rate_limiter
+from response_archive import enable_archive, get_response_archive
+from video_cache import get_video_cache
+
+# B站API地址，可通过环境变量 BILI_API_BASE 指向本地模拟服务器（见 mock_bilibili_server.py）
+API_BASE = os.environ.get("BILI_API_BASE", "https://api.bilibili.com").rstrip("/")
+
 # 用户代理列表，用于随机选择
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -63,20 +72,59 @@ def get_random_headers(bvid, cookie):
     return headers
 
 
+def request_json(url, params, headers, timeout=20, bvid=None):
+    """
+    经共享限速器发起GET请求并返回JSON，同时把响应结果反馈给限速器
+    配置了多账号Cookie池（cookie_pool）时，每次请求从池中选择一个账号的Cookie
+    开启了原始响应归档（response_archive.enable_archive）时，响应同时写入归档
+    :param bvid: 请求所属的视频，用于归档分区
+    """
+    rate_limiter = get_rate_limiter()
+    rate_limiter.acquire(url)
+
+    pool = get_cookie_pool()
+    account = None
+    if pool is not None:
+        account = pool.acquire()
+        headers = dict(headers, Cookie=account.cookie)
+
+    metrics = get_metrics()
+    start = time.perf_counter()
+    response = requests.get(url, params=params, headers=headers, timeout=timeout)
+    if response.status_code != 200:
+        metrics.observe_request(url, time.perf_counter() - start, response.status_code, None, len(response.content))
+        rate_limiter.feedback(url, response.status_code, None)
+        if pool is not None:
+            pool.feedback(account, response.status_code, None)
+        response.raise_for_status()
+
+    data = response.json()
+    metrics.observe_request(url, time.perf_counter() - start, response.status_code, data.get('code'),
+                            len(response.content))
+    rate_limiter.feedback(url, response.status_code, data.get('code'))
+    if pool is not None:
+        pool.feedback(account, response.status_code, data.get('code'))
+
+    archive = get_response_archive()
+    if archive is not None:
+        archive.record(url, bvid, params, data)
+    return data
+
+
 def get_bvid_info(bvid: str, cookie: str):
     """获取视频基本信息（含aid和标题）"""
-    url = f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}"
+    url = f"{API_BASE}/x/web-interface/view?bvid={bvid}"
     try:
         print(f"正在获取视频信息: BV号 {bvid}...")
-        response = requests.get(url, headers=get_random_headers(bvid, cookie), timeout=15)
-        response.raise_for_status()
+        cache = get_video_cache()
+        video_info = cache.get(bvid)
+        if video_info is None:
+            data = request_json(url, None, get_random_headers(bvid, cookie), timeout=15, bvid=bvid)
+            if data.get('code') != 0:
+                print(f"API返回错误: {data.get('message')}")
+                return None, None
+            video_info = cache.put(bvid, data['data'])
 
-        data = response.json()
-        if data.get('code') != 0:
-            print(f"API返回错误: {data.get('message')}")
-            return None, None
-
-        video_info = data['data']
         aid = video_info['aid']
         title = video_info['title']
         print(f"视频标题: {title}")
@@ -87,49 +135,79 @@ def get_bvid_info(bvid: str, cookie: str):
         return None, None
 
 
-def get_top_comments(aid: int, bvid: str, cookie: str):
-    """获取置顶评论"""
-    url = "https://api.bilibili.com/x/v2/reply/main"
+def main_comments_params(aid: int, offset="", mode=3):
+    """构造游标API的请求参数"""
     params = {
-        "next": 0,  # 第一页
         "type": 1,  # 1=视频
         "oid": aid,  # 视频aid
-        "mode": 3  # 3=热评模式
+        "mode": mode  # 3=热度，2=时间
     }
+    if isinstance(offset, int):
+        params["next"] = offset  # 旧版数字游标
+    else:
+        params["pagination_str"] = json.dumps({"offset": offset})
+    return params
+
+
+def get_main_comments(aid: int, bvid: str, cookie: str, offset="", mode=3):
+    """
+    使用游标API获取一页评论 (/x/v2/reply/main)
+    :param offset: 上一页返回的游标（字符串或旧版数字游标），空字符串表示第一页
+    :param mode: 3=按热度排序，2=按时间排序
+    :return: API返回数据，失败时返回 None
+    """
+    url = f"{API_BASE}/x/v2/reply/main"
+    params = main_comments_params(aid, offset, mode)
+    headers = get_random_headers(bvid, cookie)
+    data = request_json(url, params, headers, bvid=bvid)
+
+    if data.get('code') != 0:
+        print(f"API返回错误: {data.get('message')} (代码: {data.get('code')})")
+        return None
 
-    try:
-        print("正在获取置顶评论...")
-        headers = get_random_headers(bvid, cookie)
+    return data
 
-        response = requests.get(
-            url,
-            params=params,
-            headers=headers,
-            timeout=20
-        )
-        response.raise_for_status()
 
-        data = response.json()
+def get_next_offset(data: dict):
+    """
+    从游标API返回数据中取出下一页游标
+    :return: 下一页游标，已到末页时返回 None
+    """
+    cursor = data['data'].get('cursor', {})
+    if cursor.get('is_end'):
+        return None
+
+    next_offset = cursor.get('pagination_reply', {}).get('next_offset')
+    if next_offset:
+        return next_offset
+    return cursor.get('next') or None
 
-        if data.get('code') != 0:
-            print(f"获取置顶评论失败: {data.get('message')}")
-            return []
 
-        # 获取置顶评论
-        top_comments = []
-        if 'upper' in data['data'] and data['data']['upper']:
-            top_comment = data['data']['upper']
-            top_comments.append(top_comment)
+def get_top_comments(aid: int, bvid: str, cookie: str):
+    """获取置顶评论"""
+    try:
+        print("正在获取置顶评论...")
+        data = get_main_comments(aid, bvid, cookie)
+        if data is None:
+            return []
 
-        return top_comments
+        return extract_top_comments(data)
     except Exception as e:
         print(f"获取置顶评论失败: {str(e)}")
         return []
 
 
+def extract_top_comments(data: dict):
+    """从游标API第一页数据中提取置顶评论"""
+    upper = data['data'].get('upper') or {}
+    if upper.get('top'):
+        return [upper['top']]
+    return []
+
+
 def get_comments(aid: int, bvid: str, cookie: str, page=1, sort_mode=0):
     """使用标准API获取评论"""
-    url = "https://api.bilibili.com/x/v2/reply"
+    url = f"{API_BASE}/x/v2/reply"
     params = {
         "pn": page,  # 页码
         "type": 1,  # 1=视频
@@ -141,16 +219,7 @@ def get_comments(aid: int, bvid: str, cookie: str, page=1, sort_mode=0):
         sort_name = "热度" if sort_mode == 0 else "时间"
         print(f"正在获取第 {page} 页评论 (按{sort_name}排序)...")
         headers = get_random_headers(bvid, cookie)
-
-        response = requests.get(
-            url,
-            params=params,
-            headers=headers,
-            timeout=20
-        )
-        response.raise_for_status()
-
-        data = response.json()
+        data = request_json(url, params, headers, bvid=bvid)
 
         if data.get('code') != 0:
             print(f"API返回错误: {data.get('message')} (代码: {data.get('code')})")
@@ -164,97 +233,49 @@ def get_comments(aid: int, bvid: str, cookie: str, page=1, sort_mode=0):
         return None, 0
 
 
-def format_time(timestamp):
-    """将时间戳转换为可读格式"""
-    try:
-        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-    except:
-        return "时间解析错误"
+def parse_sub_replies_to_dataframe(replies: list, root_rpid):
+    """将 /x/v2/reply/reply 返回的楼中楼回复解析为DataFrame格式"""
+    return parse_replies(replies, root_rpid=root_rpid)
 
 
 def parse_comments_to_dataframe(data: dict, is_top=False):
-    """将评论数据解析为DataFrame格式"""
-    excel_data = []
+    """
+    将评论数据解析为DataFrame格式（统一格式见 comment_schema）
+    :param data: API返回数据；is_top=True 时为置顶评论列表
+    """
+    # 处理置顶评论
+    if is_top:
+        return parse_replies(data, top=True)
 
     # 检查API返回数据是否有效
     if not data or 'data' not in data:
         print("API返回数据格式无效")
-        return pd.DataFrame()
-
-    # 处理置顶评论
-    if is_top:
-        for reply in data:
-            main_comment = {
-                "评论ID": reply['rpid'],
-                "父评论ID": "置顶评论",
-                "用户名": reply['member']['uname'],
-                "评论内容": reply['content']['message'],
-                "点赞数": reply['like'],
-                "评论时间": format_time(reply['ctime']),
-                "层级": "主评论",
-                "回复数": reply['rcount'] if 'rcount' in reply else 0,
-                "评论类型": "置顶"
-            }
-            excel_data.append(main_comment)
-        return pd.DataFrame(excel_data)
+        return empty_comments()
 
     # 检查是否有评论数据
     if 'replies' not in data['data']:
         print("API返回数据中缺少'replies'字段")
-        return pd.DataFrame()
+        return empty_comments()
 
     replies = data['data']['replies']
     if not replies:
         print("本页没有评论数据 (replies为空)")
-        return pd.DataFrame()
-
-    print(f"本页找到 {len(replies)} 条主评论")
-
-    total_sub_replies = 0
-    for reply in replies:
-        # 主评论
-        main_comment = {
-            "评论ID": reply['rpid'],
-            "父评论ID": "主评论",
-            "用户名": reply['member']['uname'],
-            "评论内容": reply['content']['message'],
-            "点赞数": reply['like'],
-            "评论时间": format_time(reply['ctime']),
-            "层级": "主评论",
-            "回复数": reply['rcount'] if 'rcount' in reply else 0,
-            "评论类型": "普通"
-        }
-        excel_data.append(main_comment)
-
-        # 子评论
-        if 'replies' in reply and reply['replies']:
-            total_sub_replies += len(reply['replies'])
-            for sub_reply in reply['replies']:
-                sub_comment = {
-                    "评论ID": sub_reply['rpid'],
-                    "父评论ID": reply['rpid'],
-                    "用户名": sub_reply['member']['uname'],
-                    "评论内容": sub_reply['content']['message'],
-                    "点赞数": sub_reply['like'],
-                    "评论时间": format_time(sub_reply['ctime']),
-                    "层级": "子评论",
-                    "回复数": "",
-                    "评论类型": "回复"
-                }
-                excel_data.append(sub_comment)
-
-    print(f"本页找到 {total_sub_replies} 条子评论")
-    return pd.DataFrame(excel_data)
-
-
-def save_to_excel(df, bvid, video_title):
+        return empty_comments()
+
+    df = parse_replies(replies)
+    main_count = len(replies)
+    print(f"本页找到 {main_count} 条主评论")
+    print(f"本页找到 {len(df) - main_count} 条子评论")
+    return df
+
+
+def save_to_excel(df, bvid, video_title, output_dir="B站评论数据"):
     """保存DataFrame到Excel文件"""
     if df.empty:
         print("没有数据可保存")
         return None
 
     # 创建输出目录
-    output_dir = "B站评论数据"
     os.makedirs(output_dir, exist_ok=True)
 
     # 清理文件名中的非法字符
@@ -281,10 +302,13 @@ def save_to_excel(df, bvid, video_title):
             column_widths = {
                 '评论ID': 12,
                 '父评论ID': 12,
+                '用户ID': 12,
                 '用户名': 15,
+                '性别': 6,
+                '用户等级': 8,
                 '评论内容': 50,
                 '点赞数': 10,
-                '评论时间': 18,
+                '评论时间': 20,
                 '层级': 8,
                 '回复数': 8,
                 '评论类型': 8
@@ -311,33 +335,52 @@ def save_to_excel(df, bvid, video_title):
 
 
 def print_summary(df, total_comments):
-    """打印数据摘要"""
-    if df.empty:
+    """
+    打印数据摘要
+    :param df: 评论DataFrame，或按批产出DataFrame的可迭代对象（例如 sink.iter_batches()），
+               按批统计时内存占用与评论总数无关
+    """
+    batches = [df] if isinstance(df, pd.DataFrame) else df
+
+    count = main_count = top_count = 0
+    top_likes = None
+    min_time = max_time = None
+    for batch in batches:
+        if batch.empty:
+            continue
+        count += len(batch)
+        main_count += int((batch['层级'] == '主评论').sum())
+        top_count += int((batch['评论类型'] == '置顶').sum())
+
+        # 点赞最多的前20条评论：每批只保留候选的前20条
+        candidates = batch.nlargest(20, '点赞数')
+        if top_likes is not None:
+            candidates = pd.concat([top_likes, candidates]).nlargest(20, '点赞数')
+        top_likes = candidates
+
+        if '评论时间' in batch.columns:
+            batch_min, batch_max = batch['评论时间'].min(), batch['评论时间'].max()
+            min_time = batch_min if min_time is None else min(min_time, batch_min)
+            max_time = batch_max if max_time is None else max(max_time, batch_max)
+
+    if count == 0:
         print("没有数据可汇总")
         return
 
-    main_comments = df[df['层级'] == '主评论']
-    top_comments = df[df['评论类型'] == '置顶']
-
     print("\n" + "=" * 60)
     print("数据汇总:")
     print(f"视频总评论数: {total_comments} 条")
-    print(f"实际抓取评论数: {len(df)} 条")
-    print(f"主评论数: {len(main_comments)} 条")
-    print(f"置顶评论数: {len(top_comments)} 条")
-
-    if not df.empty:
-        # 点赞最多的前20条评论
-        top_likes = df.nlargest(20, '点赞数')
-        print("\n点赞最高的评论:")
-        for i, row in top_likes.iterrows():
-            comment_type = "置顶" if row['评论类型'] == '置顶' else "普通"
-            print(f"[{comment_type}] [{row['点赞数']}赞] {row['用户名']}: {row['评论内容'][:50]}...")
+    print(f"实际抓取评论数: {count} 条")
+    print(f"主评论数: {main_count} 条")
+    print(f"置顶评论数: {top_count} 条")
+
+    print("\n点赞最高的评论:")
+    for i, row in top_likes.iterrows():
+        comment_type = "置顶" if row['评论类型'] == '置顶' else "普通"
+        print(f"[{comment_type}] [{row['点赞数']}赞] {row['用户名']}: {str(row['评论内容'])[:50]}...")
 
     # 时间范围
-    if '评论时间' in df.columns and not df['评论时间'].empty:
-        min_time = df['评论时间'].min()
-        max_time = df['评论时间'].max()
+    if min_time is not None:
         print(f"\n评论时间范围: {min_time} 至 {max_time}")
 
 
@@ -347,11 +390,14 @@ def main():
     print("B站视频评论抓取工具 (完整版)")
     print("=" * 60)
 
-    # 获取Cookie
-    cookie = get_bilibili_cookie()
-    if not cookie:
-        print("❌ 未提供Cookie，程序退出")
-        return
+    # 获取Cookie；配置了多账号Cookie池时使用池中的账号
+    if get_cookie_pool() is not None:
+        cookie = ""
+    else:
+        cookie = get_bilibili_cookie()
+        if not cookie:
+            print("❌ 未提供Cookie，程序退出")
+            return
 
     # 配置参数
     bvid = input("请输入要抓取评论的B站视频BV号: ").strip()
@@ -359,78 +405,88 @@ def main():
         print("❌ 未提供BV号，程序退出")
         return
 
-    max_pages = 200  # 抓取更多页数获取完整评论
-    sort_mode = 0  # 0=按热度排序，2=按时间排序
+    pagination = "cursor"  # cursor=游标翻页，可获取全部评论；page=页码翻页，受页数上限限制
+    max_pages = 200  # 页码翻页时的最大页数
+    sort_mode = 2  # 0=按热度排序，2=按时间排序
+    expand_replies = True  # 是否补全每条主评论下的全部回复（楼中楼）
+    incremental = True  # 已抓取过的视频只补抓新增评论（需要按时间排序）
+    output_format = "xlsx"  # xlsx，或流式写出的 csv / jsonl / parquet / sqlite（评论很多时使用）
+    archive_raw = False  # 是否把原始API响应归档到 B站原始数据/，之后可用 replay_archive.py 离线重建
+
+    if archive_raw:
+        enable_archive()
 
     print(f"\n目标视频: https://www.bilibili.com/video/{bvid}")
-    print(f"抓取页数: {max_pages}")
+    if pagination == "cursor":
+        print("翻页方式: 游标翻页 (抓取全部评论)")
+    else:
+        print(f"抓取页数: {max_pages}")
     print(f"排序方式: {'热度' if sort_mode == 0 else '时间'}")
 
-    # 获取视频ID和标题
-    aid, video_title = get_bvid_info(bvid, cookie)
-    if not aid:
-        print("无法获取视频信息，请检查BV号或网络连接")
-        return
+    # 抓取评论数据：置顶评论、各页评论和楼中楼回复
+    # 页码翻页时，第1页确定总页数后其余页面并发抓取并按页码顺序汇总；
+    # 每页评论和翻页进度写入检查点，中断后重新运行会从上次停下的位置继续
+    from async_comments_crawler import crawl_video_comments
+    from comment_sinks import SINK_EXTENSIONS, open_sink
+    from crawl_checkpoint import CrawlCheckpoint
+    from rpid_index import get_rpid_index
+
+    collected = 0
+    crawl_start = time.time()
+
+    def on_page(page, page_df, page_total):
+        nonlocal collected
+        if collected == 0 and page_total > 0:
+            print(f"视频总评论数: {page_total} 条")
+
+        collected += len(page_df)
+        expected = page_total if pagination == "cursor" else min(page_total, max_pages * 20)
+        progress = min(100, collected / max(1, expected) * 100)
+        elapsed = time.time() - crawl_start
+        print(f"第 {page} 页处理完成, 获取 {len(page_df)} 条评论, 本次进度: {progress:.1f}%, 累计耗时 {elapsed:.2f} 秒")
+
+    # 非xlsx格式时评论逐页写入文件，不在内存中汇总
+    sink = None
+    if output_format != "xlsx":
+        sink_path = os.path.join("B站评论数据", f"【{bvid}】完整评论{SINK_EXTENSIONS[output_format]}")
+        sink = open_sink(sink_path, output_format)
 
-    # 抓取评论数据
     all_comments_df = pd.DataFrame()
     total_comments = 0
-
-    # 1. 获取置顶评论
-    top_comments = get_top_comments(aid, bvid, cookie)
-    if top_comments:
-        top_df = parse_comments_to_dataframe(top_comments, is_top=True)
-        all_comments_df = pd.concat([all_comments_df, top_df], ignore_index=True)
-        print(f"已获取 {len(top_df)} 条置顶评论")
-
-    # 2. 获取普通评论
-    for page in range(1, max_pages + 1):
+    video_title = None
+    with CrawlCheckpoint() as checkpoint:
         try:
-            start_time = time.time()
-            data, page_total = get_comments(aid, bvid, cookie, page, sort_mode)
-
-            # 记录总评论数
-            if page == 1 and page_total > 0:
-                total_comments = page_total
-                print(f"视频总评论数: {total_comments} 条")
-
-            # 如果API返回错误，停止抓取
-            if data is None:
-                print(f"第 {page} 页获取失败，停止抓取")
-                break
-
-            # 解析评论数据
-            page_df = parse_comments_to_dataframe(data)
-
-            # 如果本页没有数据，停止抓取
-            if page_df.empty:
-                print(f"第 {page} 页无评论数据，停止抓取")
-                break
-
-            all_comments_df = pd.concat([all_comments_df, page_df], ignore_index=True)
-            elapsed = time.time() - start_time
-
-            # 计算进度
-            collected = len(all_comments_df)
-            progress = min(100, collected / min(total_comments, max_pages * 20) * 100)
-            print(f"第 {page} 页处理完成, 获取 {len(page_df)} 条评论, 总进度: {progress:.1f}%, 耗时 {elapsed:.2f} 秒")
-
-            # 随机延迟，避免触发反爬
-            delay = random.uniform(1.5, 3.0)
-            time.sleep(delay)
-
-            # 每10页保存一次进度
-            if page % 10 == 0:
-                print(f"已处理 {page} 页，累计 {collected} 条评论，保存临时进度...")
-                temp_file = f"temp_{bvid}_page_{page}.xlsx"
-                all_comments_df.to_excel(temp_file, index=False)
-                print(f"临时进度已保存至: {temp_file}")
-
+            result = crawl_video_comments(
+                bvid, cookie, on_page=on_page, pagination=pagination,
+                max_pages=max_pages if pagination == "page" else None, sort_mode=sort_mode,
+                expand_replies=expand_replies, checkpoint=checkpoint, incremental=incremental,
+                sink=sink, rpid_index=get_rpid_index()
+            )
+            all_comments_df = result["df"]
+            total_comments = result["total"]
+            video_title = result["title"]
         except Exception as e:
-            print(f"处理第 {page} 页时出错: {str(e)}")
-            # 发生错误时等待更长时间
-            time.sleep(5.0)
-            continue
+            print(f"抓取评论时出错: {str(e)}")
+            print(f"已抓取的进度保存在检查点 {checkpoint.path} 中，重新运行即可继续")
+
+    if sink is not None:
+        sink.flush()
+        if sink.rows == 0:
+            sink.close()
+            print("\n未抓取到任何评论数据")
+            return
+        # 汇总按批读取已写出的文件
+        print_summary((to_canonical(batch) for batch in sink.iter_batches()), total_comments)
+        sink.close()
+        get_rate_limiter().print_report()
+        if get_cookie_pool() is not None:
+            get_cookie_pool().print_report()
+        get_metrics().finish_run("comments_crawler")
+        print("\n" + "=" * 60)
+        print("操作完成!")
+        print(f"{sink.rows} 条评论已保存至: {os.path.abspath(sink.path)}")
+        input("\n按Enter键退出...")
+        return
 
     # 检查是否获取到数据
     if all_comments_df.empty:
@@ -455,6 +511,10 @@ def main():
 
     # 打印摘要信息
     print_summary(all_comments_df, total_comments)
+    get_rate_limiter().print_report()
+    if get_cookie_pool() is not None:
+        get_cookie_pool().print_report()
+    get_metrics().finish_run("comments_crawler")
 
     # 完成提示
     if saved_path:
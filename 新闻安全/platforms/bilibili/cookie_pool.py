@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站多账号Cookie池
+功能：同时使用多个已登录账号发起请求。每个账号有每小时请求配额，
+请求在未被风控、配额未用完的账号间分配（优先本小时配额使用比例最低的账号）；
+账号收到 -412 等风控响应后暂停使用，冷却时间过后自动恢复，连续被风控时冷却时间翻倍。
+账号配置写在 新闻安全/bili_cookies.json（或环境变量 BILI_COOKIE_POOL 指定的文件）中：
+    {
+        "cooldown": 600,
+        "accounts": [
+            {"name": "账号1", "cookie": "SESSDATA=xxx; bili_jct=xxx", "quota_per_hour": 600},
+            {"name": "账号2", "cookie": "SESSDATA=yyy; bili_jct=yyy"}
+        ]
+    }
+未配置该文件时各爬虫仍使用 .env 中的 BILI_COOKIE 单个账号。
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from rate_limiter import RISK_CONTROL_CODES, RISK_CONTROL_STATUS
+
+DEFAULT_POOL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "bili_cookies.json"
+)
+# 配额统计窗口（秒）
+QUOTA_WINDOW = 3600
+
+
+class Account:
+    """一个B站账号的Cookie、配额和风控状态"""
+
+    def __init__(self, name, cookie, quota_per_hour=None, cooldown=600.0, max_cooldown=6 * 3600.0):
+        """
+        :param name: 账号名称（只用于显示）
+        :param cookie: 完整的Cookie字符串
+        :param quota_per_hour: 每小时最多请求次数，None表示不限制
+        :param cooldown: 被风控后暂停使用的基础秒数，连续风控时翻倍
+        :param max_cooldown: 暂停秒数上限
+        """
+        self.name = name
+        self.cookie = cookie
+        self.quota_per_hour = quota_per_hour
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.benched_until = 0.0
+        self.consecutive_blocks = 0
+        self.total_requests = 0
+        self.total_blocks = 0
+        self.last_used = 0.0
+        self.recent = deque()
+
+    def _trim(self, now):
+        while self.recent and self.recent[0] <= now - QUOTA_WINDOW:
+            self.recent.popleft()
+
+    def remaining(self, now):
+        """本小时剩余配额，不限制时返回 None"""
+        if self.quota_per_hour is None:
+            return None
+        self._trim(now)
+        return self.quota_per_hour - len(self.recent)
+
+    def available_at(self, now):
+        """账号可以再次使用的时间点"""
+        ready = max(now, self.benched_until)
+        remaining = self.remaining(now)
+        if remaining is not None and remaining <= 0:
+            # 等窗口内最早的一次请求过期
+            ready = max(ready, self.recent[-self.quota_per_hour] + QUOTA_WINDOW)
+        return ready
+
+    def used(self, now):
+        """本小时已发出的请求数"""
+        self._trim(now)
+        return len(self.recent)
+
+    def use(self, now):
+        self._trim(now)
+        self.recent.append(now)
+        self.total_requests += 1
+        self.last_used = now
+
+    def bench(self, now):
+        """被风控：暂停使用，返回暂停秒数"""
+        self.consecutive_blocks += 1
+        self.total_blocks += 1
+        pause = min(self.max_cooldown, self.cooldown * 2 ** (self.consecutive_blocks - 1))
+        self.benched_until = max(self.benched_until, now + pause)
+        return pause
+
+    def on_success(self):
+        self.consecutive_blocks = 0
+
+
+class CookiePool:
+    """多账号Cookie池，同步和异步爬虫共用"""
+
+    def __init__(self, accounts):
+        """
+        :param accounts: Account 列表
+        """
+        if not accounts:
+            raise ValueError("Cookie池中至少需要一个账号")
+        self.accounts = list(accounts)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def _reserve(self):
+        """
+        选择一个可用账号并记一次请求
+        :return: (账号, 需要等待的秒数)；没有可用账号时账号为 None
+        """
+        now = time.time()
+        with self._lock:
+            ready = [a for a in self.accounts if a.available_at(now) <= now]
+            if not ready:
+                return None, min(a.available_at(now) for a in self.accounts) - now
+
+            # 不限配额的账号按池中最大的配额计算使用比例，所有账号都不限时按请求数均分
+            largest = max((a.quota_per_hour for a in self.accounts if a.quota_per_hour), default=1)
+
+            def priority(account):
+                return (account.used(now) / (account.quota_per_hour or largest), account.last_used)
+
+            account = min(ready, key=priority)
+            account.use(now)
+            return account, 0.0
+
+    def acquire(self):
+        """同步获取一个账号，所有账号都在冷却或配额用完时等待"""
+        while True:
+            account, wait = self._reserve()
+            if account is not None:
+                return account
+            print(f"所有账号都在冷却或配额已用完，等待 {wait:.0f} 秒")
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """异步获取一个账号"""
+        while True:
+            account, wait = self._reserve()
+            if account is not None:
+                return account
+            print(f"所有账号都在冷却或配额已用完，等待 {wait:.0f} 秒")
+            await asyncio.sleep(wait)
+
+    def feedback(self, account, status=200, code=0):
+        """
+        根据响应结果更新账号状态
+        :param account: acquire 返回的账号
+        :param status: HTTP状态码
+        :param code: B站API返回的code，非JSON响应时传 None
+        :return: 账号是否被风控
+        """
+        if account is None:
+            return False
+        blocked = status in RISK_CONTROL_STATUS or code in RISK_CONTROL_CODES
+        with self._lock:
+            if blocked:
+                pause = account.bench(time.time())
+            elif status == 200:
+                account.on_success()
+        if blocked:
+            print(f"账号 {account.name} 触发风控 (HTTP {status}, 代码 {code})，暂停使用 {pause:.0f} 秒")
+        return blocked
+
+    def report(self):
+        """
+        各账号状态
+        :return: {账号名称: {'requests', 'blocks', 'remaining', 'benched_for'}}
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                account.name: {
+                    "requests": account.total_requests,
+                    "blocks": account.total_blocks,
+                    "remaining": account.remaining(now),
+                    "benched_for": round(max(0.0, account.benched_until - now), 1),
+                }
+                for account in self.accounts
+            }
+
+    def print_report(self):
+        """打印各账号的请求数、风控次数和剩余配额"""
+        print("\n账号统计:")
+        for name, item in self.report().items():
+            remaining = "不限" if item["remaining"] is None else item["remaining"]
+            state = f", 冷却中 (剩余 {item['benched_for']:.0f} 秒)" if item["benched_for"] else ""
+            print(f"  {name}: 请求 {item['requests']} 次, 风控 {item['blocks']} 次, 本小时剩余配额 {remaining}{state}")
+
+
+def load_cookie_pool(path=DEFAULT_POOL_PATH):
+    """
+    从配置文件读取Cookie池
+    :return: CookiePool 实例，文件不存在或没有有效账号时返回 None
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    if isinstance(config, list):
+        config = {"accounts": config}
+    cooldown = float(config.get("cooldown", 600))
+
+    accounts = []
+    for i, item in enumerate(config.get("accounts") or [], 1):
+        if isinstance(item, str):
+            item = {"cookie": item}
+        cookie = (item.get("cookie") or "").strip()
+        if not cookie:
+            continue
+        accounts.append(Account(
+            name=item.get("name") or f"账号{i}",
+            cookie=cookie,
+            quota_per_hour=item.get("quota_per_hour"),
+            cooldown=float(item.get("cooldown", cooldown)),
+        ))
+
+    if not accounts:
+        print(f"Cookie池配置 {path} 中没有有效账号")
+        return None
+    print(f"已从 {path} 读取 {len(accounts)} 个账号")
+    return CookiePool(accounts)
+
+
+_shared_pool = None
+_pool_loaded = False
+
+
+def get_cookie_pool():
+    """
+    获取进程内共享的Cookie池
+    :return: CookiePool 实例，未配置账号文件时返回 None（此时使用单个Cookie）
+    """
+    global _shared_pool, _pool_loaded
+    if not _pool_loaded:
+        _pool_loaded = True
+        _shared_pool = load_cookie_pool(os.environ.get("BILI_COOKIE_POOL", DEFAULT_POOL_PATH))
+    return _shared_pool
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评论抓取检查点（SQLite）
+功能：按视频记录翻页进度（页码或游标），并在同一事务中追加本页评论，
+程序中断或被风控封禁后可从上次停下的位置继续抓取；
+同时记录每个视频已保存的最新主评论（时间、评论ID），供增量抓取使用
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from comment_schema import to_canonical
+
+DEFAULT_CHECKPOINT_PATH = os.path.join("B站评论数据", "crawl_checkpoint.db")
+
+
+class CrawlCheckpoint:
+    """基于 SQLite 的事务性抓取检查点"""
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        """
+        :param path: 检查点数据库路径
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    bvid TEXT PRIMARY KEY,
+                    aid INTEGER,
+                    title TEXT,
+                    pagination TEXT,
+                    sort_mode INTEGER,
+                    next_page INTEGER NOT NULL DEFAULT 1,
+                    cursor TEXT NOT NULL DEFAULT '',
+                    total INTEGER NOT NULL DEFAULT 0,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    newest_ctime TEXT,
+                    newest_rpid INTEGER,
+                    updated_at REAL
+                )
+            """)
+            # 兼容旧版本创建的检查点数据库
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(videos)")}
+            for column, column_type in (("newest_ctime", "TEXT"), ("newest_rpid", "INTEGER")):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE videos ADD COLUMN {column} {column_type}")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS comments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bvid TEXT NOT NULL,
+                    page INTEGER,
+                    row_json TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_bvid ON comments (bvid)")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_state(self, bvid):
+        """
+        读取视频的抓取进度
+        :return: {'next_page', 'cursor', 'total', 'done', ...}，没有记录时返回 None
+        """
+        row = self.conn.execute(
+            "SELECT aid, title, pagination, sort_mode, next_page, cursor, total, done,"
+            " newest_ctime, newest_rpid FROM videos WHERE bvid = ?",
+            (bvid,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        (aid, title, pagination, sort_mode, next_page, cursor, total, done,
+         newest_ctime, newest_rpid) = row
+        return {
+            "aid": aid,
+            "title": title,
+            "pagination": pagination,
+            "sort_mode": sort_mode,
+            "next_page": next_page,
+            "cursor": cursor,
+            "total": total,
+            "done": bool(done),
+            "newest_ctime": newest_ctime,
+            "newest_rpid": newest_rpid,
+        }
+
+    def start_video(self, bvid, aid, title, pagination, sort_mode):
+        """
+        开始或继续抓取一个视频
+        已有进度但翻页方式或排序方式不同时，旧进度无法复用，会被清空重来
+        :return: 当前进度，格式同 get_state
+        """
+        state = self.get_state(bvid)
+        if state is not None and (state["pagination"] != pagination or state["sort_mode"] != sort_mode):
+            print(f"[{bvid}] 检查点的翻页/排序方式与本次不同，重新开始抓取")
+            self.reset(bvid)
+            state = None
+
+        if state is None:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO videos (bvid, aid, title, pagination, sort_mode, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (bvid, aid, title, pagination, sort_mode, time.time())
+                )
+            state = self.get_state(bvid)
+        return state
+
+    def save_page(self, bvid, page_df, progress):
+        """
+        在同一事务中追加一页评论、更新翻页进度和已保存的最新评论
+        :param page_df: 本页评论数据
+        :param progress: 抓取本页后的进度 {'next_page', 'cursor', 'total'}
+        """
+        with self.conn:
+            self._insert_rows(bvid, page_df, progress["next_page"] - 1)
+            self._update_watermark(bvid, page_df)
+            self.conn.execute(
+                "UPDATE videos SET next_page = ?, cursor = ?, total = ?, updated_at = ? WHERE bvid = ?",
+                (progress["next_page"], str(progress["cursor"]), progress["total"], time.time(), bvid)
+            )
+
+    def _insert_rows(self, bvid, df, page=None):
+        rows = json.loads(df.to_json(orient="records", force_ascii=False, date_format="iso")) if not df.empty else []
+        self.conn.executemany(
+            "INSERT INTO comments (bvid, page, row_json) VALUES (?, ?, ?)",
+            [(bvid, page, json.dumps(row, ensure_ascii=False)) for row in rows]
+        )
+
+    def _update_watermark(self, bvid, df):
+        """用 df 中的主评论更新视频已保存的最新评论时间和评论ID"""
+        if df.empty or '层级' not in df.columns:
+            return
+        roots = df[(df['层级'] == '主评论') & (df['评论类型'] != '置顶')]
+        if roots.empty:
+            return
+
+        newest = roots.sort_values(['评论时间', '评论ID']).iloc[-1]
+        newest_ctime = pd.Timestamp(newest['评论时间']).strftime('%Y-%m-%d %H:%M:%S')
+        self.conn.execute(
+            "UPDATE videos SET"
+            " newest_ctime = CASE WHEN newest_ctime IS NULL OR newest_ctime < ? THEN ? ELSE newest_ctime END,"
+            " newest_rpid = MAX(COALESCE(newest_rpid, 0), ?)"
+            " WHERE bvid = ?",
+            (newest_ctime, newest_ctime, int(newest['评论ID']), bvid)
+        )
+
+    def mark_done(self, bvid):
+        """标记视频抓取完成（最新评论记录已在 save_page 中逐页更新）"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE videos SET done = 1, updated_at = ? WHERE bvid = ?",
+                (time.time(), bvid)
+            )
+
+    def append_comments(self, bvid, df):
+        """增量抓取：追加新评论并推进最新评论记录"""
+        if df.empty:
+            return
+        with self.conn:
+            self._insert_rows(bvid, df)
+            self._update_watermark(bvid, df)
+            self.conn.execute("UPDATE videos SET updated_at = ? WHERE bvid = ?", (time.time(), bvid))
+
+    def iter_comments(self, bvid, batch_size=5000):
+        """按写入顺序分批读取视频已保存的评论，每批为一个DataFrame"""
+        cursor = self.conn.execute(
+            "SELECT row_json FROM comments WHERE bvid = ? ORDER BY id",
+            (bvid,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield to_canonical(pd.DataFrame([json.loads(row[0]) for row in rows]))
+
+    def load_comments(self, bvid):
+        """按写入顺序读取视频已保存的全部评论"""
+        batches = list(self.iter_comments(bvid))
+        return pd.concat(batches, ignore_index=True) if batches else to_canonical(pd.DataFrame())
+
+    def reset(self, bvid):
+        """清空视频的进度和已保存评论"""
+        with self.conn:
+            self.conn.execute("DELETE FROM comments WHERE bvid = ?", (bvid,))
+            self.conn.execute("DELETE FROM videos WHERE bvid = ?", (bvid,))
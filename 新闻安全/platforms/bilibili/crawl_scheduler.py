@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评论抓取任务调度
+功能：读取 bilibili_results_*.csv 中的评论数、播放量，估算每个视频需要的请求数，
+按“每个请求能换来的价值”从高到低排列抓取顺序，并根据当前限速估算总耗时。
+请求数基本和评论数成正比，只按评论数排序时每个请求换来的评论都差不多（约20条），顺序没有意义；
+因此价值中加入播放量，播放量高、请求少的视频排在前面，抓取中途被风控或手动中断时，
+已完成的部分覆盖了大部分观众看到的讨论。
+检查点中已抓取完成的视频只计算增量部分（按CSV中的评论数减去上次抓取时的评论总数）。
+使用方法: python crawl_scheduler.py [bilibili_results_*.csv]
+"""
+
+import math
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径，以便导入限速器和检查点
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from crawl_checkpoint import DEFAULT_CHECKPOINT_PATH, CrawlCheckpoint
+from rate_limiter import get_rate_limiter
+
+# 每个评论请求平均获得的评论数：主评论每页20条（附带少量楼中楼），楼中楼展开每页20条
+COMMENTS_PER_REQUEST = 20
+# 每个视频的固定请求数：视频信息 + 第一页评论
+BASE_REQUESTS = 2
+# 播放量折算为评论数的权重：1万播放相当于50条评论。
+# 权重太小时每请求价值都约等于 COMMENTS_PER_REQUEST，排序退化为随机顺序
+VIEW_WEIGHT = 0.005
+
+
+def parse_count(value):
+    """把 '1.2万'、'3456'、NaN 等统一转换为整数"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    match = re.search(r'(\d+\.?\d*)万', text)
+    if match:
+        return int(float(match.group(1)) * 10000)
+    match = re.search(r'\d+', text.replace(",", ""))
+    return int(match.group(0)) if match else 0
+
+
+def load_jobs(source):
+    """
+    读取抓取任务
+    :param source: bilibili_results_*.csv 路径、DataFrame，或 [{'BV号', '评论数', '播放量', ...}] 列表
+    :return: DataFrame，包含 BV号、标题、评论数、播放量 列，BV号去重
+    """
+    if isinstance(source, str):
+        df = pd.read_csv(source, encoding='utf-8-sig')
+    else:
+        df = pd.DataFrame(source)
+
+    if 'BV号' not in df.columns:
+        print("错误: 任务列表中未找到'BV号'列")
+        return pd.DataFrame(columns=['BV号', '标题', '评论数', '播放量'])
+
+    df = df[df['BV号'].notna()].copy()
+    df['BV号'] = df['BV号'].astype(str).str.strip()
+    df = df[df['BV号'].str.startswith('BV')]
+    df = df.drop_duplicates(subset='BV号').reset_index(drop=True)
+
+    for column in ('评论数', '播放量'):
+        if column in df.columns:
+            df[column] = df[column].apply(parse_count)
+        else:
+            df[column] = 0
+    df['标题'] = df['标题'].fillna('') if '标题' in df.columns else ''
+    return df
+
+
+def estimate_requests(comment_count, max_pages=None):
+    """
+    估算抓取一个视频全部评论需要的请求数
+    :param comment_count: 评论数（含楼中楼）
+    :param max_pages: 主评论最大页数，None表示不限制
+    """
+    pages = math.ceil(max(comment_count, 0) / COMMENTS_PER_REQUEST)
+    if max_pages is not None:
+        pages = min(pages, max_pages)
+    return BASE_REQUESTS + pages
+
+
+def estimate_jobs(df, checkpoint_path=DEFAULT_CHECKPOINT_PATH, view_weight=VIEW_WEIGHT, max_pages=None):
+    """
+    为每个任务估算预计新增评论数、请求数和每请求价值
+    :param df: load_jobs 返回的 DataFrame
+    :param checkpoint_path: 检查点数据库路径，文件存在时已完成的视频只计算增量
+    :param view_weight: 播放量折算为评论数的权重
+    :param max_pages: 主评论最大页数，None表示不限制
+    :return: 增加 预计评论数、预计请求数、价值、每请求价值 列的 DataFrame
+    """
+    df = df.copy()
+    expected = df['评论数'].copy()
+    importance = df['播放量'] * view_weight
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with CrawlCheckpoint(checkpoint_path) as checkpoint:
+            for i, bvid in df['BV号'].items():
+                state = checkpoint.get_state(bvid)
+                if state and state["done"]:
+                    # 已完成的视频只需补抓新增评论，播放量带来的价值已经拿到
+                    expected[i] = max(0, expected[i] - (state["total"] or 0))
+                    importance[i] = 0.0
+
+    df['预计评论数'] = expected
+    df['预计请求数'] = [estimate_requests(count, max_pages) for count in expected]
+    df['价值'] = expected + importance
+    df['每请求价值'] = df['价值'] / df['预计请求数']
+    return df
+
+
+def prioritize(df, rate=None, endpoint_url=None):
+    """
+    按每请求价值从高到低排列任务，并计算累计请求数、预计耗时、评论覆盖比例和价值覆盖比例
+    :param df: estimate_jobs 返回的 DataFrame
+    :param rate: 评论接口的请求速率（次/秒），None 时读取共享限速器的当前速率
+    :param endpoint_url: 读取速率的评论接口，默认游标翻页接口
+    :return: 排序后的 DataFrame，增加 累计请求数、预计耗时(秒)、累计评论占比、累计价值占比 列
+    """
+    if rate is None:
+        if endpoint_url is None:
+            from async_comments_crawler import REPLY_MAIN_URL as endpoint_url
+        rate = get_rate_limiter().current_rate(endpoint_url)
+
+    df = df.sort_values(by=['每请求价值', '价值'], ascending=False, kind='stable').reset_index(drop=True)
+    df['累计请求数'] = df['预计请求数'].cumsum()
+    df['预计耗时(秒)'] = (df['累计请求数'] / max(rate, 1e-9)).round(1)
+    total = df['预计评论数'].sum()
+    df['累计评论占比'] = (df['预计评论数'].cumsum() / total).round(4) if total else 0.0
+    total_value = df['价值'].sum()
+    df['累计价值占比'] = (df['价值'].cumsum() / total_value).round(4) if total_value else 0.0
+    return df
+
+
+def plan_crawl(source, checkpoint_path=DEFAULT_CHECKPOINT_PATH, rate=None, view_weight=VIEW_WEIGHT,
+               max_pages=None):
+    """
+    生成抓取计划的便捷入口
+    :param source: 见 load_jobs
+    :return: 按优先级排序的任务 DataFrame，见 prioritize
+    """
+    jobs = load_jobs(source)
+    if jobs.empty:
+        return jobs
+    return prioritize(estimate_jobs(jobs, checkpoint_path, view_weight, max_pages), rate)
+
+
+def format_duration(seconds):
+    """把秒数格式化为 'x小时y分' / 'y分z秒'"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}小时{minutes}分"
+    if minutes:
+        return f"{minutes}分{seconds}秒"
+    return f"{seconds}秒"
+
+
+def coverage_at(plan, seconds, column='累计价值占比'):
+    """
+    按计划顺序运行指定秒数后预计覆盖的比例
+    检查点逐页保存评论，正在抓取的视频按已用时间比例计入
+    :param column: 累计价值占比 或 累计评论占比
+    """
+    if plan.empty:
+        return 0.0
+    return float(np.interp(seconds, [0.0] + plan['预计耗时(秒)'].tolist(),
+                           [0.0] + list(plan[column])))
+
+
+def print_plan(plan, top=10):
+    """打印抓取顺序、预计耗时，以及抓到一半时间时能覆盖多少价值和评论"""
+    if plan.empty:
+        print("没有需要抓取的视频")
+        return
+
+    total_requests = int(plan['累计请求数'].iloc[-1])
+    total_seconds = plan['预计耗时(秒)'].iloc[-1]
+    print(f"\n抓取计划: {len(plan)} 个视频, 预计 {int(plan['预计评论数'].sum())} 条评论, "
+          f"约 {total_requests} 次请求, 预计耗时 {format_duration(total_seconds)}")
+
+    print(f"优先抓取的前 {min(top, len(plan))} 个视频:")
+    for i, row in plan.head(top).iterrows():
+        title = str(row['标题'])[:24]
+        print(f"  {i + 1:>3}. {row['BV号']} 评论 {row['预计评论数']:>7} 播放 {row['播放量']:>9} "
+              f"请求 {row['预计请求数']:>5} 累计价值 {row['累计价值占比']:.1%}  {title}")
+
+    for share in (0.25, 0.5):
+        covered = coverage_at(plan, total_seconds * share)
+        comments = coverage_at(plan, total_seconds * share, '累计评论占比')
+        print(f"  运行 {share:.0%} 的时间（{format_duration(total_seconds * share)}）后预计覆盖 "
+              f"{covered:.1%} 的价值（播放量+评论）、{comments:.1%} 的评论")
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("B站评论抓取任务调度")
+    print("=" * 60)
+
+    csv_file_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "bilibili_results_20251219_153805.csv"
+    )
+    if not os.path.exists(csv_file_path):
+        print(f"错误: CSV文件不存在: {csv_file_path}")
+        return
+
+    print_plan(plan_crawl(csv_file_path), top=20)
+
+
+if __name__ == "__main__":
+    main()
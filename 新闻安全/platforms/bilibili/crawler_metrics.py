@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫运行指标
+功能：各爬虫共用的指标记录：按接口统计请求耗时分布（直方图）、重试次数、API返回的 code 分布、
+下载字节数，以及每秒解析的评论/弹幕行数。运行结束时打印汇总并保存为 JSON，
+设置环境变量 BILI_METRICS_PROM 时同时写出 Prometheus 文本格式文件（供 node_exporter 的 textfile 收集器读取），
+用于调整并发数和请求间隔。
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from rate_limiter import endpoint_of
+
+DEFAULT_METRICS_DIR = os.path.join("B站评论数据", "metrics")
+# 请求耗时直方图的分桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """固定分桶的耗时直方图"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """按分桶估算分位数（返回所在分桶的上界，超过最大分桶时返回最大上界）"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self.buckets[-1]
+
+    def cumulative(self):
+        """Prometheus 格式的累计计数 [(上界, 计数), ..., ('+Inf', 总数)]"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append(("+Inf", self.count))
+        return result
+
+
+class EndpointStats:
+    """单个接口的请求统计"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses = Counter()
+        self.codes = Counter()
+        self.retries = 0
+        self.bytes = 0
+
+
+class CrawlerMetrics:
+    """按接口汇总的爬虫指标，线程安全，同步和异步爬虫共用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._endpoints = {}
+            self._rows = Counter()
+
+    def _endpoint(self, url):
+        endpoint = endpoint_of(url)
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats()
+        return stats
+
+    def observe_request(self, url, seconds, status=200, code=None, nbytes=0):
+        """
+        记录一次请求
+        :param url: 请求的URL（按接口路径分组）
+        :param seconds: 请求耗时
+        :param status: HTTP状态码
+        :param code: B站API返回的code，非JSON响应时传 None
+        :param nbytes: 响应字节数
+        """
+        with self._lock:
+            stats = self._endpoint(url)
+            stats.latency.observe(seconds)
+            stats.statuses[str(status)] += 1
+            stats.codes["none" if code is None else str(code)] += 1
+            stats.bytes += nbytes
+
+    def record_retry(self, url):
+        """记录一次重试"""
+        with self._lock:
+            self._endpoint(url).retries += 1
+
+    def record_rows(self, count, kind="comments"):
+        """
+        记录解析出的数据行数
+        :param kind: 数据类型，例如 comments、danmu、videos
+        """
+        if count:
+            with self._lock:
+                self._rows[kind] += count
+
+    def summary(self):
+        """
+        :return: {'started', 'elapsed', 'endpoints': {接口: {...}}, 'rows': {类型: {'count', 'per_second'}}}
+        """
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            endpoints = {}
+            for endpoint, stats in self._endpoints.items():
+                latency = stats.latency
+                endpoints[endpoint] = {
+                    "requests": latency.count,
+                    "retries": stats.retries,
+                    "bytes": stats.bytes,
+                    "statuses": dict(stats.statuses),
+                    "codes": dict(stats.codes),
+                    "latency": {
+                        "mean": round(latency.sum / latency.count, 4) if latency.count else 0.0,
+                        "p50": latency.quantile(0.5),
+                        "p95": latency.quantile(0.95),
+                        "p99": latency.quantile(0.99),
+                        "buckets": {str(bound): count for bound, count in latency.cumulative()},
+                    },
+                    "requests_per_second": round(latency.count / elapsed, 3),
+                }
+            rows = {
+                kind: {"count": count, "per_second": round(count / elapsed, 3)}
+                for kind, count in self._rows.items()
+            }
+            return {
+                "started": datetime.fromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S'),
+                "elapsed": round(elapsed, 3),
+                "endpoints": endpoints,
+                "rows": rows,
+            }
+
+    def print_summary(self):
+        """打印各接口的请求指标和解析速度"""
+        summary = self.summary()
+        if not summary["endpoints"] and not summary["rows"]:
+            return
+        print(f"\n运行指标 (耗时 {summary['elapsed']:.1f} 秒):")
+        for endpoint, item in summary["endpoints"].items():
+            latency = item["latency"]
+            codes = ", ".join(f"{code}: {count}" for code, count in item["codes"].items())
+            print(f"  {endpoint}: 请求 {item['requests']} 次 ({item['requests_per_second']:.2f} 次/秒), "
+                  f"重试 {item['retries']} 次, 平均耗时 {latency['mean'] * 1000:.0f} 毫秒, "
+                  f"P95 ≤ {latency['p95']} 秒, 下载 {item['bytes'] / 1024:.1f} KB, code分布 {{{codes}}}")
+        for kind, item in summary["rows"].items():
+            print(f"  解析 {kind}: {item['count']} 行, {item['per_second']:.1f} 行/秒")
+
+    def save_json(self, path=None, run_name="crawler"):
+        """
+        保存JSON汇总
+        :param path: 保存路径，默认 B站评论数据/metrics/<运行名称>_<时间>.json
+        :return: 保存的文件路径
+        """
+        if path is None:
+            path = os.path.join(DEFAULT_METRICS_DIR, f"{run_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        summary["run"] = run_name
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return path
+
+    def to_prometheus(self, run_name="crawler"):
+        """Prometheus 文本格式的指标"""
+        def labels(**items):
+            return "{" + ",".join(
+                f'{key}="{str(value)}"' for key, value in dict(run=run_name, **items).items()
+            ) + "}"
+
+        lines = [
+            "# HELP bili_crawler_request_duration_seconds 请求耗时",
+            "# TYPE bili_crawler_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            endpoints = list(self._endpoints.items())
+            rows = dict(self._rows)
+            elapsed = max(time.time() - self.started, 1e-9)
+
+            for endpoint, stats in endpoints:
+                for bound, count in stats.latency.cumulative():
+                    lines.append(f"bili_crawler_request_duration_seconds_bucket{labels(endpoint=endpoint, le=bound)} {count}")
+                lines.append(f"bili_crawler_request_duration_seconds_sum{labels(endpoint=endpoint)} {stats.latency.sum:.6f}")
+                lines.append(f"bili_crawler_request_duration_seconds_count{labels(endpoint=endpoint)} {stats.latency.count}")
+
+            lines += ["# HELP bili_crawler_responses_total 按HTTP状态码统计的响应数",
+                      "# TYPE bili_crawler_responses_total counter"]
+            for endpoint, stats in endpoints:
+                for status, count in stats.statuses.items():
+                    lines.append(f"bili_crawler_responses_total{labels(endpoint=endpoint, status=status)} {count}")
+
+            lines += ["# HELP bili_crawler_api_code_total 按API返回code统计的响应数",
+                      "# TYPE bili_crawler_api_code_total counter"]
+            for endpoint, stats in endpoints:
+                for code, count in stats.codes.items():
+                    lines.append(f"bili_crawler_api_code_total{labels(endpoint=endpoint, code=code)} {count}")
+
+            lines += ["# HELP bili_crawler_retries_total 重试次数",
+                      "# TYPE bili_crawler_retries_total counter"]
+            for endpoint, stats in endpoints:
+                lines.append(f"bili_crawler_retries_total{labels(endpoint=endpoint)} {stats.retries}")
+
+            lines += ["# HELP bili_crawler_response_bytes_total 下载字节数",
+                      "# TYPE bili_crawler_response_bytes_total counter"]
+            for endpoint, stats in endpoints:
+                lines.append(f"bili_crawler_response_bytes_total{labels(endpoint=endpoint)} {stats.bytes}")
+
+        lines += ["# HELP bili_crawler_rows_parsed_total 解析出的数据行数",
+                  "# TYPE bili_crawler_rows_parsed_total counter"]
+        for kind, count in rows.items():
+            lines.append(f"bili_crawler_rows_parsed_total{labels(kind=kind)} {count}")
+        lines += ["# HELP bili_crawler_rows_per_second 本次运行的平均解析速度",
+                  "# TYPE bili_crawler_rows_per_second gauge"]
+        for kind, count in rows.items():
+            lines.append(f"bili_crawler_rows_per_second{labels(kind=kind)} {count / elapsed:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, run_name="crawler"):
+        """写出 Prometheus 文本格式文件（先写临时文件再替换，避免收集器读到一半的内容）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(run_name))
+        os.replace(tmp_path, path)
+        return path
+
+    def finish_run(self, run_name="crawler"):
+        """
+        运行结束时调用：打印汇总、保存JSON，设置了 BILI_METRICS_PROM 时写出 Prometheus 文件
+        :return: JSON文件路径
+        """
+        self.print_summary()
+        try:
+            path = self.save_json(run_name=run_name)
+            print(f"运行指标已保存至: {os.path.abspath(path)}")
+            prom_path = os.environ.get("BILI_METRICS_PROM")
+            if prom_path:
+                self.write_prometheus(prom_path, run_name)
+            return path
+        except OSError as e:
+            print(f"保存运行指标失败: {e}")
+            return None
+
+
+_shared_metrics = None
+
+
+def get_metrics():
+    """获取进程内共享的指标记录器"""
+    global _shared_metrics
+    if _shared_metrics is None:
+        _shared_metrics = CrawlerMetrics()
+    return _shared_metrics
@@ -1,13 +1,43 @@
 import asyncio
+import contextlib
 import aiohttp
 import random
-import xml.etree.ElementTree as ET
 import pandas as pd
 import os
+import sys
 import time
 import datetime
+import json
+import math
 import numpy as np
 
+# 添加当前目录到Python路径，以便使用共享的限速器
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from comments_crawler import API_BASE
+from cookie_pool import get_cookie_pool
+from crawler_metrics import get_metrics
+from danmu_history_cache import get_danmu_history_cache
+from danmu_parser import (DANMU_COLUMNS, DanmuXmlParser, arrays_to_frame, parse_danmu_xml_arrays,
+                          segment_elems_to_arrays)
+from danmu_protobuf import parse_danmu_segment
+from danmu_timeline import find_highlights, per_second_counts, print_highlights, second_labels, to_seconds
+from rate_limiter import RISK_CONTROL_STATUS, get_rate_limiter
+from response_archive import get_response_archive
+from video_cache import get_video_cache
+
+# 批量处理时同时处理的视频数
+DANMU_CONCURRENCY = 8
+# 弹幕接口："seg"=分段protobuf接口，可获取全部弹幕；"xml"=旧版 list.so，只返回最近的一部分弹幕；
+# "history"=历史弹幕接口，按日期范围获取（需要登录Cookie）
+DEFAULT_DANMU_MODE = "seg"
+# 分段弹幕每段覆盖的视频时长（秒）
+SEGMENT_SECONDS = 360
+# 触发风控（HTTP 412/429）后由限速器暂停再重试的次数
+MAX_RETRIES = 3
+# 未配置Cookie池时，需要登录的接口从这里读取 BILI_COOKIE
+ENV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.env')
+
 
 def get_random_user_agent():
     """生成随机的 User-Agent"""
@@ -20,9 +50,109 @@ def get_random_user_agent():
     return random.choice(browsers)
 
 
-async def fetch_cid(bvid):
-    """获取视频的 CID（弹幕 ID）"""
-    url = f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}"
+def create_session(concurrency=DANMU_CONCURRENCY, timeout=20):
+    """
+    创建批量抓取共用的 aiohttp 会话：连接保持长连接复用，避免每个请求重新建立TCP/TLS连接
+    :param concurrency: 同时处理的视频数，用于设置连接数上限
+    :param timeout: 单次请求超时（秒）
+    """
+    connector = aiohttp.TCPConnector(
+        limit=concurrency * 2,
+        limit_per_host=concurrency,
+        ttl_dns_cache=300,
+        keepalive_timeout=60
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+@contextlib.asynccontextmanager
+async def _use_session(session):
+    """使用传入的共享会话；未传入时为本次请求临时创建一个"""
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession() as own_session:
+        yield own_session
+
+
+def load_env_cookie():
+    """读取 BILI_COOKIE（环境变量优先，其次是 .env 文件），未配置时返回空字符串"""
+    cookie = os.environ.get("BILI_COOKIE", "").strip()
+    if cookie:
+        return cookie
+    if os.path.exists(ENV_PATH):
+        with open(ENV_PATH, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('BILI_COOKIE='):
+                    return line.strip().split('=', 1)[1]
+    return ""
+
+
+async def _acquire_account(headers, login=False):
+    """
+    配置了多账号Cookie池时，从池中选择一个账号并把Cookie加入请求头
+    :param login: 接口是否需要登录；未配置Cookie池时使用 BILI_COOKIE
+    """
+    pool = get_cookie_pool()
+    if pool is None:
+        if login:
+            cookie = load_env_cookie()
+            if cookie:
+                headers["Cookie"] = cookie
+        return None, None
+    account = await pool.acquire_async()
+    headers["Cookie"] = account.cookie
+    return pool, account
+
+
+@contextlib.asynccontextmanager
+async def _limited_get(http, url, headers, params=None, login=False):
+    """
+    在共享限速器内发起GET请求，每次尝试都重新选择Cookie池中的账号
+    HTTP 412/429 风控响应由限速器降速暂停后重试，最多 MAX_RETRIES 次；其余响应交给调用方处理
+    :return: 上下文管理器，得到 (响应, Cookie池, 账号, 请求开始时间)
+    """
+    rate_limiter = get_rate_limiter()
+    metrics = get_metrics()
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            metrics.record_retry(url)
+        await rate_limiter.acquire_async(url)
+        pool, account = await _acquire_account(headers, login)
+        start = time.perf_counter()
+        async with http.get(url, params=params, headers=headers) as response:
+            if response.status in RISK_CONTROL_STATUS and attempt < MAX_RETRIES:
+                body = await response.read()
+                metrics.observe_request(url, time.perf_counter() - start, response.status, None, len(body))
+                rate_limiter.feedback(url, response.status, None)
+                if pool is not None:
+                    pool.feedback(account, response.status, None)
+                continue
+            yield response, pool, account, start
+            return
+
+
+async def fetch_cid(bvid, session=None):
+    """
+    获取视频的 CID（弹幕 ID）
+    :param session: 共享的 aiohttp 会话（见 create_session），不传时临时创建
+    """
+    return (await fetch_video_info(bvid, session))["cid"]
+
+
+async def fetch_video_info(bvid, session=None):
+    """
+    获取视频信息（CID、分P及各分P时长）
+    :param session: 共享的 aiohttp 会话（见 create_session），不传时临时创建
+    :return: 视频信息字典，格式见 video_cache.parse_view_data
+    """
+    url = f"{API_BASE}/x/web-interface/view?bvid={bvid}"
+
+    # CID 和分P信息不会变化，优先从视频元数据缓存读取
+    cache = get_video_cache()
+    info = cache.get(bvid)
+    if info is not None and info["cid"]:
+        return info
 
     headers = {
         "User-Agent": get_random_user_agent(),
@@ -34,32 +164,53 @@ async def fetch_cid(bvid):
         "DNT": "1"
     }
 
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url) as response:
+    rate_limiter = get_rate_limiter()
+    metrics = get_metrics()
+    async with _use_session(session) as http:
+        async with _limited_get(http, url, headers) as (response, pool, account, start):
+            body = await response.read()
+            elapsed = time.perf_counter() - start
             if response.status != 200:
+                metrics.observe_request(url, elapsed, response.status, None, len(body))
+                rate_limiter.feedback(url, response.status, None)
+                if pool is not None:
+                    pool.feedback(account, response.status, None)
                 error_msg = f"获取CID失败: 状态码 {response.status}"
                 print(error_msg)
                 raise ValueError(error_msg)
 
             content_type = response.headers.get('Content-Type', '')
             if 'application/json' not in content_type:
+                metrics.observe_request(url, elapsed, response.status, None, len(body))
                 content = await response.text()
                 error_msg = f"获取CID失败: 非JSON响应 ({content_type})"
                 print(f"{error_msg}\n响应内容: {content[:300]}")
                 raise ValueError(error_msg)
 
             data = await response.json()
+            metrics.observe_request(url, elapsed, response.status, data.get("code"), len(body))
+            rate_limiter.feedback(url, response.status, data.get("code"))
+            if pool is not None:
+                pool.feedback(account, response.status, data.get("code"))
+            archive = get_response_archive()
+            if archive is not None:
+                archive.record(url, bvid, {"bvid": bvid}, data)
             if data.get("code") == 0:
-                return data["data"]["cid"]
+                return cache.put(bvid, data["data"])
             else:
                 error_msg = f"获取CID失败: {data.get('message', '未知错误')}"
                 print(error_msg)
                 raise ValueError(error_msg)
 
 
-async def fetch_danmu(cid):
-    """根据 CID 获取弹幕，并提取时间点和弹幕内容"""
-    url = f"https://api.bilibili.com/x/v1/dm/list.so?oid={cid}"
+async def fetch_danmu(cid, bvid=None, session=None):
+    """
+    根据 CID 获取弹幕，边下载边解析，提取时间点、弹幕内容、发送时间等字段
+    :param bvid: 视频BV号，开启原始响应归档时用于归档分区
+    :param session: 共享的 aiohttp 会话（见 create_session），不传时临时创建
+    :return: 弹幕表格，列见 danmu_parser.DANMU_COLUMNS，按时间点排序
+    """
+    url = f"{API_BASE}/x/v1/dm/list.so?oid={cid}"
 
     headers = {
         "User-Agent": get_random_user_agent(),
@@ -71,68 +222,347 @@ async def fetch_danmu(cid):
         "DNT": "1"
     }
 
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url) as response:
+    rate_limiter = get_rate_limiter()
+    async with _use_session(session) as http:
+        async with _limited_get(http, url, headers) as (response, pool, account, start):
+            rate_limiter.feedback(url, response.status)
+            if pool is not None:
+                pool.feedback(account, response.status, None)
             if response.status != 200:
+                body = await response.read()
+                get_metrics().observe_request(url, time.perf_counter() - start, response.status, None, len(body))
                 error_msg = f"获取弹幕失败: 状态码 {response.status}"
                 print(error_msg)
                 raise ValueError(error_msg)
 
-            content = await response.text(encoding='utf-8')
+            # 分块喂给增量解析器，不在内存中保留整个XML（开启归档时除外）
+            archive = get_response_archive()
+            chunks = [] if archive is not None else None
+            parser = DanmuXmlParser()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                parser.feed(chunk)
+                if chunks is not None:
+                    chunks.append(chunk)
+            get_metrics().observe_request(url, time.perf_counter() - start, response.status, None, parser.bytes)
+
+            if archive is not None:
+                archive.record(url, bvid or str(cid), {"oid": cid}, text=b"".join(chunks).decode("utf-8"))
+
+            df = arrays_to_frame(parser.close())
+            get_metrics().record_rows(len(df), "danmu")
+            return df
+
+
+async def fetch_danmu_segment(cid, index, bvid=None, session=None):
+    """
+    获取一个6分钟的弹幕分段（seg.so，protobuf格式）
+    :param index: 分段序号，从1开始
+    :return: 分段的二进制内容，超出视频时长的分段为空
+    """
+    url = f"{API_BASE}/x/v2/dm/web/seg.so"
+    params = {"type": 1, "oid": cid, "segment_index": index}
 
-            # 使用XML解析器解析弹幕数据
-            try:
-                root = ET.fromstring(content)
-            except ET.ParseError:
-                # 尝试修复XML格式错误
-                content = content.replace('</i>', '').replace('</d>', '')
-                root = ET.fromstring(content)
-
-            # 创建一个列表来存储弹幕数据 (时间点, 弹幕内容)
-            danmu_data = []
-
-            # 遍历所有<d>标签
-            for d in root.findall('d'):
-                # 解析弹幕属性 (p属性包含时间等信息)
-                p_attr = d.get('p').split(',')
-                if len(p_attr) >= 5:  # 确保有足够的字段
-                    try:
-                        # 第一个属性是弹幕在视频中出现的时间点（秒）
-                        time_point = float(p_attr[0])
-
-                        # 新增：解析发送时间（第5个字段是Unix时间戳）
-                        send_timestamp = int(p_attr[4])
-                        # 转换为可读的日期时间格式
-                        send_time = datetime.datetime.fromtimestamp(send_timestamp).strftime('%Y-%m-%d %H:%M:%S')
-
-                        # 添加弹幕数据（包含发送时间）
-                        danmu_data.append((time_point, d.text, send_time))
-                    except (ValueError, IndexError) as e:
-                        # 忽略无法解析的弹幕
-                        print(f"解析弹幕失败: {e}")
-                        continue
-
-            # 按照时间点排序
-            danmu_data.sort(key=lambda x: x[0])
-
-            return danmu_data
-
-def format_time(total_seconds):
-    """将秒数格式化为 '时:分:秒' 形式"""
-    # 计算小时、分钟和秒
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    seconds_remaining = total_seconds % 60
-
-    # 格式化为 "时:分:秒"
-    return f"{hours}:{minutes:02d}:{seconds_remaining:02d}"
-
-
-def save_to_excel(df, filename):
-    """保存DataFrame到Excel文件，兼容不同pandas版本"""
+    headers = {
+        "User-Agent": get_random_user_agent(),
+        "Referer": f"https://www.bilibili.com/video/{bvid}" if bvid else "https://www.bilibili.com",
+        "Origin": "https://www.bilibili.com",
+        "Accept": "*/*",
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Connection": "keep-alive",
+        "DNT": "1"
+    }
+
+    rate_limiter = get_rate_limiter()
+    async with _use_session(session) as http:
+        async with _limited_get(http, url, headers, params) as (response, pool, account, start):
+            content = await response.read()
+            get_metrics().observe_request(url, time.perf_counter() - start, response.status, None, len(content))
+            rate_limiter.feedback(url, response.status)
+            if pool is not None:
+                pool.feedback(account, response.status, None)
+            if response.status != 200:
+                error_msg = f"获取弹幕分段 {index} 失败: 状态码 {response.status}"
+                print(error_msg)
+                raise ValueError(error_msg)
+
+            archive = get_response_archive()
+            if archive is not None:
+                archive.record(url, bvid or str(cid), params, content=content)
+            return content
+
+
+def merge_danmu_segments(elems):
+    """
+    合并各分段解析出的弹幕，按弹幕ID去重
+    :param elems: parse_danmu_segment 结果的合并列表
+    :return: 弹幕表格，格式同 parse_danmu_xml
+    """
+    df = arrays_to_frame(segment_elems_to_arrays(elems))
+    get_metrics().record_rows(len(df), "danmu")
+    return df
+
+
+async def fetch_danmu_segments(cid, duration=None, bvid=None, session=None):
+    """
+    通过分段接口获取一个CID的全部弹幕：按视频时长并发请求所有6分钟分段，每个分段下载完成后立即解析
+    :param duration: 视频（分P）时长（秒），未知时逐段请求直到遇到空分段
+    :return: 弹幕表格，格式同 fetch_danmu
+    """
+    async def fetch_segment(index):
+        return parse_danmu_segment(await fetch_danmu_segment(cid, index, bvid, session))
+
+    if duration:
+        count = max(1, math.ceil(duration / SEGMENT_SECONDS))
+        segments = await asyncio.gather(*(fetch_segment(index) for index in range(1, count + 1)))
+    else:
+        segments = []
+        while True:
+            segment = await fetch_segment(len(segments) + 1)
+            if not segment:
+                break
+            segments.append(segment)
+
+    return merge_danmu_segments([elem for segment in segments for elem in segment])
+
+
+def _as_date(value):
+    """把 'YYYY-MM-DD' 字符串或 date/datetime 转换为 date"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value).strip())
+
+
+def months_between(start, end):
+    """
+    日期范围覆盖的月份
+    :return: ['YYYY-MM', ...]
+    """
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+async def fetch_history_index(cid, month, bvid=None, session=None):
+    """
+    获取某月有历史弹幕的日期（/x/v2/dm/history/index，需要登录）
+    :param month: 'YYYY-MM'
+    :return: ['YYYY-MM-DD', ...]
+    """
+    url = f"{API_BASE}/x/v2/dm/history/index"
+    params = {"type": 1, "oid": cid, "month": month}
+
+    headers = {
+        "User-Agent": get_random_user_agent(),
+        "Referer": f"https://www.bilibili.com/video/{bvid}" if bvid else "https://www.bilibili.com",
+        "Origin": "https://www.bilibili.com",
+        "Accept": "application/json, text/plain, */*",
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Connection": "keep-alive",
+        "DNT": "1"
+    }
+
+    rate_limiter = get_rate_limiter()
+    metrics = get_metrics()
+    async with _use_session(session) as http:
+        async with _limited_get(http, url, headers, params, login=True) as (response, pool, account, start):
+            body = await response.read()
+            elapsed = time.perf_counter() - start
+            if response.status != 200:
+                metrics.observe_request(url, elapsed, response.status, None, len(body))
+                rate_limiter.feedback(url, response.status, None)
+                if pool is not None:
+                    pool.feedback(account, response.status, None)
+                error_msg = f"获取 {month} 的历史弹幕日期失败: 状态码 {response.status}"
+                print(error_msg)
+                raise ValueError(error_msg)
+
+            data = json.loads(body)
+            code = data.get("code")
+            metrics.observe_request(url, elapsed, response.status, code, len(body))
+            rate_limiter.feedback(url, response.status, code)
+            if pool is not None:
+                pool.feedback(account, response.status, code)
+            archive = get_response_archive()
+            if archive is not None:
+                archive.record(url, bvid or str(cid), params, data)
+            if code != 0:
+                hint = "（历史弹幕需要登录，请配置Cookie）" if code == -101 else ""
+                error_msg = f"获取 {month} 的历史弹幕日期失败: {data.get('message', '未知错误')}{hint}"
+                print(error_msg)
+                raise ValueError(error_msg)
+            return list(data.get("data") or [])
+
+
+async def fetch_history_day(cid, date, bvid=None, session=None):
+    """
+    获取某天的历史弹幕（/x/v2/dm/web/history/seg.so，protobuf格式，需要登录）
+    :param date: 'YYYY-MM-DD'
+    :return: 二进制内容，格式同 fetch_danmu_segment
+    """
+    url = f"{API_BASE}/x/v2/dm/web/history/seg.so"
+    params = {"type": 1, "oid": cid, "date": date}
+
+    headers = {
+        "User-Agent": get_random_user_agent(),
+        "Referer": f"https://www.bilibili.com/video/{bvid}" if bvid else "https://www.bilibili.com",
+        "Origin": "https://www.bilibili.com",
+        "Accept": "*/*",
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Connection": "keep-alive",
+        "DNT": "1"
+    }
+
+    rate_limiter = get_rate_limiter()
+    async with _use_session(session) as http:
+        async with _limited_get(http, url, headers, params, login=True) as (response, pool, account, start):
+            content = await response.read()
+            # 出错时返回的是JSON（例如未登录），正常时是protobuf
+            code = None
+            if 'application/json' in response.headers.get('Content-Type', ''):
+                code = json.loads(content).get("code")
+            get_metrics().observe_request(url, time.perf_counter() - start, response.status, code, len(content))
+            rate_limiter.feedback(url, response.status, code)
+            if pool is not None:
+                pool.feedback(account, response.status, code)
+            if response.status != 200 or code not in (None, 0):
+                hint = "（历史弹幕需要登录，请配置Cookie）" if code == -101 else ""
+                error_msg = f"获取 {date} 的历史弹幕失败: 状态码 {response.status}, 代码 {code}{hint}"
+                print(error_msg)
+                raise ValueError(error_msg)
+
+            archive = get_response_archive()
+            if archive is not None:
+                archive.record(url, bvid or str(cid), params, content=content)
+            return content
+
+
+async def fetch_history_danmu(cid, start_date, end_date, bvid=None, session=None):
+    """
+    获取日期范围内发送的历史弹幕：并发查询各月有弹幕的日期，再并发下载每一天的历史弹幕，按弹幕ID去重。
+    已经过去的日期保存在本地缓存（danmu_history_cache）中，重新运行时只请求新的日期
+    :param start_date: 起始日期 'YYYY-MM-DD'（含）
+    :param end_date: 结束日期 'YYYY-MM-DD'（含）
+    :return: 弹幕表格，格式同 fetch_danmu，只包含发送时间在日期范围内的弹幕
+    """
+    start, end = _as_date(start_date), _as_date(end_date)
+    if start > end:
+        raise ValueError(f"起始日期 {start} 晚于结束日期 {end}")
+    cache = get_danmu_history_cache()
+
+    async def dates_of(month):
+        dates = cache.get_month(cid, month)
+        if dates is None:
+            dates = await fetch_history_index(cid, month, bvid, session)
+            cache.put_month(cid, month, dates)
+        return dates
+
+    monthly = await asyncio.gather(*(dates_of(month) for month in months_between(start, end)))
+    dates = sorted({date for dates in monthly for date in dates
+                    if start.isoformat() <= date <= end.isoformat()})
+    cached = set(cache.cached_dates(cid))
+    print(f"CID {cid}: {start} 至 {end} 共 {len(dates)} 天有弹幕，"
+          f"其中 {sum(date in cached for date in dates)} 天读取本地缓存")
+
+    async def fetch_day(date):
+        content = cache.get_day(cid, date)
+        if content is None:
+            content = await fetch_history_day(cid, date, bvid, session)
+            cache.put_day(cid, date, content)
+        return parse_danmu_segment(content)
+
+    days = await asyncio.gather(*(fetch_day(date) for date in dates))
+
+    # 每天的历史弹幕是截至当天的弹幕池，相邻日期大量重复，按弹幕ID去重后只保留范围内发送的弹幕
+    df = arrays_to_frame(segment_elems_to_arrays([elem for day in days for elem in day]))
+    sent_day = df['发送时间'].dt.normalize()
+    df = df[(sent_day >= pd.Timestamp(start)) & (sent_day <= pd.Timestamp(end))].reset_index(drop=True)
+    get_metrics().record_rows(len(df), "danmu")
+    return df
+
+
+def list_parts(info):
+    """
+    视频的全部分P
+    :param info: fetch_video_info 返回的视频信息
+    :return: [{'cid', 'page', 'part', 'duration'}, ...]，没有分P信息时只包含主CID
+    """
+    parts = [page for page in info.get("pages") or [] if page.get("cid")]
+    if not parts:
+        parts = [{"cid": info["cid"], "page": 1, "part": "", "duration": 0}]
+    return parts
+
+
+async def fetch_part_danmu(part, bvid=None, session=None, mode=DEFAULT_DANMU_MODE, date_range=None):
+    """
+    获取一个分P的弹幕
+    :param part: list_parts 返回的分P信息
+    :param date_range: (起始日期, 结束日期)，mode 为 "history" 时使用
+    :return: 弹幕表格，格式同 fetch_danmu，时间点相对于该分P的开头
+    """
+    if mode == "history":
+        if not date_range:
+            raise ValueError("历史弹幕模式需要指定日期范围")
+        return await fetch_history_danmu(part["cid"], date_range[0], date_range[1], bvid, session)
+    if mode == "seg":
+        return await fetch_danmu_segments(part["cid"], part.get("duration"), bvid, session)
+    return await fetch_danmu(part["cid"], bvid, session)
+
+
+async def fetch_video_danmu(bvid, session=None, mode=DEFAULT_DANMU_MODE, date_range=None):
+    """
+    并发获取视频全部分P的弹幕
+    :param mode: 弹幕接口，"seg"=分段接口（全部弹幕），"xml"=旧版 list.so，"history"=按日期范围获取历史弹幕
+    :param date_range: (起始日期, 结束日期)，mode 为 "history" 时使用
+    :return: [(分P信息, 弹幕表格), ...]，按分P顺序；获取失败的分P不包含在内
+    """
+    info = await fetch_video_info(bvid, session)
+    parts = list_parts(info)
+    if len(parts) > 1:
+        print(f"视频 {bvid} 共 {len(parts)} 个分P")
+
+    results = await asyncio.gather(
+        *(fetch_part_danmu(part, bvid, session, mode, date_range) for part in parts), return_exceptions=True
+    )
+    fetched = []
+    for part, result in zip(parts, results):
+        if isinstance(result, Exception):
+            print(f"视频 {bvid} 第 {part['page']} P (CID {part['cid']}) 弹幕获取失败: {result}")
+            continue
+        fetched.append((part, result))
+    if not fetched:
+        raise ValueError("所有分P的弹幕都获取失败")
+    return fetched
+
+
+def parse_danmu_xml(content):
+    """
+    解析 dm/list.so 返回的弹幕XML
+    :return: 弹幕表格，列见 danmu_parser.DANMU_COLUMNS，按时间点排序
+    """
+    df = arrays_to_frame(parse_danmu_xml_arrays(content))
+    get_metrics().record_rows(len(df), "danmu")
+    return df
+
+
+def save_to_excel(df, filename, sheets=None):
+    """
+    保存DataFrame到Excel文件，兼容不同pandas版本
+    :param sheets: 额外的工作表 {工作表名称: DataFrame}，例如高光时刻
+    """
     try:
         # 尝试较新的保存方法
-        df.to_excel(filename, index=False, engine='openpyxl')
+        if sheets:
+            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+                df.to_excel(writer, index=False)
+                for sheet_name, sheet in sheets.items():
+                    sheet.to_excel(writer, sheet_name=sheet_name, index=False)
+        else:
+            df.to_excel(filename, index=False, engine='openpyxl')
         return True
     except TypeError:
         # 如果失败，尝试旧版保存方法
@@ -144,57 +574,112 @@ def save_to_excel(df, filename):
             return False
 
 
-async def fetch_and_save_danmu(bvid):
-    """获取并保存弹幕到Excel文件，按秒分组显示"""
+def build_danmu_dataframe(danmu_data):
+    """
+    把弹幕整理为保存用的DataFrame，按秒分组显示
+    :param danmu_data: parse_danmu_xml 返回的弹幕表格（或 (时间点, 弹幕内容, 发送时间) 列表）
+    """
+    # 创建DataFrame
+    if isinstance(danmu_data, pd.DataFrame):
+        df = danmu_data.copy()
+    else:
+        df = pd.DataFrame(danmu_data, columns=['时间点(秒)', '弹幕内容', '发送时间'])
+    extra_columns = [column for column in DANMU_COLUMNS[3:] if column in df.columns]
+
+    # 添加整数秒列用于分组
+    seconds = to_seconds(df['时间点(秒)'].to_numpy(dtype=float))
+    df['整数秒'] = seconds
+
+    # 计算每秒弹幕数量，格式化时间只对出现过的秒数生成一次，按整数秒下标取用
+    labels = second_labels(per_second_counts(seconds))
+    df['时间点(格式化)'] = labels[seconds]
+
+    # 重新排列列顺序（包含整数秒列），模式、字号、颜色等字段放在最后
+    df = df[['时间点(秒)', '整数秒', '时间点(格式化)', '弹幕内容', '发送时间'] + extra_columns]
+
+    # 为每个时间点添加分组标识（每个时间点的第一条弹幕）
+    # 使用shift来检测时间点变化
+    df['新时间点'] = df['整数秒'] != df['整数秒'].shift(1)
+    # 第一条记录总是新时间点
+    if not df.empty:  # 添加空DataFrame检查
+        df.loc[df.index[0], '新时间点'] = True
+
+    # 删除临时列
+    df = df.drop(columns=['整数秒'])
+
+    return df
+
+
+def build_video_danmu_dataframe(parts_data):
+    """
+    合并多个分P的弹幕：每个分P的时间轴各自从0开始，按秒分组和每秒弹幕数在分P内分别计算
+    :param parts_data: fetch_video_danmu 的结果 [(分P信息, 弹幕列表), ...]
+    :return: 在 build_danmu_dataframe 的列前增加 分P、分P标题 两列的DataFrame
+    """
+    frames = []
+    for index, (part, danmu_data) in enumerate(parts_data, 1):
+        df = build_danmu_dataframe(danmu_data)
+        df.insert(0, '分P', part.get("page") or index)
+        df.insert(1, '分P标题', part.get("part") or "")
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_video_highlights(parts_data, top=None):
+    """
+    各分P的高光时刻（见 danmu_timeline.find_highlights）
+    :param parts_data: fetch_video_danmu 的结果 [(分P信息, 弹幕表格), ...]
+    :param top: 每个分P输出的高光时刻数量，None 时使用默认数量
+    :return: 在高光时刻列前增加 分P 列的DataFrame
+    """
+    frames = []
+    for index, (part, danmu_data) in enumerate(parts_data, 1):
+        df = danmu_data if isinstance(danmu_data, pd.DataFrame) else pd.DataFrame(
+            danmu_data, columns=['时间点(秒)', '弹幕内容', '发送时间'])
+        options = {} if top is None else {"top": top}
+        highlights = find_highlights(df['时间点(秒)'].to_numpy(dtype=float), df['弹幕内容'].to_numpy(), **options)
+        highlights.insert(0, '分P', part.get("page") or index)
+        frames.append(highlights)
+    return pd.concat(frames, ignore_index=True)
+
+
+async def fetch_and_save_danmu(bvid, session=None, mode=DEFAULT_DANMU_MODE, date_range=None):
+    """
+    获取并保存弹幕到Excel文件，按秒分组显示
+    :param session: 共享的 aiohttp 会话（见 create_session），不传时临时创建
+    :param mode: 弹幕接口，"seg"=分段接口（全部弹幕），"xml"=旧版 list.so，"history"=按日期范围获取历史弹幕
+    :param date_range: (起始日期, 结束日期)，mode 为 "history" 时使用
+    """
     try:
         print(f"开始获取视频 {bvid} 的弹幕...")
         start_time = time.time()
 
-        # 获取视频CID
-        cid = await fetch_cid(bvid)
-        print(f"获取到视频CID: {cid}")
-
-        # 获取弹幕数据 (包含时间点和内容)
-        danmu_data = await fetch_danmu(cid)
-        print(f"成功获取到 {len(danmu_data)} 条弹幕")
-
-        # 创建DataFrame
-        df = pd.DataFrame(danmu_data, columns=['时间点(秒)', '弹幕内容', '发送时间'])
-
-        # 添加整数秒列用于分组
-        df['整数秒'] = df['时间点(秒)'].apply(lambda x: int(float(x)))
+        # 获取全部分P的弹幕数据 (包含时间点和内容)
+        parts_data = await fetch_video_danmu(bvid, session, mode, date_range)
+        for part, danmu_data in parts_data:
+            print(f"第 {part['page']} P (CID {part['cid']}) 获取到 {len(danmu_data)} 条弹幕")
 
-        # 计算每秒弹幕数量
-        danmu_counts = df['整数秒'].value_counts().to_dict()
+        df = build_video_danmu_dataframe(parts_data)
+        print(f"成功获取到 {len(df)} 条弹幕")
 
-        # 添加格式化时间列
-        df['时间点(格式化)'] = df['整数秒'].apply(
-            lambda sec: f"{format_time(sec)} (共{danmu_counts.get(sec, 0)}条)"
-        )
-
-        # 重新排列列顺序（包含整数秒列）
-        df = df[['时间点(秒)', '整数秒', '时间点(格式化)', '弹幕内容', '发送时间']]
-
-        # 为每个时间点添加分组标识（每个时间点的第一条弹幕）
-        # 使用shift来检测时间点变化
-        df['新时间点'] = df['整数秒'] != df['整数秒'].shift(1)
-        # 第一条记录总是新时间点
-        if not df.empty:  # 添加空DataFrame检查
-            df.loc[df.index[0], '新时间点'] = True
-
-        # 删除临时列
-        df = df.drop(columns=['整数秒'])
+        # 按每秒弹幕密度找出弹幕爆发的高光时刻，保存在Excel的“高光时刻”工作表中
+        highlights = build_video_highlights(parts_data)
+        print_highlights(highlights)
 
         # 保存到Excel文件
         excel_filename = f"danmu_{bvid}.xlsx"
+        if mode == "history":
+            excel_filename = f"danmu_{bvid}_{date_range[0]}_{date_range[1]}.xlsx"
 
-        if save_to_excel(df, excel_filename):
+        # Excel写入是阻塞操作，放到线程池中执行，批量处理时不阻塞其他视频的下载
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, save_to_excel, df, excel_filename, {"高光时刻": highlights}):
             elapsed = time.time() - start_time
             print(f"\n所有弹幕已保存到 {excel_filename}")
             print(f"文件包含 {len(df)} 条弹幕记录")
             print(f"处理耗时: {elapsed:.2f}秒")
-            print("列标题: 时间点(秒), 时间点(格式化), 弹幕内容, 发送时间")
-            print("提示: 时间点(格式化)列在每个新时间点的第一条弹幕显示一次")
+            print("列标题: 分P, 分P标题, 时间点(秒), 时间点(格式化), 弹幕内容, 发送时间")
+            print("提示: 时间点(格式化)列在每个新时间点的第一条弹幕显示一次；高光时刻见“高光时刻”工作表")
 
             # 打开Excel文件（如果系统支持）
             if os.name == 'nt':  # Windows系统
@@ -213,34 +698,55 @@ async def fetch_and_save_danmu(bvid):
         return False
 
 
-async def process_multiple_bvids(bvid_list):
-    """批量处理多个BV号"""
+async def process_multiple_bvids(bvid_list, concurrency=DANMU_CONCURRENCY, mode=DEFAULT_DANMU_MODE,
+                                 date_range=None):
+    """
+    批量处理多个BV号
+    多个工作协程共用一个长连接会话并发处理视频：一个视频在下载弹幕时，其他视频可以同时查询CID，
+    请求速率由共享限速器控制
+    :param concurrency: 同时处理的视频数
+    :param mode: 弹幕接口，见 fetch_and_save_danmu
+    :param date_range: (起始日期, 结束日期)，mode 为 "history" 时使用
+    """
     total = len(bvid_list)
     success_count = 0
 
     print(f"\n{'=' * 50}")
-    print(f"开始批量处理 {total} 个视频")
+    print(f"开始批量处理 {total} 个视频（同时处理 {concurrency} 个）")
     print(f"{'=' * 50}\n")
 
+    queue = asyncio.Queue()
     for i, bvid in enumerate(bvid_list, 1):
-        print(f"\n[进度 {i}/{total}] 处理视频: {bvid}")
-        result = await fetch_and_save_danmu(bvid)
+        queue.put_nowait((i, bvid))
 
-        if result:
-            success_count += 1
-            print(f"√ 视频 {bvid} 处理成功")
-        else:
-            print(f"× 视频 {bvid} 处理失败")
+    async def worker(session):
+        nonlocal success_count
+        while True:
+            try:
+                i, bvid = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            print(f"\n[进度 {i}/{total}] 处理视频: {bvid}")
+            result = await fetch_and_save_danmu(bvid, session, mode, date_range)
+
+            if result:
+                success_count += 1
+                print(f"√ 视频 {bvid} 处理成功")
+            else:
+                print(f"× 视频 {bvid} 处理失败")
 
-        # 添加请求间隔避免触发反爬
-        if i < total:
-            delay = random.uniform(1.5, 3.5)
-            print(f"等待 {delay:.1f} 秒后继续...")
-            await asyncio.sleep(delay)
+    async with create_session(concurrency) as session:
+        workers = max(1, min(concurrency, total))
+        await asyncio.gather(*(worker(session) for _ in range(workers)))
 
     print(f"\n{'=' * 50}")
     print(f"批量处理完成! 成功: {success_count}/{total}")
     print(f"{'=' * 50}")
+    # 请求间隔由共享限速器控制，不再在视频之间固定等待
+    get_rate_limiter().print_report()
+    if get_cookie_pool() is not None:
+        get_cookie_pool().print_report()
+    get_metrics().finish_run("danmu_crawler")
 
 
 if __name__ == "__main__":
@@ -252,12 +758,18 @@ if __name__ == "__main__":
         # "BV1example789"
     ]
 
+    # 弹幕接口："seg"=分段接口，获取全部弹幕；"xml"=旧版接口，只返回最近的一部分弹幕；
+    # "history"=获取下面日期范围内发送的历史弹幕（需要登录Cookie，见 cookie_pool.py 或 .env 中的 BILI_COOKIE）
+    danmu_mode = DEFAULT_DANMU_MODE
+    history_dates = ("2025-03-24", "2025-03-31")
+
     print("B站弹幕爬取程序启动...")
 
     # 根据输入类型自动选择处理模式
     if isinstance(target_bvids, list) and len(target_bvids) > 1:
-        asyncio.run(process_multiple_bvids(target_bvids))
+        asyncio.run(process_multiple_bvids(target_bvids, mode=danmu_mode, date_range=history_dates))
     elif isinstance(target_bvids, list) and len(target_bvids) == 1:
-        asyncio.run(fetch_and_save_danmu(target_bvids[0]))
+        asyncio.run(fetch_and_save_danmu(target_bvids[0], mode=danmu_mode, date_range=history_dates))
+        get_metrics().finish_run("danmu_crawler")
     else:
         print("错误: 请输入有效的BV号列表")
\ No newline at end of file
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史弹幕缓存（SQLite）
+功能：按 CID 和日期保存历史弹幕接口（/x/v2/dm/web/history/seg.so）返回的原始 protobuf 内容，
+以及每个月有弹幕的日期列表（/x/v2/dm/history/index）。已经过去的日期和月份内容不会再变化，
+重新运行时直接从缓存读取，只请求新的日期；今天和本月的数据仍在增长，不写入缓存。
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_HISTORY_CACHE_PATH = os.path.join("B站评论数据", "danmu_history.db")
+
+
+def is_complete_day(date):
+    """
+    日期是否已经结束（之后该日期的历史弹幕不会再变化）
+    :param date: 'YYYY-MM-DD'
+    """
+    return datetime.date.fromisoformat(date) < datetime.date.today()
+
+
+def is_complete_month(month):
+    """
+    月份是否已经结束
+    :param month: 'YYYY-MM'
+    """
+    return month < datetime.date.today().strftime("%Y-%m")
+
+
+class DanmuHistoryCache:
+    """按 CID 和日期缓存历史弹幕"""
+
+    def __init__(self, path=DEFAULT_HISTORY_CACHE_PATH):
+        """
+        :param path: 缓存数据库路径
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_month (
+                    cid INTEGER,
+                    month TEXT,
+                    dates_json TEXT,
+                    fetched_at REAL,
+                    PRIMARY KEY (cid, month)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS history_day (
+                    cid INTEGER,
+                    date TEXT,
+                    content BLOB,
+                    fetched_at REAL,
+                    PRIMARY KEY (cid, date)
+                )
+            """)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_month(self, cid, month):
+        """
+        读取缓存的某月有弹幕的日期
+        :return: ['YYYY-MM-DD', ...]，未缓存时返回 None
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT dates_json FROM history_month WHERE cid = ? AND month = ?", (cid, month)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put_month(self, cid, month, dates):
+        """写入某月有弹幕的日期，本月尚未结束时不写入"""
+        if not is_complete_month(month):
+            return
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO history_month (cid, month, dates_json, fetched_at) VALUES (?, ?, ?, ?)",
+                    (cid, month, json.dumps(list(dates)), time.time())
+                )
+
+    def get_day(self, cid, date):
+        """
+        读取缓存的某天历史弹幕
+        :return: protobuf 内容，未缓存时返回 None
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content FROM history_day WHERE cid = ? AND date = ?", (cid, date)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return bytes(row[0])
+
+    def put_day(self, cid, date, content):
+        """写入某天的历史弹幕，当天尚未结束时不写入"""
+        if not is_complete_day(date):
+            return
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO history_day (cid, date, content, fetched_at) VALUES (?, ?, ?, ?)",
+                    (cid, date, sqlite3.Binary(content), time.time())
+                )
+
+    def cached_dates(self, cid):
+        """已缓存历史弹幕的日期"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT date FROM history_day WHERE cid = ? ORDER BY date", (cid,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+_shared_cache = None
+
+
+def get_danmu_history_cache():
+    """获取进程内共享的历史弹幕缓存"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = DanmuHistoryCache()
+    return _shared_cache
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+弹幕解析
+功能：用增量解析器（XMLPullParser）边下载边解析 dm/list.so 返回的弹幕XML，解析完的 <d> 元素立即释放；
+所有 p 属性拼接后一次性拆分，整列转换为 NumPy 数组（出现时间、模式、字号、颜色、发送时间、弹幕池、
+用户ID哈希、弹幕ID），发送时间保持为 datetime64，不再逐条调用 float/int/strftime。
+分段弹幕（danmu_protobuf）解析结果也整理为相同的数组和表格格式。
+"""
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+from comment_schema import to_local_datetime
+
+# p 属性中用到的前8个字段（新版接口末尾还有权重等字段，忽略）
+P_FIELDS = 8
+
+# 弹幕表格的列：前三列与原来的 (时间点, 弹幕内容, 发送时间) 一致，后面是原来丢弃的字段
+DANMU_COLUMNS = ['时间点(秒)', '弹幕内容', '发送时间', '模式', '字号', '颜色', '弹幕池', '用户哈希', '弹幕ID']
+
+
+def empty_arrays():
+    """没有弹幕时的空数组"""
+    return {
+        "time": np.empty(0, dtype=np.float64),
+        "mode": np.empty(0, dtype=np.int16),
+        "fontsize": np.empty(0, dtype=np.int16),
+        "color": np.empty(0, dtype=np.uint32),
+        "send_time": np.empty(0, dtype="datetime64[s]"),
+        "pool": np.empty(0, dtype=np.int16),
+        "user_hash": np.empty(0, dtype=object),
+        "dmid": np.empty(0, dtype=np.int64),
+        "text": np.empty(0, dtype=object),
+    }
+
+
+def _sort_by_time(arrays):
+    """按出现时间排序（稳定排序，相同时间保持原顺序）"""
+    order = np.argsort(arrays["time"], kind="stable")
+    return {key: values[order] for key, values in arrays.items()}
+
+
+def decode_p_attributes(p_values):
+    """
+    批量解码 p 属性
+    :param p_values: p 属性字符串列表
+    :return: 各字段的数组（text 以外的键，见 empty_arrays）
+    """
+    count = len(p_values)
+    if count == 0:
+        arrays = empty_arrays()
+        del arrays["text"]
+        return arrays
+
+    fields = p_values[0].count(",") + 1
+    joined = ",".join(p_values)
+    if fields >= P_FIELDS and joined.count(",") == count * fields - 1:
+        # 所有弹幕字段数相同：一次拆分后变形为二维数组
+        table = np.array(joined.split(","), dtype=object).reshape(count, fields)[:, :P_FIELDS]
+    else:
+        # 字段数不一致（新旧格式混合或字段缺失）：按列拆分，缺失的字段补0
+        table = pd.Series(p_values).str.split(",", expand=True).reindex(columns=range(P_FIELDS))
+        table = table.fillna("0").to_numpy(dtype=object)
+
+    # 对象数组整列转换数值，比先转为定长字符串数组再转换快
+    columns = table.T
+    return {
+        "time": columns[0].astype(np.float64),
+        "mode": columns[1].astype(np.int16),
+        "fontsize": columns[2].astype(np.int16),
+        "color": columns[3].astype(np.int64).astype(np.uint32),
+        "send_time": columns[4].astype(np.int64).astype("datetime64[s]"),
+        "pool": columns[5].astype(np.int16),
+        "user_hash": columns[6].copy(),
+        "dmid": columns[7].astype(np.int64),
+    }
+
+
+class DanmuXmlParser:
+    """弹幕XML增量解析器：分块喂入响应内容，结束时批量解码"""
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self._p_values = []
+        self._texts = []
+        self.bytes = 0
+        self.error = None
+
+    def _drain(self):
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+            elif elem.tag == "d":
+                p_value = elem.get("p")
+                if p_value:
+                    self._p_values.append(p_value)
+                    self._texts.append(elem.text or "")
+        # 解析完的元素立即从根节点移除，内存占用不随弹幕数增长
+        if self._root is not None:
+            self._root.clear()
+
+    def feed(self, chunk):
+        """
+        喂入一块响应内容
+        :param chunk: bytes 或 str
+        """
+        if self.error is not None:
+            return
+        self.bytes += len(chunk)
+        try:
+            self._parser.feed(chunk)
+            self._drain()
+        except ET.ParseError as e:
+            # XML格式错误（如响应被截断）时保留已解析的弹幕
+            self.error = e
+
+    def close(self):
+        """
+        结束解析
+        :return: 按出现时间排序的弹幕数组，键见 empty_arrays
+        """
+        if self.error is None:
+            try:
+                self._parser.close()
+                self._drain()
+            except ET.ParseError as e:
+                self.error = e
+        if self.error is not None:
+            print(f"弹幕XML解析不完整（{self.error}），已保留 {len(self._p_values)} 条弹幕")
+
+        arrays = decode_p_attributes(self._p_values)
+        arrays["text"] = np.array(self._texts, dtype=object)
+        return _sort_by_time(arrays)
+
+
+def parse_danmu_xml_arrays(content):
+    """
+    解析完整的弹幕XML
+    :param content: XML文本或字节
+    :return: 按出现时间排序的弹幕数组，键见 empty_arrays
+    """
+    parser = DanmuXmlParser()
+    parser.feed(content)
+    return parser.close()
+
+
+def segment_elems_to_arrays(elems):
+    """
+    分段弹幕的解析结果转换为数组，按弹幕ID去重
+    :param elems: danmu_protobuf.parse_danmu_segment 结果的合并列表
+    :return: 按出现时间排序的弹幕数组，键见 empty_arrays
+    """
+    if not elems:
+        return empty_arrays()
+    dmid, progress, mode, fontsize, color, user_hash, text, ctime, pool = (list(column) for column in zip(*elems))
+    arrays = {
+        "time": np.array(progress, dtype=np.float64) / 1000,
+        "mode": np.array(mode, dtype=np.int16),
+        "fontsize": np.array(fontsize, dtype=np.int16),
+        "color": np.array(color, dtype=np.uint32),
+        "send_time": np.array(ctime, dtype=np.int64).astype("datetime64[s]"),
+        "pool": np.array(pool, dtype=np.int16),
+        "user_hash": np.array(user_hash, dtype=object),
+        "dmid": np.array(dmid, dtype=np.int64),
+        "text": np.array(text, dtype=object),
+    }
+    _, first = np.unique(arrays["dmid"], return_index=True)
+    if len(first) < len(elems):
+        first.sort()
+        arrays = {key: values[first] for key, values in arrays.items()}
+    return _sort_by_time(arrays)
+
+
+def arrays_to_frame(arrays):
+    """
+    弹幕数组转换为表格
+    :return: 列为 DANMU_COLUMNS 的 DataFrame，发送时间为本地时间的 datetime64
+    """
+    return pd.DataFrame({
+        '时间点(秒)': arrays["time"],
+        '弹幕内容': arrays["text"],
+        '发送时间': to_local_datetime(arrays["send_time"].astype(np.int64)),
+        '模式': arrays["mode"],
+        '字号': arrays["fontsize"],
+        '颜色': arrays["color"],
+        '弹幕池': arrays["pool"],
+        '用户哈希': arrays["user_hash"],
+        '弹幕ID': arrays["dmid"],
+    }, columns=DANMU_COLUMNS)
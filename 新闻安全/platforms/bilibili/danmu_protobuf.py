@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站分段弹幕（/x/v2/dm/web/seg.so）的 protobuf 解析
+功能：按 protobuf 编码格式直接读取 DmSegMobileReply 消息，只解码需要的字段（弹幕ID、出现时间、
+模式、字号、颜色、用户ID哈希、内容、发送时间、弹幕池），其余字段按长度跳过，不需要安装 protobuf 库或生成 _pb2 文件。
+消息结构（bilibili.community.service.dm.v1）：
+    DmSegMobileReply { repeated DanmakuElem elems = 1; }
+    DanmakuElem { int64 id = 1; int32 progress = 2（毫秒）; int32 mode = 3; int32 fontsize = 4;
+                  uint32 color = 5; string midHash = 6; string content = 7; int64 ctime = 8; ...; int32 pool = 11; ... }
+"""
+
+# protobuf 编码类型
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_BYTES = 2
+WIRE_FIXED32 = 5
+
+# DanmakuElem 中用到的字段编号
+FIELD_ID = 1
+FIELD_PROGRESS = 2
+FIELD_MODE = 3
+FIELD_FONTSIZE = 4
+FIELD_COLOR = 5
+FIELD_MID_HASH = 6
+FIELD_CONTENT = 7
+FIELD_CTIME = 8
+FIELD_POOL = 11
+
+# 数值字段在解析结果元组中的位置
+_VARINT_SLOTS = {FIELD_ID: 0, FIELD_PROGRESS: 1, FIELD_MODE: 2, FIELD_FONTSIZE: 3, FIELD_COLOR: 4,
+                 FIELD_CTIME: 7, FIELD_POOL: 8}
+
+
+def _read_varint(buf, pos):
+    """
+    读取一个 varint
+    :return: (数值, 下一个字段的位置)
+    """
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = byte & 0x7F
+    shift = 7
+    pos += 1
+    while True:
+        byte = buf[pos]
+        result |= (byte & 0x7F) << shift
+        pos += 1
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _skip(buf, pos, wire_type):
+    """跳过一个不需要的字段值，返回下一个字段的位置"""
+    if wire_type == WIRE_VARINT:
+        return _read_varint(buf, pos)[1]
+    if wire_type == WIRE_BYTES:
+        length, pos = _read_varint(buf, pos)
+        return pos + length
+    if wire_type == WIRE_FIXED64:
+        return pos + 8
+    if wire_type == WIRE_FIXED32:
+        return pos + 4
+    raise ValueError(f"不支持的protobuf编码类型: {wire_type}")
+
+
+def _parse_elem(buf, pos, end):
+    """
+    解析一条 DanmakuElem
+    :return: (弹幕ID, 出现时间(毫秒), 模式, 字号, 颜色, 用户ID哈希, 内容, 发送时间戳, 弹幕池)
+    """
+    values = [0, 0, 0, 0, 0, "", "", 0, 0]
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == WIRE_VARINT and field in _VARINT_SLOTS:
+            values[_VARINT_SLOTS[field]], pos = _read_varint(buf, pos)
+        elif wire_type == WIRE_BYTES and field in (FIELD_CONTENT, FIELD_MID_HASH):
+            length, pos = _read_varint(buf, pos)
+            values[6 if field == FIELD_CONTENT else 5] = buf[pos:pos + length].decode("utf-8", errors="replace")
+            pos += length
+        else:
+            pos = _skip(buf, pos, wire_type)
+    return tuple(values)
+
+
+def parse_danmu_segment(content):
+    """
+    解析一个弹幕分段
+    :param content: seg.so 返回的二进制内容（空内容表示该分段没有弹幕）
+    :return: [(弹幕ID, 出现时间(毫秒), 模式, 字号, 颜色, 用户ID哈希, 内容, 发送时间戳, 弹幕池), ...]，按服务器返回顺序
+    """
+    buf = bytes(content or b"")
+    elems = []
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if field == 1 and wire_type == WIRE_BYTES:
+            length, pos = _read_varint(buf, pos)
+            elems.append(_parse_elem(buf, pos, pos + length))
+            pos += length
+        else:
+            pos = _skip(buf, pos, wire_type)
+    return elems
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def encode_danmu_segment(elems):
+    """
+    按 DmSegMobileReply 格式编码弹幕（供模拟服务器使用）
+    :param elems: [(弹幕ID, 出现时间(毫秒), 模式, 字号, 颜色, 用户ID哈希, 内容, 发送时间戳, 弹幕池), ...]
+    """
+    out = bytearray()
+    for dmid, progress, mode, fontsize, color, mid_hash, content, ctime, pool in elems:
+        elem = bytearray()
+        for field, value in ((FIELD_ID, dmid), (FIELD_PROGRESS, progress), (FIELD_MODE, mode),
+                             (FIELD_FONTSIZE, fontsize), (FIELD_COLOR, color)):
+            elem += _encode_varint(field << 3 | WIRE_VARINT) + _encode_varint(value)
+        for field, text in ((FIELD_MID_HASH, mid_hash), (FIELD_CONTENT, content)):
+            data = text.encode("utf-8")
+            elem += _encode_varint(field << 3 | WIRE_BYTES) + _encode_varint(len(data)) + data
+        for field, value in ((FIELD_CTIME, ctime), (FIELD_POOL, pool)):
+            elem += _encode_varint(field << 3 | WIRE_VARINT) + _encode_varint(value)
+        out += _encode_varint(1 << 3 | WIRE_BYTES) + _encode_varint(len(elem)) + elem
+    return bytes(out)
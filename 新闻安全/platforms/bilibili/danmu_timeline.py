@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+弹幕时间轴分析
+功能：用 NumPy 按秒统计弹幕数量（bincount），计算滑动窗口内的弹幕密度和 z 分数，
+把密度明显高于平均水平的连续时间段合并为“弹幕爆发”，按峰值排序输出高光时刻索引
+（开始/结束秒数、弹幕数和出现最多的代表弹幕）。全部按整列计算，几百万条弹幕也不需要逐条处理。
+使用方法: python danmu_timeline.py danmu_<BV号>.xlsx [高光时刻数量]
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 滑动密度的窗口长度（秒）
+HIGHLIGHT_WINDOW = 10
+# z 分数超过该值的秒视为弹幕爆发
+HIGHLIGHT_THRESHOLD = 2.0
+# 默认输出的高光时刻数量
+HIGHLIGHT_TOP = 10
+
+HIGHLIGHT_COLUMNS = ['排名', '开始(秒)', '结束(秒)', '开始时间', '峰值秒', '弹幕数', '峰值密度(条/秒)', 'z分数',
+                     '代表弹幕', '代表弹幕条数']
+
+
+def format_time(total_seconds):
+    """将秒数格式化为 '时:分:秒' 形式（小数部分舍去）"""
+    total_seconds = int(total_seconds)
+    hours, rest = divmod(total_seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def to_seconds(times):
+    """
+    把出现时间（秒，浮点数）转换为整数秒
+    :return: int64 数组，负数按0处理
+    """
+    seconds = np.floor(np.asarray(times, dtype=np.float64)).astype(np.int64)
+    return np.maximum(seconds, 0)
+
+
+def per_second_counts(seconds, length=None):
+    """
+    每秒弹幕数
+    :param seconds: to_seconds 的结果
+    :param length: 至少统计到的秒数（例如视频时长），不足时补0
+    :return: 下标为秒的计数数组
+    """
+    return np.bincount(seconds, minlength=length or 0)
+
+
+def second_labels(counts):
+    """
+    每一秒的显示文字 '时:分:秒 (共N条)'，只对出现过的秒数格式化一次，按整数秒下标取用
+    :return: 与 counts 等长的对象数组
+    """
+    labels = np.empty(len(counts), dtype=object)
+    for second in np.flatnonzero(counts):
+        labels[second] = f"{format_time(second)} (共{counts[second]}条)"
+    return labels
+
+
+def rolling_density(counts, window=HIGHLIGHT_WINDOW):
+    """
+    以每一秒为中心的滑动平均弹幕密度（条/秒）
+    :param window: 窗口长度（秒）
+    """
+    if len(counts) == 0:
+        return np.zeros(0)
+    window = max(1, min(int(window), len(counts)))
+    cumulative = np.concatenate(([0], np.cumsum(counts, dtype=np.float64)))
+    index = np.arange(len(counts))
+    start = np.clip(index - window // 2, 0, len(counts))
+    end = np.clip(start + window, 0, len(counts))
+    start = np.maximum(end - window, 0)
+    return (cumulative[end] - cumulative[start]) / window
+
+
+def zscore(values):
+    """z 分数，方差为0时全部为0"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    std = values.std()
+    if std == 0:
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+def find_bursts(density, threshold=HIGHLIGHT_THRESHOLD, window=HIGHLIGHT_WINDOW):
+    """
+    找出 z 分数超过阈值的连续时间段，每段向两侧扩展到滑动窗口覆盖的范围（相距不到一个窗口的段合并）
+    :return: (开始秒数数组, 结束秒数数组(含), z 分数数组)
+    """
+    scores = zscore(density)
+    spikes = rolling_density(scores >= threshold, window) > 0
+    if not spikes.any():
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, scores
+    edges = np.diff(np.concatenate(([0], spikes.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return starts, ends, scores
+
+
+def representative_danmu(texts):
+    """
+    出现次数最多的弹幕（去掉首尾空白后比较，次数相同时取最早出现的）
+    :return: (弹幕内容, 条数)
+    """
+    if len(texts) == 0:
+        return "", 0
+    counts = pd.Series(texts, dtype=object).astype(str).str.strip().value_counts(sort=False)
+    return counts.idxmax(), int(counts.max())
+
+
+def find_highlights(times, texts, top=HIGHLIGHT_TOP, window=HIGHLIGHT_WINDOW, threshold=HIGHLIGHT_THRESHOLD):
+    """
+    高光时刻索引
+    :param times: 弹幕出现时间（秒）
+    :param texts: 弹幕内容，与 times 等长
+    :param top: 输出的高光时刻数量
+    :param window: 滑动密度的窗口长度（秒）
+    :param threshold: z 分数阈值
+    :return: 列为 HIGHLIGHT_COLUMNS 的 DataFrame，按峰值密度从高到低排列
+    """
+    seconds = to_seconds(times)
+    if len(seconds) == 0:
+        return pd.DataFrame(columns=HIGHLIGHT_COLUMNS)
+    counts = per_second_counts(seconds)
+    density = rolling_density(counts, window)
+    starts, ends, scores = find_bursts(density, threshold, window)
+    if len(starts) == 0:
+        return pd.DataFrame(columns=HIGHLIGHT_COLUMNS)
+
+    # 每个爆发段的峰值：段内密度最大的秒
+    peaks = np.array([start + np.argmax(density[start:end + 1]) for start, end in zip(starts, ends)])
+    order = np.argsort(-density[peaks], kind="stable")[:top]
+
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    texts = np.asarray(texts, dtype=object)
+    rows = []
+    for rank, i in enumerate(order, 1):
+        start, end, peak = int(starts[i]), int(ends[i]), int(peaks[i])
+        text, text_count = representative_danmu(texts[(seconds >= start) & (seconds <= end)])
+        rows.append({
+            '排名': rank,
+            '开始(秒)': start,
+            '结束(秒)': end + 1,
+            '开始时间': format_time(start),
+            '峰值秒': peak,
+            '弹幕数': int(cumulative[end + 1] - cumulative[start]),
+            '峰值密度(条/秒)': round(float(density[peak]), 2),
+            'z分数': round(float(scores[peak]), 2),
+            '代表弹幕': text,
+            '代表弹幕条数': text_count,
+        })
+    return pd.DataFrame(rows, columns=HIGHLIGHT_COLUMNS)
+
+
+def build_timeline(times, window=HIGHLIGHT_WINDOW):
+    """
+    逐秒的弹幕时间轴
+    :return: DataFrame，列为 秒、时间、弹幕数、滑动密度、z分数
+    """
+    counts = per_second_counts(to_seconds(times))
+    density = rolling_density(counts, window)
+    return pd.DataFrame({
+        '秒': np.arange(len(counts)),
+        '时间': [format_time(second) for second in range(len(counts))],
+        '弹幕数': counts,
+        '滑动密度': density.round(3),
+        'z分数': zscore(density).round(3),
+    })
+
+
+def print_highlights(highlights):
+    """打印高光时刻"""
+    if highlights.empty:
+        print("没有明显的弹幕爆发时段")
+        return
+    print(f"\n高光时刻（前 {len(highlights)} 个）:")
+    for _, row in highlights.iterrows():
+        prefix = f"P{row['分P']} " if '分P' in highlights.columns else ""
+        print(f"  {row['排名']:>2}. {prefix}{row['开始时间']} ({row['开始(秒)']}-{row['结束(秒)']}秒) "
+              f"弹幕 {row['弹幕数']} 条, 峰值 {row['峰值密度(条/秒)']} 条/秒, "
+              f"代表弹幕: {row['代表弹幕']} (x{row['代表弹幕条数']})")
+
+
+def main():
+    """读取 danmu_crawler 保存的弹幕Excel，输出高光时刻"""
+    if len(sys.argv) < 2:
+        print("使用方法: python danmu_timeline.py danmu_<BV号>.xlsx [高光时刻数量]")
+        return
+    excel_file = sys.argv[1]
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else HIGHLIGHT_TOP
+    if not os.path.exists(excel_file):
+        print(f"错误: 文件不存在: {excel_file}")
+        return
+
+    df = pd.read_excel(excel_file)
+    if '分P' not in df.columns:
+        df['分P'] = 1
+    frames = []
+    for page, part in df.groupby('分P', sort=True):
+        highlights = find_highlights(part['时间点(秒)'].to_numpy(), part['弹幕内容'].to_numpy(), top)
+        highlights.insert(0, '分P', page)
+        frames.append(highlights)
+    highlights = pd.concat(frames, ignore_index=True)
+    print_highlights(highlights)
+
+    output = os.path.splitext(excel_file)[0] + "_高光时刻.xlsx"
+    highlights.to_excel(output, index=False)
+    print(f"\n高光时刻已保存至: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,6 @@
 import csv
 import os
 import sys
-import time
 import pandas as pd
 from pathlib import Path
 import importlib.util
@@ -16,6 +15,15 @@ from io import StringIO
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
+# 添加当前目录到Python路径，以便在进程内调用评论抓取引擎
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_comments_crawler import crawl_comments
+from crawl_scheduler import plan_crawl, print_plan
+from rpid_index import RpidIndex
+
+# 评论Excel文件的保存目录
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "B站评论数据")
 
 
 def get_bilibili_cookie():
@@ -69,24 +77,19 @@ def extract_bv_numbers(csv_file_path):
         print(f"读取CSV文件时出错: {e}")
         return []
 
-def crawl_comments_for_bv(bv_number):
+def crawl_comments_for_bv(bv_number, cookie=None):
     """为单个BV号爬取评论"""
     try:
         print(f"正在爬取BV号 {bv_number} 的评论...")
-        
-        # 使用subprocess调用自动爬虫
-        import subprocess
-        import sys
-        
-        crawler_path = os.path.join(os.path.dirname(__file__), "auto_comments_crawler.py")
-        result = subprocess.run([sys.executable, crawler_path, bv_number], 
-                              capture_output=True, text=True, encoding='utf-8')
-        
-        if result.returncode == 0:
+        if cookie is None:
+            cookie = get_bilibili_cookie()
+        results = crawl_comments([bv_number], cookie=cookie, output_dir=OUTPUT_DIR)
+
+        if results and results[0].get("path"):
             print(f"成功爬取BV号 {bv_number} 的评论")
             return True
         else:
-            print(f"爬取BV号 {bv_number} 的评论时出错: {result.stderr}")
+            print(f"爬取BV号 {bv_number} 的评论失败")
             return False
             
     except Exception as e:
@@ -96,7 +99,7 @@ def crawl_comments_for_bv(bv_number):
 def find_generated_files():
     """查找生成的评论文件"""
     try:
-        output_dir = os.path.join(os.path.dirname(__file__), "B站评论数据")
+        output_dir = OUTPUT_DIR
         if not os.path.exists(output_dir):
             print("未找到评论数据目录")
             return []
@@ -128,15 +131,19 @@ def merge_comment_files(final_output="final_up_comments.xlsx"):
             
         print(f"找到 {len(excel_files)} 个评论文件")
         
-        # 读取所有Excel文件并合并
+        # 读取所有Excel文件并合并，同一条评论（评论ID相同）只保留一次
         all_data = []
+        seen = RpidIndex(None, capacity=1000000)
+        duplicates = 0
         for excel_file in excel_files:
             try:
                 df = pd.read_excel(excel_file)
                 # 添加视频BV号列
                 bv_number = os.path.basename(excel_file).split("】")[0].split("【")[1]
                 df['来源视频BV号'] = bv_number
-                all_data.append(df)
+                deduped = seen.drop_seen(df, record=True)
+                duplicates += len(df) - len(deduped)
+                all_data.append(deduped)
                 print(f"已读取: {os.path.basename(excel_file)} ({len(df)} 条记录)")
             except Exception as e:
                 print(f"读取文件 {excel_file} 时出错: {e}")
@@ -147,6 +154,8 @@ def merge_comment_files(final_output="final_up_comments.xlsx"):
             
         # 合并所有数据
         combined_df = pd.concat(all_data, ignore_index=True)
+        if duplicates:
+            print(f"已去除 {duplicates} 条重复评论")
         print(f"合并后总共有 {len(combined_df)} 条评论")
         
         # 保存到Excel文件
@@ -173,34 +182,33 @@ def main():
         print(f"错误: CSV文件不存在: {csv_file_path}")
         return
     
-    # 提取BV号
-    bv_numbers = extract_bv_numbers(csv_file_path)
+    # 提取BV号，按每个请求能获得的评论数和播放量排列抓取顺序，中途中断时已抓取的是最重要的视频
+    print(f"正在读取CSV文件: {csv_file_path}")
+    plan = plan_crawl(csv_file_path)
+    bv_numbers = plan['BV号'].tolist() if not plan.empty else []
     
     if not bv_numbers:
         print("未能提取到任何BV号，程序退出")
         return
     
+    print_plan(plan)
     print(f"\n开始处理 {len(bv_numbers)} 个视频的评论爬取任务")
     
-    # 爬取每个BV号的评论
+    # 在同一进程内并发爬取全部视频的评论，共享连接池、限速器和检查点
+    cookie = get_bilibili_cookie()
+    try:
+        results = crawl_comments(bv_numbers, cookie=cookie, output_dir=OUTPUT_DIR)
+    except Exception as e:
+        print(f"批量爬取评论时出错: {e}")
+        results = []
+
     success_count = 0
     failed_bv = []
-    
-    for i, bv_number in enumerate(bv_numbers, 1):
-        print(f"\n[{i}/{len(bv_numbers)}] 处理BV号: {bv_number}")
-        
-        # 爬取评论
-        if crawl_comments_for_bv(bv_number):
+    for result in results:
+        if result.get("path"):
             success_count += 1
-            print(f"✓ 成功爬取 {bv_number} 的评论")
         else:
-            failed_bv.append(bv_number)
-            print(f"✗ 爬取 {bv_number} 的评论失败")
-        
-        # 添加延迟避免请求过快
-        if i < len(bv_numbers):
-            print("等待3秒后继续...")
-            time.sleep(3)
+            failed_bv.append(result["bvid"])
     
     # 输出统计结果
     print("\n" + "=" * 60)
@@ -1,6 +1,5 @@
 import os
 import time
-import json
 import random
 import csv
 import re
@@ -13,6 +12,13 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from selenium.webdriver.chrome.service import Service
+import sys
+
+# 添加当前目录到Python路径，以便复用异步抓取引擎批量获取统计数据
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_comments_crawler import fetch_bvids_stats
+from crawler_metrics import get_metrics
 
 # ============== 全局配置 ==============
 DEBUG_MODE = True
@@ -109,22 +115,6 @@ def load_cookies(driver):
         return False
 
 
-# ============== 数据清洗函数 ==============
-def clean_number(text):
-    if not text or text == "未知":
-        return "0"
-    try:
-        if "万" in text:
-            num_match = re.search(r'(\d+\.?\d*)万', text)
-            if num_match:
-                num = float(num_match.group(1)) * 10000
-                return str(int(num))
-        num_match = re.search(r'\d+', text)
-        return num_match.group(0) if num_match else "0"
-    except:
-        return "0"
-
-
 # ============== URL获取增强方法 ==============
 def get_video_url(item, driver, debug_idx=None):
     """多重方法获取视频URL"""
@@ -189,266 +179,73 @@ def get_video_url(item, driver, debug_idx=None):
     return None
 
 
-# ============== 通过API获取统计数据 ==============
-def get_video_stats_by_api(href, driver):
-    """通过B站API获取视频统计数据"""
-    stats = {
-        "播放量": "0", "弹幕数": "0", "点赞数": "0",
-        "投币数": "0", "收藏量": "0", "转发数": "0", "评论数": "0",
-        "发布时间": ""  # 新增字段，用于存储精确时间
-    }
-
-    try:
-        # 从URL中提取bv_id
-        bv_match = re.search(r'video/(BV\w+)', href)
-        if not bv_match: return stats
-
-        # 构建API URL
-        api_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bv_match.group(1)}"
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🌐 访问视频统计API: {api_url}")
-
-        # 使用临时标签页访问API
-        original_window = driver.current_window_handle
-        driver.execute_script("window.open('');")
-        driver.switch_to.window(driver.window_handles[-1])
-
-        driver.get(api_url)
-
-        # 等待响应加载
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "pre"))
-            )
-
-            # 解析JSON响应
-            pre_element = driver.find_element(By.TAG_NAME, "pre")
-            api_data = json.loads(pre_element.text)
-
-            # 提取统计数据
-            if api_data.get("code") == 0 and api_data.get("data"):
-                data = api_data["data"]
-                stat = data.get("stat", {})
-
-                # 提取精确发布时间
-                pubdate_timestamp = data.get("pubdate")
-                if pubdate_timestamp:
-                    pubdate_dt = datetime.fromtimestamp(pubdate_timestamp)
-                    stats["发布时间"] = pubdate_dt.strftime("%Y-%m-%d %H:%M:%S")
-
-                # 更新统计数据
-                stats.update({
-                    "播放量": str(stat.get("view", "0")),
-                    "弹幕数": str(stat.get("danmaku", "0")),
-                    "点赞数": str(stat.get("like", "0")),
-                    "投币数": str(stat.get("coin", "0")),
-                    "收藏量": str(stat.get("favorite", "0")),
-                    "转发数": str(stat.get("share", "0")),
-                    "评论数": str(stat.get("reply", "0"))
-                })
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ API视频统计数据获取成功")
-            else:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ API返回错误: {api_data.get('message')}")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ API数据处理失败: {str(e)}")
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ API访问失败: {str(e)}")
-    finally:
-        # 关闭API标签页并切换回原窗口
-        if len(driver.window_handles) > 1 and driver.current_window_handle != original_window:
-            driver.close()
-            driver.switch_to.window(original_window)
-
-        return stats
-
-
-def get_comments_by_api(href, driver):
-    """通过API获取评论数"""
+# ============== 通过HTTP批量获取统计数据 ==============
+def fill_stats_from_view(stats, data):
+    """用 view 接口数据（或视频元数据缓存）中的 stat 和 pubdate 填充统计字段"""
+    stat = data.get("stat", {})
+
+    # 提取精确发布时间
+    pubdate_timestamp = data.get("pubdate")
+    if pubdate_timestamp:
+        pubdate_dt = datetime.fromtimestamp(pubdate_timestamp)
+        stats["发布时间"] = pubdate_dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    # 更新统计数据
+    stats.update({
+        "播放量": str(stat.get("view", "0")),
+        "弹幕数": str(stat.get("danmaku", "0")),
+        "点赞数": str(stat.get("like", "0")),
+        "投币数": str(stat.get("coin", "0")),
+        "收藏量": str(stat.get("favorite", "0")),
+        "转发数": str(stat.get("share", "0")),
+        "评论数": str(stat.get("reply", "0"))
+    })
+    return stats
+
+
+def get_driver_cookie(driver):
+    """把浏览器中已登录的Cookie转换为请求头使用的Cookie字符串"""
     try:
-        # 从URL中提取bv_id
-        bv_match = re.search(r'video/(BV\w+)', href)
-        if not bv_match:
-            return "0"
-        bv_id = bv_match.group(1)
-
-        # 构建API URL
-        api_url = f"https://api.bilibili.com/x/v2/reply/main?type=1&oid={bv_id}&sort=0"
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🌐 访问评论API: {api_url}")
-
-        # 使用临时标签页访问API
-        original_window = driver.current_window_handle
-        driver.execute_script("window.open('');")
-        driver.switch_to.window(driver.window_handles[-1])
-
-        driver.get(api_url)
-
-        # 等待响应加载
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "pre"))
-            )
-
-            # 解析JSON响应
-            pre_element = driver.find_element(By.TAG_NAME, "pre")
-            api_data = json.loads(pre_element.text)
-
-            # 提取评论数
-            if api_data.get("code") == 0 and api_data.get("data"):
-                count = str(api_data["data"].get("cursor", {}).get("all_count", "0"))
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ API评论数获取成功: {count}")
-                return count
-            else:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ API返回错误: {api_data.get('message')}")
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ API数据处理失败: {str(e)}")
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ API访问失败: {str(e)}")
-    finally:
-        # 关闭API标签页并切换回原窗口
-        if len(driver.window_handles) > 1 and driver.current_window_handle != original_window:
-            driver.close()
-            driver.switch_to.window(original_window)
-
-        return "0"
-
-
-# ============== 详情页数据采集 ==============
-def get_video_details(href, driver):
-    """获取视频详情数据"""
-    details = {
-        "播放量": "0", "弹幕数": "0", "点赞数": "0",
-        "投币数": "0", "收藏量": "0", "转发数": "0", "评论数": "0",
-        "发布时间": ""  # 新增字段，用于存储精确时间
-    }
-
-    if not COLLECT_DETAILED_STATS or not href or href == "未知":
-        return details
-
-    # 优先使用API获取数据
-    api_stats = get_video_stats_by_api(href, driver)
-    if any(value != "0" for value in api_stats.values()):
-        details = api_stats
-        return details
-
-    # API失败时使用页面解析方法
-    original_window = driver.current_window_handle
-    try:
-        # 打开新标签页
-        driver.execute_script("window.open('');")
-        driver.switch_to.window(driver.window_handles[-1])
-
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🌐 访问视频详情页: {href[:60]}...")
-        driver.get(href)
-
-        # 等待页面基本加载
-        WebDriverWait(driver, 30).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 详情页框架已加载")
-
-        # 1. 获取精确发布时间
-        try:
-            # 方法1：通过meta标签获取
-            pubdate_element = driver.find_element(By.CSS_SELECTOR, "meta[itemprop='datePublished']")
-            pubdate_str = pubdate_element.get_attribute("content")
-            if pubdate_str:
-                # 转换格式：2025-03-24T12:34:56+08:00 -> 2025-03-24 12:34:56
-                pubdate_str = pubdate_str.replace("T", " ").split("+")[0]
-                details["发布时间"] = pubdate_str
-        except:
-            try:
-                # 方法2：通过发布时间元素获取
-                pubdate_element = driver.find_element(By.CSS_SELECTOR,
-                                                      ".video-info .video-info-detail .video-info-ctime")
-                pubdate_str = pubdate_element.text.strip()
-                if pubdate_str:
-                    details["发布时间"] = pubdate_str
-            except:
-                pass
-
-        # 2. 播放量
-        try:
-            play_element = driver.find_element(By.CSS_SELECTOR, ".view-text, .video-info-views .item")
-            details["播放量"] = clean_number(play_element.text.strip())
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 播放量提取失败: {str(e)}")
-
-        # 3. 弹幕数
-        try:
-            danmaku_element = driver.find_element(By.CSS_SELECTOR, ".dm-text, .video-info-danmaku .item")
-            details["弹幕数"] = clean_number(danmaku_element.text.strip())
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 弹幕数提取失败: {str(e)}")
-
-        # 4. 点赞数
-        try:
-            like_element = driver.find_element(By.CSS_SELECTOR, ".video-like-info, .ops .like")
-            details["点赞数"] = clean_number(like_element.text.strip())
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 点赞数提取失败: {str(e)}")
-
-        # 5. 投币数
-        try:
-            coin_element = driver.find_element(By.CSS_SELECTOR, ".video-coin-info, .ops .coin")
-            details["投币数"] = clean_number(coin_element.text.strip())
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 投币数提取失败: {str(e)}")
-
-        # 6. 收藏量
-        try:
-            collect_element = driver.find_element(By.CSS_SELECTOR, ".video-fav-info, .ops .collect")
-            details["收藏量"] = clean_number(collect_element.text.strip())
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 收藏量提取失败: {str(e)}")
-
-        # 7. 转发数 - 三重方法获取
-        try:
-            # 方法1：用户提供的精确XPath
-            share_element = driver.find_element(By.XPATH,
-                                                "/html/body/div[2]/div[2]/div[1]/div[3]/div[1]/div/div[4]/div/span/div[2]/div/span")
-            details["转发数"] = clean_number(share_element.text.strip())
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 转发数（方法1）获取成功")
-        except Exception as e1:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 转发数方法1失败: {str(e1)}")
-            try:
-                # 方法2：相对定位方法
-                share_element = driver.find_element(By.CSS_SELECTOR,
-                                                    "div.tool-bar div:nth-child(4) .share-num, .ops .share")
-                details["转发数"] = clean_number(share_element.text.strip())
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 转发数（方法2）获取成功")
-            except Exception as e2:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 转发数方法2失败: {str(e2)}")
-                try:
-                    # 方法3：文本内容定位
-                    share_element = driver.find_element(By.XPATH,
-                                                        "//span[contains(text(),'转发')]/following-sibling::span")
-                    details["转发数"] = clean_number(share_element.text.strip())
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 转发数（方法3）获取成功")
-                except Exception as e3:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 所有转发数方法失败")
-
-        # 8. 评论数 - 通过API获取
-        details["评论数"] = get_comments_by_api(href, driver)
-
-        # 打印获取的数据
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 获取详情数据: "
-              f"播放={details['播放量']} "
-              f"弹幕={details['弹幕数']} "
-              f"点赞={details['点赞数']} "
-              f"投币={details['投币数']} "
-              f"收藏={details['收藏量']} "
-              f"转发={details['转发数']} "
-              f"评论={details['评论数']}")
-
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 获取详情数据失败: {str(e)}")
-    finally:
-        # 关闭详情页标签
-        if len(driver.window_handles) > 1 and driver.current_window_handle != original_window:
-            driver.close()
-            driver.switch_to.window(original_window)
-        time.sleep(1)
+        return "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in driver.get_cookies())
+    except WebDriverException as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 读取浏览器Cookie失败: {str(e)}")
+        return ""
+
+
+def collect_video_stats(videos, cookie=""):
+    """
+    批量获取视频统计数据
+    浏览器只负责从搜索结果中收集BV号，统计数据由 async_comments_crawler 在同一个连接池上并发请求
+    /x/web-interface/view 获取（受共享限速器控制，未过期的统计数据直接使用视频元数据缓存），
+    不再为每个视频打开API标签页或详情页
+    :param videos: search_bilibili 返回的视频列表，直接在其中填入统计字段
+    :param cookie: 浏览器中已登录的Cookie（见 get_driver_cookie）
+    :return: 成功获取统计数据的视频数
+    """
+    bvids = [video["BV号"] for video in videos if video.get("BV号", "未知") != "未知"]
+    if not bvids:
+        return 0
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🌐 并发获取 {len(set(bvids))} 个视频的统计数据...")
+    request_start = time.time()
+    infos = fetch_bvids_stats(bvids, cookie=cookie)
+
+    success = 0
+    for video in videos:
+        info = infos.get(video.get("BV号"))
+        stats = {
+            "播放量": "0", "弹幕数": "0", "点赞数": "0",
+            "投币数": "0", "收藏量": "0", "转发数": "0", "评论数": "0"
+        }
+        if info is not None:
+            # 发布时间使用接口返回的精确时间
+            fill_stats_from_view(stats, info)
+            success += 1
+        video.update(stats)
 
-    return details
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 统计数据获取完成: "
+          f"成功 {success}/{len(videos)}, 耗时 {time.time() - request_start:.1f}秒")
+    return success
 
 
 # ============== 错误处理函数 ==============
@@ -485,20 +282,17 @@ def extract_video_info_with_retry(item, driver, keyword, idx, max_retries=MAX_RE
             print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔄 尝试 #{attempt} 提取视频 {idx + 1}")
             result = extract_video_info(item, driver, keyword, idx)
             if result:
-                # 检查是否包含发布时间
-                if not result.get("发布时间"):
-                    # 如果没有发布时间，尝试从详情页获取
-                    href = result.get("URL")
-                    if href and href != "未知":
-                        details = get_video_details(href, driver)
-                        if details.get("发布时间"):
-                            result["发布时间"] = details["发布时间"]
+                # 发布时间和统计数据在全部搜索完成后由 collect_video_stats 批量补全
+                get_metrics().record_rows(1, "videos")
                 return result
         except Exception as e:
             # 使用统一错误处理
             action = handle_extraction_error(e, item, driver, keyword, idx)
 
             # 根据错误处理建议执行相应操作
+            if action in ("retry", "wait_and_retry"):
+                get_metrics().record_retry("extract_video_info")
+
             if action == "retry":
                 # 立即重试
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔄 立即重试...")
@@ -598,13 +392,6 @@ def extract_video_info(item, driver, keyword, idx):
             "UP主": up_name
         }
 
-        # 获取详细统计数据
-        if COLLECT_DETAILED_STATS and href and href != "未知":
-            details = get_video_details(href, driver)
-            video_data.update(details)
-        else:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 跳过详情页采集，URL无效")
-
         return video_data
     except Exception as e:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 视频信息提取失败: {str(e)}")
@@ -640,6 +427,7 @@ def search_bilibili(keyword, driver, max_results=RESULTS_PER_KEYWORD):
 
             # 访问搜索页
             print(f"[{datetime.now().strftime('%H:%M:%S')}] 🌐 访问搜索页: {search_url[:80]}...")
+            request_start = time.perf_counter()
             driver.get(search_url)
 
             # 等待结果加载
@@ -647,7 +435,9 @@ def search_bilibili(keyword, driver, max_results=RESULTS_PER_KEYWORD):
                 WebDriverWait(driver, 30).until(
                     EC.visibility_of_element_located((By.CSS_SELECTOR, ".bili-video-card"))
                 )
+                get_metrics().observe_request(search_url, time.perf_counter() - request_start)
             except TimeoutException:
+                get_metrics().observe_request(search_url, time.perf_counter() - request_start, "timeout")
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 页面加载超时，继续下一页")
                 continue
 
@@ -688,9 +478,6 @@ def search_bilibili(keyword, driver, max_results=RESULTS_PER_KEYWORD):
                             f"[{datetime.now().strftime('%H:%M:%S')}] 🎬 已获取视频 {current_count}/{max_results}: {result['标题'][:20]}...")
                     else:
                         print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 视频 {i + 1} 提取失败")
-
-                    # 随机延迟
-                    time.sleep(random.uniform(1.0, 3.0))
                 except Exception as e:
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠ 处理视频失败: {str(e)}")
 
@@ -777,6 +564,9 @@ def main():
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ 登录验证失败，退出程序")
                 return
 
+        # 统计数据通过HTTP请求获取，复用浏览器中已登录的Cookie
+        cookie = get_driver_cookie(driver)
+
         all_data = []
         for keyword in KEYWORDS:
             print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 🔍 开始处理关键词: {keyword}")
@@ -785,6 +575,9 @@ def main():
                 all_data.extend(data)
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 关键词 '{keyword}' 获取到 {len(data)} 条视频数据")
 
+        if all_data and COLLECT_DETAILED_STATS:
+            collect_video_stats(all_data, cookie)
+
         if all_data:
             save_to_csv(all_data, f"bilibili_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
 
@@ -803,6 +596,7 @@ def main():
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] 🚫 浏览器已关闭")
             except:
                 pass
+        get_metrics().finish_run("interaction_data")
 
 
 if __name__ == "__main__":
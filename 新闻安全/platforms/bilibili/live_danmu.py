@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站直播弹幕实时采集
+功能：连接直播间的弹幕 WebSocket（wss://<host>/sub），按B站直播协议收发数据包：
+每个包有16字节包头（包长度、包头长度、协议版本、操作码、序号），操作码5的消息包可能是
+zlib（协议版本2）或 brotli（协议版本3）压缩的多个子包。只对 DANMU_MSG 消息解析JSON，
+其他消息（进场、礼物等）按前缀跳过。解析出的弹幕攒成批次放入有界队列，由写出任务在线程池中
+写入列式文件（Parquet，未安装 pyarrow 时可改用 CSV/JSONL/SQLite，见 comment_sinks.py）；
+写出跟不上时接收端等待队列空出，内存占用有上限。
+可选把收到的原始帧保存下来（record_path），之后用 mock_live_server.py 回放测试。
+brotli 为可选依赖：未安装时向服务器请求 zlib 压缩（协议版本2）。
+使用方法: python live_danmu.py <直播间号> [采集秒数]
+"""
+
+import asyncio
+import base64
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径，以便导入限速器、指标和写出模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from comment_schema import to_local_datetime
+from comment_sinks import open_sink
+from crawler_metrics import get_metrics
+from danmu_crawler import get_random_user_agent, load_env_cookie
+from live_protocol import (OP_AUTH, OP_AUTH_REPLY, OP_HEARTBEAT, OP_HEARTBEAT_REPLY, OP_MESSAGE, PROTO_BROTLI,
+                           PROTO_ZLIB, brotli_module, decode_frame, encode_packet)
+from rate_limiter import get_rate_limiter
+
+# 直播API地址，可通过环境变量 BILI_LIVE_API_BASE 指向本地模拟服务器（见 mock_live_server.py）
+LIVE_API_BASE = os.environ.get("BILI_LIVE_API_BASE", "https://api.live.bilibili.com").rstrip("/")
+ROOM_INIT_PATH = "/room/v1/Room/room_init"
+DANMU_INFO_PATH = "/xlive/web-room/v1/index/getDanmuInfo"
+DEFAULT_LIVE_DIR = "B站直播弹幕"
+
+# 心跳间隔（秒），服务器约70秒收不到心跳会断开连接
+HEARTBEAT_INTERVAL = 30
+# 每批写出的弹幕条数
+BATCH_SIZE = 2000
+# 弹幕不足一批时，最多等待多少秒写出
+FLUSH_INTERVAL = 1.0
+# 队列中最多积压的批次数
+QUEUE_BATCHES = 16
+# 判断是否为弹幕消息时只检查消息开头的这么多字节
+DANMU_PREFIX_BYTES = 64
+
+LIVE_DANMU_COLUMNS = ['接收时间', '发送时间', '房间号', '用户ID', '用户名', '弹幕内容', '模式', '字号', '颜色',
+                      '用户等级', '粉丝牌', '粉丝牌等级']
+
+
+def parse_danmu_msg(message):
+    """
+    从 DANMU_MSG 消息中取出弹幕字段
+    :return: (发送时间戳(毫秒), 用户ID, 用户名, 弹幕内容, 模式, 字号, 颜色, 用户等级, 粉丝牌, 粉丝牌等级)
+    """
+    info = message["info"]
+    meta, user = info[0], info[2]
+    medal = info[3] if len(info) > 3 and info[3] else []
+    level = info[4] if len(info) > 4 and info[4] else [0]
+    return (meta[4], user[0], user[1], info[1], meta[1], meta[2], meta[3], level[0],
+            medal[1] if len(medal) > 1 else "", medal[0] if medal else 0)
+
+
+def rows_to_frame(rows, room_id):
+    """
+    一批弹幕转换为表格
+    :param rows: [(接收时间戳(秒), parse_danmu_msg 的结果...), ...]
+    :return: 列为 LIVE_DANMU_COLUMNS 的 DataFrame，时间为本地时间
+    """
+    df = pd.DataFrame.from_records(rows, columns=['接收时间'] + LIVE_DANMU_COLUMNS[1:2] + LIVE_DANMU_COLUMNS[3:])
+    df['接收时间'] = to_local_datetime((df['接收时间'].to_numpy(dtype=np.float64) * 1000).astype(np.int64), "ms")
+    df['发送时间'] = to_local_datetime(df['发送时间'].to_numpy(dtype=np.int64), "ms")
+    df.insert(2, '房间号', room_id)
+    return df
+
+
+def cookie_uid(cookie):
+    """从Cookie中取出登录用户ID（DedeUserID），未登录时为0"""
+    match = re.search(r'DedeUserID=(\d+)', cookie or "")
+    return int(match.group(1)) if match else 0
+
+
+class LiveDanmuIngester:
+    """直播间弹幕采集：接收、解析、按批次通过有界队列写出"""
+
+    def __init__(self, room_id, sink, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 queue_batches=QUEUE_BATCHES, record_path=None, max_reconnects=5):
+        """
+        :param room_id: 直播间号（短号或真实房间号）
+        :param sink: comment_sinks 中的写出对象，由调用方关闭
+        :param batch_size: 每批写出的弹幕条数
+        :param flush_interval: 弹幕不足一批时最多等待的秒数
+        :param queue_batches: 队列中最多积压的批次数，写出跟不上时接收端等待
+        :param record_path: 保存原始帧的路径（.jsonl.gz），用于回放测试，None 表示不保存
+        :param max_reconnects: 连接断开后最多连续重连的次数，0表示不重连
+        """
+        self.room_id = room_id
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.record_path = record_path
+        self.max_reconnects = max_reconnects
+
+        self.queue = asyncio.Queue(maxsize=queue_batches)
+        self.real_room_id = room_id
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._record_file = None
+        self._connected_at = 0.0
+
+        self.stats = {
+            "frames": 0, "bytes": 0, "messages": 0, "danmu": 0, "skipped": 0, "written": 0,
+            "batches": 0, "queue_peak": 0, "stalls": 0, "stall_seconds": 0.0, "popularity": 0,
+            "reconnects": 0,
+        }
+
+    # ---- 连接 ----
+
+    async def _get_json(self, session, url, params, headers):
+        rate_limiter = get_rate_limiter()
+        await rate_limiter.acquire_async(url)
+        start = time.perf_counter()
+        async with session.get(url, params=params, headers=headers) as response:
+            body = await response.read()
+            data = json.loads(body) if response.status == 200 else {}
+            get_metrics().observe_request(url, time.perf_counter() - start, response.status, data.get("code"),
+                                          len(body))
+            rate_limiter.feedback(url, response.status, data.get("code"))
+            if response.status != 200 or data.get("code") != 0:
+                raise ValueError(f"请求 {url} 失败: 状态码 {response.status}, {data.get('message', '未知错误')}")
+            return data["data"]
+
+    async def resolve(self, session, cookie=""):
+        """
+        查询真实房间号和弹幕服务器
+        :return: (WebSocket地址, 认证token)
+        """
+        headers = {
+            "User-Agent": get_random_user_agent(),
+            "Referer": f"https://live.bilibili.com/{self.room_id}",
+            "Origin": "https://live.bilibili.com",
+            "Accept": "application/json, text/plain, */*",
+        }
+        if cookie:
+            headers["Cookie"] = cookie
+
+        room = await self._get_json(session, f"{LIVE_API_BASE}{ROOM_INIT_PATH}", {"id": self.room_id}, headers)
+        self.real_room_id = int(room.get("room_id") or self.room_id)
+        info = await self._get_json(session, f"{LIVE_API_BASE}{DANMU_INFO_PATH}",
+                                    {"id": self.real_room_id, "type": 0}, headers)
+        host = (info.get("host_list") or [{}])[0]
+        # 本地模拟服务器使用 http，对应不加密的 ws 端口
+        if LIVE_API_BASE.startswith("http://"):
+            url = f"ws://{host.get('host', '127.0.0.1')}:{host.get('ws_port', 80)}/sub"
+        else:
+            url = f"wss://{host.get('host', 'broadcastlv.chat.bilibili.com')}:{host.get('wss_port', 443)}/sub"
+        return url, info.get("token", "")
+
+    def auth_packet(self, token, uid=0):
+        """认证包：连接后第一个发送的数据包"""
+        return encode_packet(OP_AUTH, {
+            "uid": uid,
+            "roomid": self.real_room_id,
+            "protover": PROTO_BROTLI if brotli_module() is not None else PROTO_ZLIB,
+            "platform": "web",
+            "type": 2,
+            "key": token,
+        })
+
+    async def _heartbeat(self, ws):
+        try:
+            while not ws.closed:
+                await ws.send_bytes(encode_packet(OP_HEARTBEAT, b"[object Object]"))
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+        except (ConnectionError, aiohttp.ClientError):
+            # 连接已断开，由接收循环处理重连
+            return
+
+    # ---- 接收和解析 ----
+
+    def handle_frame(self, data, received=None):
+        """
+        处理一个 WebSocket 帧：拆包、解压，只解析弹幕消息
+        :param received: 接收时间戳（秒），默认当前时间
+        :return: 本帧解析出的弹幕数
+        """
+        received = time.time() if received is None else received
+        stats = self.stats
+        stats["frames"] += 1
+        stats["bytes"] += len(data)
+        if self._record_file is not None:
+            self._record_file.write(json.dumps({
+                "t": round(time.monotonic() - self._connected_at, 4),
+                "base64": base64.b64encode(data).decode("ascii"),
+            }) + "\n")
+
+        count = 0
+        for operation, body in decode_frame(data):
+            if operation == OP_MESSAGE:
+                stats["messages"] += 1
+                # 大部分消息是进场、礼物等，按开头的 cmd 跳过，不做JSON解析
+                if b"DANMU_MSG" not in body[:DANMU_PREFIX_BYTES]:
+                    stats["skipped"] += 1
+                    continue
+                try:
+                    self._pending.append((received,) + parse_danmu_msg(json.loads(body)))
+                    count += 1
+                except (ValueError, KeyError, IndexError, TypeError):
+                    stats["skipped"] += 1
+            elif operation == OP_HEARTBEAT_REPLY:
+                stats["popularity"] = int.from_bytes(body[:4], "big")
+            elif operation == OP_AUTH_REPLY:
+                reply = json.loads(body or b"{}")
+                if reply.get("code", 0) != 0:
+                    raise ValueError(f"直播间 {self.real_room_id} 认证失败: {reply}")
+        stats["danmu"] += count
+        return count
+
+    async def flush(self):
+        """把已解析的弹幕作为一批放入队列；队列已满时等待写出任务取走"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        if self.queue.full():
+            self.stats["stalls"] += 1
+            start = time.perf_counter()
+            await self.queue.put(rows)
+            self.stats["stall_seconds"] += time.perf_counter() - start
+        else:
+            self.queue.put_nowait(rows)
+        self.stats["queue_peak"] = max(self.stats["queue_peak"], self.queue.qsize())
+
+    def _write_batch(self, rows):
+        df = rows_to_frame(rows, self.real_room_id)
+        self.sink.write(df)
+        return len(df)
+
+    async def _writer(self):
+        """写出任务：转换表格和写文件都在线程池中执行，不阻塞接收"""
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = await self.queue.get()
+            if rows is None:
+                return
+            written = await loop.run_in_executor(None, self._write_batch, rows)
+            self.stats["written"] += written
+            self.stats["batches"] += 1
+            get_metrics().record_rows(written, "live_danmu")
+
+    async def _consume(self, session, url, token, uid, deadline):
+        """
+        接收一个连接上的数据，直到连接关闭或到达截止时间
+        :return: 是否到达截止时间
+        """
+        async with session.ws_connect(url, headers={"User-Agent": get_random_user_agent()},
+                                      max_msg_size=0) as ws:
+            self._connected_at = time.monotonic()
+            await ws.send_bytes(self.auth_packet(token, uid))
+            heartbeat = asyncio.create_task(self._heartbeat(ws))
+            print(f"已连接直播间 {self.real_room_id} 的弹幕服务器 {url}")
+            try:
+                while True:
+                    timeout = self.flush_interval
+                    if deadline is not None:
+                        timeout = min(timeout, deadline - time.monotonic())
+                        if timeout <= 0:
+                            return True
+                    try:
+                        msg = await ws.receive(timeout=timeout)
+                    except asyncio.TimeoutError:
+                        await self.flush()
+                        continue
+
+                    if msg.type == aiohttp.WSMsgType.BINARY:
+                        self.handle_frame(msg.data)
+                        if (len(self._pending) >= self.batch_size
+                                or time.monotonic() - self._last_flush >= self.flush_interval):
+                            await self.flush()
+                    elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING,
+                                      aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        return False
+            finally:
+                heartbeat.cancel()
+                await self.flush()
+
+    async def run(self, duration=None, cookie=None):
+        """
+        采集弹幕
+        :param duration: 采集秒数，None 表示一直采集到连接断开且重连失败
+        :param cookie: 登录Cookie，None 时读取 BILI_COOKIE（未登录时用户名可能被隐藏）
+        :return: 统计信息 stats
+        """
+        cookie = load_env_cookie() if cookie is None else cookie
+        deadline = time.monotonic() + duration if duration else None
+        if self.record_path:
+            directory = os.path.dirname(self.record_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._record_file = gzip.open(self.record_path, "wt", encoding="utf-8")
+
+        writer = asyncio.create_task(self._writer())
+        failures = 0
+        try:
+            async with aiohttp.ClientSession() as session:
+                while True:
+                    frames = self.stats["frames"]
+                    try:
+                        url, token = await self.resolve(session, cookie)
+                        if await self._consume(session, url, token, cookie_uid(cookie), deadline):
+                            break
+                        reason = "连接被服务器关闭"
+                    except (aiohttp.ClientError, ConnectionError, asyncio.TimeoutError, ValueError) as e:
+                        reason = f"连接出错: {e}"
+                    # 连接期间收到过数据时重新计算连续失败次数
+                    failures = 0 if self.stats["frames"] > frames else failures + 1
+
+                    if self.max_reconnects <= 0 or failures > self.max_reconnects:
+                        print(f"{reason}，停止采集")
+                        break
+                    self.stats["reconnects"] += 1
+                    wait = min(60, 2 ** failures) if failures else 1
+                    print(f"{reason}，{wait} 秒后重连")
+                    await asyncio.sleep(wait)
+        finally:
+            await self.flush()
+            await self.queue.put(None)
+            await writer
+            if self._record_file is not None:
+                self._record_file.close()
+                self._record_file = None
+        return self.stats
+
+    def print_report(self):
+        """打印采集统计"""
+        stats = self.stats
+        print(f"\n直播间 {self.real_room_id}: 收到 {stats['frames']} 帧 ({stats['bytes'] / 1024:.1f} KB), "
+              f"消息 {stats['messages']} 条, 弹幕 {stats['danmu']} 条, 已写出 {stats['written']} 条 "
+              f"({stats['batches']} 批), 跳过其他消息 {stats['skipped']} 条")
+        print(f"  队列最多积压 {stats['queue_peak']} 批, 等待写出 {stats['stalls']} 次 "
+              f"(共 {stats['stall_seconds']:.2f} 秒), 重连 {stats['reconnects']} 次, 人气值 {stats['popularity']}")
+
+
+async def ingest_live_danmu(room_id, duration=None, output_format="parquet", output_dir=DEFAULT_LIVE_DIR,
+                            record_frames=False, **options):
+    """
+    采集直播间弹幕并保存
+    :param duration: 采集秒数，None 表示一直采集
+    :param output_format: parquet / csv / jsonl / sqlite
+    :param record_frames: 是否同时保存原始帧，用于 mock_live_server.py 回放
+    :param options: 传给 LiveDanmuIngester 的其他参数
+    :return: (输出文件路径, 统计信息)
+    """
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    extension = {"sqlite": "db"}.get(output_format, output_format)
+    path = os.path.join(output_dir, f"live_{room_id}_{stamp}.{extension}")
+    record_path = os.path.join(output_dir, f"live_{room_id}_{stamp}_frames.jsonl.gz") if record_frames else None
+
+    sink = open_sink(path, output_format)
+    ingester = LiveDanmuIngester(room_id, sink, record_path=record_path, **options)
+    try:
+        stats = await ingester.run(duration)
+    finally:
+        sink.close()
+    ingester.print_report()
+    if sink.rows:
+        print(f"弹幕已保存至: {os.path.abspath(path)}")
+    else:
+        print("没有采集到弹幕")
+    if record_path:
+        print(f"原始帧已保存至: {os.path.abspath(record_path)}")
+    return path, stats
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("B站直播弹幕实时采集")
+    print("=" * 60)
+
+    if len(sys.argv) < 2:
+        print("使用方法: python live_danmu.py <直播间号> [采集秒数]")
+        return
+    room_id = int(sys.argv[1])
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    output_format = "parquet"  # parquet（需要 pyarrow）/ csv / jsonl / sqlite
+    record_frames = False  # 是否保存原始帧，用于 mock_live_server.py 回放测试
+
+    try:
+        asyncio.run(ingest_live_danmu(room_id, duration, output_format, record_frames=record_frames))
+    except KeyboardInterrupt:
+        print("\n已停止采集")
+    get_metrics().finish_run("live_danmu")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站直播弹幕 WebSocket 协议的数据包打包和拆包
+每个数据包有16字节包头：包长度(4) 包头长度(2) 协议版本(2) 操作码(4) 序号(4)，大端；
+操作码5的消息包可能是 zlib（协议版本2）或 brotli（协议版本3）压缩的多个子包。
+brotli 为可选依赖，只在收到协议版本3的包时需要。采集程序（live_danmu.py）和模拟服务器（mock_live_server.py）共用。
+"""
+
+import base64
+import gzip
+import json
+import struct
+import zlib
+
+# 包头：包长度(4) 包头长度(2) 协议版本(2) 操作码(4) 序号(4)，大端
+HEADER = struct.Struct(">IHHII")
+HEADER_SIZE = HEADER.size
+
+# 协议版本
+PROTO_JSON = 0
+PROTO_INT = 1
+PROTO_ZLIB = 2
+PROTO_BROTLI = 3
+
+# 操作码
+OP_HEARTBEAT = 2
+OP_HEARTBEAT_REPLY = 3
+OP_MESSAGE = 5
+OP_AUTH = 7
+OP_AUTH_REPLY = 8
+
+
+def brotli_module():
+    """brotli 模块，未安装时返回 None"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def encode_packet(operation, body=b"", protover=PROTO_INT, sequence=1):
+    """
+    打包一个数据包
+    :param operation: 操作码
+    :param body: 包体，dict 按JSON编码，str 按UTF-8编码
+    """
+    if isinstance(body, dict):
+        body = json.dumps(body, ensure_ascii=False, separators=(",", ":"))
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return HEADER.pack(HEADER_SIZE + len(body), HEADER_SIZE, protover, operation, sequence) + body
+
+
+def decode_frame(data, packets=None):
+    """
+    拆分一个 WebSocket 帧中的数据包，压缩包解压后继续拆分
+    解压失败的包不影响同一帧中的其他包，按原始包体返回，由调用方当作无法识别的消息跳过
+    :return: [(操作码, 包体), ...]
+    """
+    if packets is None:
+        packets = []
+    offset, end = 0, len(data)
+    while offset + HEADER_SIZE <= end:
+        length, header_length, protover, operation, _ = HEADER.unpack_from(data, offset)
+        if length < header_length or offset + length > end:
+            # 包长度异常（帧不完整），丢弃剩余部分
+            break
+        body = data[offset + header_length:offset + length]
+        offset += length
+        if operation == OP_MESSAGE and protover == PROTO_ZLIB:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                packets.append((operation, body))
+                continue
+            decode_frame(body, packets)
+        elif operation == OP_MESSAGE and protover == PROTO_BROTLI:
+            brotli = brotli_module()
+            if brotli is None:
+                raise ImportError("解压协议版本3的消息需要安装 brotli: pip install brotli")
+            try:
+                body = brotli.decompress(body)
+            except brotli.error:
+                packets.append((operation, body))
+                continue
+            decode_frame(body, packets)
+        else:
+            packets.append((operation, body))
+    return packets
+
+
+def iter_recorded_frames(path):
+    """
+    读取 live_danmu.py 保存的原始帧（.jsonl.gz，每行 {"t": 距连接开始的秒数, "base64": 帧内容}）
+    :return: 迭代 (距连接开始的秒数, 帧内容)
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["t"], base64.b64decode(record["base64"])
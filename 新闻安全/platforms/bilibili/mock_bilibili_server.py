@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟B站API服务器
+功能：在本机提供 /x/web-interface/view、/x/v2/reply、/x/v2/reply/main、/x/v2/reply/reply、
+/x/v1/dm/list.so、/x/v2/dm/web/seg.so 以及历史弹幕的 /x/v2/dm/history/index、/x/v2/dm/web/history/seg.so 八个接口，
+用于在不访问B站的情况下测试翻页逻辑、测量爬虫吞吐量。历史弹幕接口与B站一样需要请求头中带有 SESSDATA Cookie。
+数据来自 response_archive 归档的真实响应，或按BV号确定性生成的模拟评论和弹幕；
+可配置响应延迟、风控错误（-412）比例和页码翻页的页数上限。
+爬虫通过环境变量 BILI_API_BASE 指向本服务器，例如 BILI_API_BASE=http://127.0.0.1:18080
+使用方法: python mock_bilibili_server.py [端口]
+"""
+
+import asyncio
+import base64
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+
+from aiohttp import web
+
+# 添加当前目录到Python路径，以便读取原始响应归档
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from danmu_protobuf import encode_danmu_segment
+from response_archive import iter_records, list_bvids
+
+VIEW_PATH = "/x/web-interface/view"
+REPLY_PATH = "/x/v2/reply"
+REPLY_MAIN_PATH = "/x/v2/reply/main"
+REPLY_REPLY_PATH = "/x/v2/reply/reply"
+DANMU_PATH = "/x/v1/dm/list.so"
+DANMU_SEG_PATH = "/x/v2/dm/web/seg.so"
+DANMU_HISTORY_INDEX_PATH = "/x/v2/dm/history/index"
+DANMU_HISTORY_PATH = "/x/v2/dm/web/history/seg.so"
+API_PATHS = (VIEW_PATH, REPLY_PATH, REPLY_MAIN_PATH, REPLY_REPLY_PATH, DANMU_PATH, DANMU_SEG_PATH,
+             DANMU_HISTORY_INDEX_PATH, DANMU_HISTORY_PATH)
+# 按弹幕CID查找视频的接口
+DANMU_PATHS = (DANMU_PATH, DANMU_SEG_PATH, DANMU_HISTORY_INDEX_PATH, DANMU_HISTORY_PATH)
+# 需要登录的接口
+LOGIN_PATHS = (DANMU_HISTORY_INDEX_PATH, DANMU_HISTORY_PATH)
+
+# 页码和游标翻页的默认每页条数与B站一致
+DEFAULT_PAGE_SIZE = 20
+PREVIEW_REPLIES = 3
+# 分段弹幕每段的时长（毫秒）
+SEGMENT_MS = 360 * 1000
+# 旧版弹幕XML接口只返回最近发送的这么多条弹幕
+DANMU_XML_LIMIT = 3000
+
+
+def _request_key(path, params):
+    """请求参数中决定响应内容的部分，用于匹配归档的响应"""
+    params = {k: str(v) for k, v in (params or {}).items()}
+    if path == REPLY_PATH:
+        return params.get("pn", "1"), params.get("sort", "0")
+    if path == REPLY_MAIN_PATH:
+        offset = params.get("next", "")
+        if "pagination_str" in params:
+            try:
+                offset = str(json.loads(params["pagination_str"]).get("offset") or "")
+            except ValueError:
+                offset = ""
+        return offset, params.get("mode", "3")
+    if path == REPLY_REPLY_PATH:
+        return params.get("root", ""), params.get("pn", "1")
+    if path == DANMU_PATH:
+        return params.get("oid", ""),
+    if path == DANMU_SEG_PATH:
+        return params.get("oid", ""), params.get("segment_index", "1")
+    if path == DANMU_HISTORY_INDEX_PATH:
+        return params.get("oid", ""), params.get("month", "")
+    if path == DANMU_HISTORY_PATH:
+        return params.get("oid", ""), params.get("date", "")
+    return ()
+
+
+class SyntheticVideo:
+    """按BV号确定性生成的一个视频：视频信息、评论、楼中楼回复和弹幕"""
+
+    def __init__(self, bvid, comments=200, replies_every=5, replies_per_comment=8,
+                 danmu=1000, parts=1, seed=0):
+        rng = random.Random(f"{seed}:{bvid}")
+        self.bvid = bvid
+        self.aid = zlib.crc32(bvid.encode("utf-8")) or 1
+        self.cid = self.aid * 10 + 1
+        self.duration = rng.randint(120, 1800)
+        self.pubdate = 1700000000 + rng.randint(0, 10 ** 7)
+        self.danmu_count = danmu
+        self._seed = seed
+
+        # 分P：{CID: 时长（秒）}，第1P使用视频的主CID
+        part_rng = random.Random(f"{seed}:{bvid}:parts")
+        self.parts = {self.cid: self.duration}
+        for i in range(1, parts):
+            self.parts[self.cid + i] = part_rng.randint(120, 1800)
+
+        next_rpid = self.aid * 10 ** 6
+        self.replies = {}
+        roots = []
+        for i in range(comments):
+            rpid = next_rpid + i
+            ctime = self.pubdate + rng.randint(0, 30 * 86400)
+            subs = []
+            if replies_every and i % replies_every == 0:
+                base = next_rpid + comments + i * replies_per_comment
+                for j in range(replies_per_comment):
+                    subs.append(self._reply(rng, base + j, rpid, ctime + j + 1, 0))
+            self.replies[rpid] = subs
+            roots.append(self._reply(rng, rpid, 0, ctime, len(subs), subs[:PREVIEW_REPLIES]))
+
+        self.top = self._reply(rng, next_rpid - 1, 0, self.pubdate, 0)
+        self.by_time = sorted(roots, key=lambda r: -r["ctime"])
+        self.by_hot = sorted(roots, key=lambda r: (-r["like"], -r["ctime"]))
+        self.reply_total = sum(len(subs) for subs in self.replies.values())
+        self._danmu = {}
+        self._danmu_xml = {}
+        self._danmu_segments = {}
+        self._danmu_history = {}
+
+    def _reply(self, rng, rpid, root, ctime, rcount, previews=()):
+        mid = rng.randint(1, 10 ** 9)
+        return {
+            "rpid": rpid,
+            "oid": self.aid,
+            "type": 1,
+            "root": root,
+            "parent": root,
+            "mid": mid,
+            "ctime": ctime,
+            "like": rng.randint(0, 5000),
+            "rcount": rcount,
+            "member": {
+                "mid": str(mid),
+                "uname": f"用户{mid}",
+                "sex": rng.choice(["男", "女", "保密"]),
+                "level_info": {"current_level": rng.randint(0, 6)},
+            },
+            "content": {"message": f"模拟评论 {rpid}"},
+            "replies": list(previews),
+        }
+
+    def view(self):
+        return {
+            "bvid": self.bvid,
+            "aid": self.aid,
+            "cid": self.cid,
+            "title": f"模拟视频 {self.bvid}",
+            "pubdate": self.pubdate,
+            "owner": {"mid": 1, "name": "模拟UP主"},
+            "duration": sum(self.parts.values()),
+            "pages": [
+                {"cid": cid, "page": i, "part": f"P{i}", "duration": duration}
+                for i, (cid, duration) in enumerate(self.parts.items(), 1)
+            ],
+            "stat": {
+                "view": len(self.by_time) * 50, "danmaku": self.danmu_count,
+                "reply": len(self.by_time) + self.reply_total,
+                "favorite": 10, "coin": 10, "share": 5, "like": 100,
+            },
+        }
+
+    def danmu(self, cid):
+        """
+        一个分P的全部弹幕
+        :return: [(弹幕ID, 出现时间(毫秒), 模式, 字号, 颜色, 用户ID哈希, 内容, 发送时间戳, 弹幕池), ...]
+        """
+        if cid not in self._danmu:
+            rng = random.Random(f"{self._seed}:{self.bvid}:danmu:{cid}")
+            self._danmu[cid] = [
+                (cid * 10 ** 4 + i, rng.randint(0, self.parts[cid] * 1000 - 1), rng.choice((1, 1, 1, 4, 5)),
+                 rng.choice((18, 25, 25)), rng.choice((16777215, 16777215, 16646914, 65532)),
+                 f"{rng.getrandbits(32):08x}", f"模拟弹幕 {i}", self.pubdate + rng.randint(0, 30 * 86400), 0)
+                for i in range(self.danmu_count)
+            ]
+        return self._danmu[cid]
+
+    def danmu_xml(self, cid):
+        if cid not in self._danmu_xml:
+            lines = [
+                '<?xml version="1.0" encoding="UTF-8"?>',
+                f"<i><chatserver>chat.bilibili.com</chatserver><chatid>{cid}</chatid>"
+                f"<mission>0</mission><maxlimit>{DANMU_XML_LIMIT}</maxlimit><state>0</state>",
+            ]
+            recent = sorted(self.danmu(cid), key=lambda elem: -elem[7])[:DANMU_XML_LIMIT]
+            for dmid, progress, mode, fontsize, color, mid_hash, content, ctime, pool in sorted(recent):
+                p = f"{progress / 1000:.5f},{mode},{fontsize},{color},{ctime},{pool},{mid_hash},{dmid},10"
+                lines.append(f'<d p="{p}">{content}</d>')
+            lines.append("</i>")
+            self._danmu_xml[cid] = "".join(lines)
+        return self._danmu_xml[cid]
+
+    def danmu_segment(self, cid, index):
+        """一个分P第 index 个6分钟分段的 protobuf 内容，超出分P时长时为空"""
+        if (cid, index) not in self._danmu_segments:
+            start, end = (index - 1) * SEGMENT_MS, index * SEGMENT_MS
+            self._danmu_segments[cid, index] = encode_danmu_segment(
+                [elem for elem in self.danmu(cid) if start <= elem[1] < end]
+            )
+        return self._danmu_segments[cid, index]
+
+    def danmu_dates(self, cid):
+        """一个分P有弹幕发送的日期 ['YYYY-MM-DD', ...]（按本地时间）"""
+        return sorted({datetime.date.fromtimestamp(elem[7]).isoformat() for elem in self.danmu(cid)})
+
+    def danmu_history(self, cid, date):
+        """
+        一个分P在 date 当天结束时的弹幕池（protobuf 内容）：截至当天发送的弹幕中最近的 DANMU_XML_LIMIT 条
+        """
+        if (cid, date) not in self._danmu_history:
+            end = datetime.datetime.combine(datetime.date.fromisoformat(date) + datetime.timedelta(days=1),
+                                            datetime.time()).timestamp()
+            sent = sorted((elem for elem in self.danmu(cid) if elem[7] < end), key=lambda elem: -elem[7])
+            self._danmu_history[cid, date] = encode_danmu_segment(sorted(sent[:DANMU_XML_LIMIT]))
+        return self._danmu_history[cid, date]
+
+
+class MockBilibiliServer:
+    """模拟B站API服务器，可在后台线程中运行"""
+
+    def __init__(self, host="127.0.0.1", port=18080, latency=0.0, latency_jitter=0.0,
+                 error_rate=0.0, error_code=-412, error_status=412, error_paths=None, page_cap=None,
+                 comments_per_video=200, replies_every=5, replies_per_comment=8,
+                 danmu_per_video=1000, parts_per_video=1, archive_dir=None, seed=0):
+        """
+        :param port: 监听端口，0表示随机选择空闲端口
+        :param latency: 每个请求的固定延迟（秒）
+        :param latency_jitter: 额外的随机延迟上限（秒）
+        :param error_rate: 返回风控错误的请求比例
+        :param error_code: 风控错误的 code（B站风控为 -412）
+        :param error_status: 风控错误的HTTP状态码，200表示只在 code 中返回错误
+        :param error_paths: 只对这些接口返回风控错误，None表示所有接口
+        :param page_cap: 页码翻页和游标翻页的最大页数，超过后返回空页（模拟B站的翻页上限）
+        :param comments_per_video: 模拟视频的主评论数
+        :param replies_every: 每隔多少条主评论有一条带楼中楼回复，0表示没有回复
+        :param replies_per_comment: 带回复的主评论下的回复数
+        :param danmu_per_video: 模拟视频每个分P的弹幕数
+        :param parts_per_video: 模拟视频的分P数
+        :param archive_dir: response_archive 归档目录；提供时归档中的视频使用真实响应
+        :param seed: 随机种子，相同种子生成相同的数据
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.error_status = error_status
+        self.error_paths = error_paths
+        self.page_cap = page_cap
+        self.video_options = {
+            "comments": comments_per_video,
+            "replies_every": replies_every,
+            "replies_per_comment": replies_per_comment,
+            "danmu": danmu_per_video,
+            "parts": parts_per_video,
+            "seed": seed,
+        }
+        self._rng = random.Random(seed)
+        self._videos = {}
+        self._aids = {}
+        self._cids = {}
+
+        # 归档中的真实响应 {(接口, BV号, 请求参数key): 响应}
+        self._recorded = {}
+        self._recorded_bvids = set()
+        if archive_dir:
+            self.load_archive(archive_dir)
+
+        self.requests = Counter()
+        self.errors = Counter()
+        self.bytes_sent = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def reset_stats(self):
+        self.requests.clear()
+        self.errors.clear()
+        self.bytes_sent = 0
+
+    def load_archive(self, archive_dir):
+        """读取 response_archive 归档，归档中的视频按真实响应返回"""
+        count = 0
+        for bvid in list_bvids(archive_dir):
+            for path in API_PATHS:
+                for record in iter_records(path, bvid, archive_dir):
+                    if "base64" in record:
+                        body = base64.b64decode(record["base64"])
+                    else:
+                        body = record.get("text") if "text" in record else record.get("data")
+                    if body is None:
+                        continue
+                    self._recorded[(path, bvid, _request_key(path, record.get("params")))] = body
+                    count += 1
+                    if path == VIEW_PATH and isinstance(body, dict) and body.get("code") == 0:
+                        self._index_view(bvid, body["data"])
+            self._recorded_bvids.add(bvid)
+        print(f"已从归档 {archive_dir} 读取 {len(self._recorded_bvids)} 个视频的 {count} 条响应")
+
+    def _index_view(self, bvid, data):
+        if data.get("aid"):
+            self._aids[int(data["aid"])] = bvid
+        for cid in [data.get("cid")] + [page.get("cid") for page in data.get("pages") or []]:
+            if cid:
+                self._cids[int(cid)] = bvid
+
+    def _video(self, bvid):
+        video = self._videos.get(bvid)
+        if video is None:
+            video = self._videos[bvid] = SyntheticVideo(bvid, **self.video_options)
+            self._aids[video.aid] = bvid
+            for cid in video.parts:
+                self._cids[cid] = bvid
+        return video
+
+    # ---- 接口 ----
+
+    def _view(self, params):
+        bvid = params.get("bvid", "")
+        if not bvid:
+            return {"code": -400, "message": "请求错误"}
+        return {"code": 0, "message": "0", "data": self._video(bvid).view()}
+
+    def _page_slice(self, roots, page, page_size):
+        if self.page_cap is not None and page > self.page_cap:
+            return []
+        return roots[(page - 1) * page_size:page * page_size]
+
+    def _reply(self, video, params):
+        page = int(params.get("pn", 1))
+        page_size = int(params.get("ps", DEFAULT_PAGE_SIZE))
+        roots = video.by_time if str(params.get("sort", "0")) == "2" else video.by_hot
+        return {"code": 0, "message": "0", "data": {
+            "page": {"num": page, "size": page_size, "count": len(roots),
+                     "acount": len(roots) + video.reply_total},
+            "replies": self._page_slice(roots, page, page_size),
+        }}
+
+    def _reply_main(self, video, params):
+        offset = _request_key(REPLY_MAIN_PATH, params)[0]
+        page = 1
+        if offset:
+            try:
+                page = int(json.loads(offset)["data"]["pn"])
+            except (ValueError, KeyError, TypeError):
+                page = int(offset) if offset.isdigit() else 1
+        page_size = int(params.get("ps", DEFAULT_PAGE_SIZE))
+        roots = video.by_time if str(params.get("mode", "3")) == "2" else video.by_hot
+
+        replies = self._page_slice(roots, page, page_size)
+        is_end = not replies or page * page_size >= len(roots)
+        next_offset = "" if is_end else json.dumps({"type": 1, "direction": 1, "data": {"pn": page + 1}})
+        data = {
+            "cursor": {
+                "is_begin": page == 1, "prev": page - 1, "next": page + 1, "is_end": is_end,
+                "all_count": len(roots) + video.reply_total,
+                "mode": int(params.get("mode", 3)),
+                "pagination_reply": {"next_offset": next_offset},
+            },
+            "replies": replies,
+            "upper": {"mid": 1, "top": video.top if page == 1 else None},
+            "top_replies": [video.top] if page == 1 else [],
+        }
+        return {"code": 0, "message": "0", "data": data}
+
+    def _reply_reply(self, video, params):
+        root = int(params.get("root", 0))
+        page = int(params.get("pn", 1))
+        page_size = int(params.get("ps", DEFAULT_PAGE_SIZE))
+        replies = video.replies.get(root)
+        if replies is None:
+            return {"code": 12022, "message": "已经被删除了"}
+        return {"code": 0, "message": "0", "data": {
+            "page": {"num": page, "size": page_size, "count": len(replies)},
+            "replies": replies[(page - 1) * page_size:page * page_size] or None,
+        }}
+
+    def _response(self, path, params):
+        """
+        :return: (HTTP状态码, JSON对象、弹幕XML文本或分段弹幕的二进制内容)
+        """
+        if path == VIEW_PATH:
+            bvid = params.get("bvid", "")
+        elif path in DANMU_PATHS:
+            bvid = self._cids.get(int(params.get("oid", 0) or 0))
+        else:
+            bvid = self._aids.get(int(params.get("oid", 0) or 0))
+
+        if bvid in self._recorded_bvids:
+            body = self._recorded.get((path, bvid, _request_key(path, params)))
+            if body is None:
+                return 404, {"code": -404, "message": "归档中没有该请求的响应"}
+            return 200, body
+
+        if path == VIEW_PATH:
+            return 200, self._view(params)
+        if bvid is None:
+            return 200, {"code": -404, "message": "啥都木有"}
+        video = self._video(bvid)
+        if path == DANMU_PATH:
+            return 200, video.danmu_xml(int(params["oid"]))
+        if path == DANMU_SEG_PATH:
+            return 200, video.danmu_segment(int(params["oid"]), int(params.get("segment_index", 1)))
+        if path == DANMU_HISTORY_INDEX_PATH:
+            month = params.get("month", "")
+            dates = [date for date in video.danmu_dates(int(params["oid"])) if date.startswith(month + "-")]
+            return 200, {"code": 0, "message": "0", "ttl": 1, "data": dates or None}
+        if path == DANMU_HISTORY_PATH:
+            return 200, video.danmu_history(int(params["oid"]), params.get("date", ""))
+        if path == REPLY_PATH:
+            return 200, self._reply(video, params)
+        if path == REPLY_MAIN_PATH:
+            return 200, self._reply_main(video, params)
+        return 200, self._reply_reply(video, params)
+
+    async def _handle(self, request):
+        path = request.path
+        self.requests[path] += 1
+
+        delay = self.latency + (self._rng.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if (self.error_rate and (self.error_paths is None or path in self.error_paths)
+                and self._rng.random() < self.error_rate):
+            self.errors[path] += 1
+            status, body = self.error_status, {"code": self.error_code, "message": "请求过于频繁，请稍后再试"}
+        elif path in LOGIN_PATHS and "SESSDATA=" not in request.headers.get("Cookie", ""):
+            status, body = 200, {"code": -101, "message": "账号未登录"}
+        else:
+            status, body = self._response(path, dict(request.query))
+
+        if isinstance(body, bytes):
+            self.bytes_sent += len(body)
+            return web.Response(status=status, body=body, content_type="application/octet-stream")
+        if isinstance(body, str):
+            text, content_type = body, "text/xml"
+        else:
+            text, content_type = json.dumps(body, ensure_ascii=False), "application/json"
+        self.bytes_sent += len(text.encode("utf-8"))
+        return web.Response(status=status, text=text, content_type=content_type, charset="utf-8")
+
+    def make_app(self):
+        app = web.Application()
+        for path in API_PATHS:
+            app.router.add_get(path, self._handle)
+        return app
+
+    # ---- 运行 ----
+
+    async def _start_site(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # 端口为0时取实际监听的端口
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        """
+        在后台线程中启动服务器
+        :return: 服务器地址，可设置为环境变量 BILI_API_BASE
+        """
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self._start_site())
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    """主函数"""
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 18080
+    latency = 0.05  # 每个请求的延迟（秒）
+    error_rate = 0.0  # 返回 -412 风控错误的请求比例
+    page_cap = None  # 翻页上限，None表示不限制
+    archive_dir = None  # 使用归档的真实响应时填写归档目录，例如 "B站原始数据"
+
+    server = MockBilibiliServer(port=port, latency=latency, error_rate=error_rate,
+                                page_cap=page_cap, archive_dir=archive_dir)
+    base_url = server.start()
+    print(f"模拟B站API服务器已启动: {base_url}")
+    print(f"在运行爬虫前设置环境变量 BILI_API_BASE={base_url}，按 Ctrl+C 停止")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"请求统计: {dict(server.requests)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟B站直播弹幕服务器
+功能：提供 /room/v1/Room/room_init、/xlive/web-room/v1/index/getDanmuInfo 两个接口和 /sub 弹幕 WebSocket，
+按B站直播协议完成认证、回复心跳，然后推送弹幕帧：回放 live_danmu.py 保存的原始帧（frames_path），
+或按设定的每秒弹幕数生成模拟弹幕（与真实服务器一样，多条消息打包后 zlib 压缩成一帧，夹带进场、礼物等其他消息），
+用于在不连接B站的情况下测试采集程序能否跟上决赛高峰期的弹幕速率。
+采集程序通过环境变量 BILI_LIVE_API_BASE 指向本服务器，例如 BILI_LIVE_API_BASE=http://127.0.0.1:18081
+使用方法: python mock_live_server.py [端口] [原始帧文件]
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+
+from aiohttp import WSMsgType, web
+
+# 添加当前目录到Python路径，以便使用直播协议的打包函数
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from live_protocol import (OP_AUTH, OP_AUTH_REPLY, OP_HEARTBEAT, OP_HEARTBEAT_REPLY, OP_MESSAGE, PROTO_JSON,
+                           PROTO_ZLIB, decode_frame, encode_packet, iter_recorded_frames)
+
+ROOM_INIT_PATH = "/room/v1/Room/room_init"
+DANMU_INFO_PATH = "/xlive/web-room/v1/index/getDanmuInfo"
+WS_PATH = "/sub"
+MOCK_TOKEN = "mock-live-token"
+# 模拟弹幕每帧的时间间隔（秒），真实服务器大约每0.1~0.3秒推送一帧
+FRAME_INTERVAL = 0.1
+
+
+def synthetic_danmu_msg(rng, room_id, index, now_ms):
+    """一条模拟的 DANMU_MSG 消息"""
+    uid = rng.randint(1, 10 ** 9)
+    text = rng.choice(("好耶", "牛啊", "这波团战", "名场面", "冠军！", "666")) + f" {index}"
+    return {
+        "cmd": "DANMU_MSG",
+        "info": [
+            [0, 1, 25, rng.choice((16777215, 16777215, 14893055)), now_ms, rng.randint(0, 2 ** 31), 0,
+             f"{rng.getrandbits(32):08x}", 0, 0, 0, "", 0, "{}", "{}", {"mode": 0}],
+            text,
+            [uid, f"观众{uid}", 0, 0, 0, 10000, 1, ""],
+            [rng.randint(1, 30), "粉丝牌", "主播", room_id, 398668, "", 0] if rng.random() < 0.4 else [],
+            [rng.randint(0, 60), 0, 9868950, ">50000", 0],
+            ["", ""], 0, 0, None, {"ts": now_ms // 1000, "ct": "0"}, 0, 0, None, None, 0, 105,
+        ],
+    }
+
+
+def synthetic_other_msg(rng, room_id, now_ms):
+    """一条非弹幕消息（进场或礼物），采集程序应跳过"""
+    uid = rng.randint(1, 10 ** 9)
+    if rng.random() < 0.7:
+        return {"cmd": "INTERACT_WORD", "data": {"uid": uid, "uname": f"观众{uid}", "msg_type": 1,
+                                                  "roomid": room_id, "timestamp": now_ms // 1000}}
+    return {"cmd": "SEND_GIFT", "data": {"uid": uid, "uname": f"观众{uid}", "giftName": "辣条", "num": 1,
+                                         "timestamp": now_ms // 1000}}
+
+
+def build_synthetic_frames(room_id, rate, duration, other_ratio=1.0, seed=0):
+    """
+    生成模拟弹幕帧
+    :param rate: 每秒弹幕数
+    :param duration: 推送的总秒数
+    :param other_ratio: 每条弹幕对应的其他消息数
+    :return: ([(距连接开始的秒数, 帧内容), ...], 弹幕总数)
+    """
+    rng = random.Random(seed)
+    frames = []
+    total = 0
+    start_ms = int(time.time() * 1000)
+    steps = max(1, int(round(duration / FRAME_INTERVAL)))
+    for step in range(steps):
+        now_ms = start_ms + int(step * FRAME_INTERVAL * 1000)
+        count = int(rate * FRAME_INTERVAL * (step + 1)) - int(rate * FRAME_INTERVAL * step)
+        packets = [encode_packet(OP_MESSAGE, synthetic_danmu_msg(rng, room_id, total + i, now_ms), PROTO_JSON)
+                   for i in range(count)]
+        packets += [encode_packet(OP_MESSAGE, synthetic_other_msg(rng, room_id, now_ms), PROTO_JSON)
+                    for _ in range(int(count * other_ratio))]
+        rng.shuffle(packets)
+        total += count
+        frames.append((step * FRAME_INTERVAL, encode_packet(OP_MESSAGE, zlib.compress(b"".join(packets)), PROTO_ZLIB)))
+    return frames, total
+
+
+class MockLiveServer:
+    """模拟直播弹幕服务器，可在后台线程中运行"""
+
+    def __init__(self, host="127.0.0.1", port=18081, room_id=21452505, short_id=6, rate=2000, duration=10.0,
+                 other_ratio=1.0, frames_path=None, speed=1.0, seed=0):
+        """
+        :param port: 监听端口，0表示随机选择空闲端口
+        :param room_id: 真实房间号
+        :param short_id: 短号，room_init 接口把短号转换为真实房间号
+        :param rate: 模拟弹幕的每秒条数
+        :param duration: 模拟弹幕推送的秒数，推送完后关闭连接
+        :param other_ratio: 每条弹幕对应的其他消息数
+        :param frames_path: live_danmu.py 保存的原始帧文件，提供时回放该文件而不是生成模拟弹幕
+        :param speed: 回放速度倍数，0表示不等待、尽快推送
+        :param seed: 随机种子
+        """
+        self.host = host
+        self.port = port
+        self.room_id = room_id
+        self.short_id = short_id
+        self.speed = speed
+
+        if frames_path:
+            self.frames = list(iter_recorded_frames(frames_path))
+            self.danmu_total = None
+            print(f"已读取 {frames_path} 中的 {len(self.frames)} 帧")
+        else:
+            self.frames, self.danmu_total = build_synthetic_frames(room_id, rate, duration, other_ratio, seed)
+
+        self.requests = Counter()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.heartbeats = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # ---- 接口 ----
+
+    async def _room_init(self, request):
+        self.requests[ROOM_INIT_PATH] += 1
+        room = int(request.query.get("id", 0) or 0)
+        if room not in (self.room_id, self.short_id):
+            return web.json_response({"code": 60004, "message": "直播间不存在"})
+        return web.json_response({"code": 0, "message": "ok", "data": {
+            "room_id": self.room_id, "short_id": self.short_id, "live_status": 1,
+        }})
+
+    async def _danmu_info(self, request):
+        self.requests[DANMU_INFO_PATH] += 1
+        return web.json_response({"code": 0, "message": "0", "data": {
+            "token": MOCK_TOKEN,
+            "host_list": [{"host": self.host, "port": self.port, "wss_port": self.port, "ws_port": self.port}],
+        }})
+
+    async def _reader(self, ws):
+        """接收客户端的心跳包并回复人气值"""
+        async for msg in ws:
+            if msg.type != WSMsgType.BINARY:
+                continue
+            for operation, _ in decode_frame(msg.data):
+                if operation == OP_HEARTBEAT:
+                    self.heartbeats += 1
+                    await ws.send_bytes(encode_packet(OP_HEARTBEAT_REPLY, (123456).to_bytes(4, "big")))
+
+    async def _sub(self, request):
+        self.requests[WS_PATH] += 1
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+
+        # 第一个包必须是认证包
+        msg = await ws.receive()
+        packets = decode_frame(msg.data) if msg.type == WSMsgType.BINARY else []
+        auth = json.loads(packets[0][1]) if packets and packets[0][0] == OP_AUTH else {}
+        if auth.get("key") != MOCK_TOKEN or int(auth.get("roomid", 0)) != self.room_id:
+            await ws.send_bytes(encode_packet(OP_AUTH_REPLY, {"code": -101}))
+            await ws.close()
+            return ws
+        await ws.send_bytes(encode_packet(OP_AUTH_REPLY, {"code": 0}))
+
+        reader = asyncio.create_task(self._reader(ws))
+        started = time.monotonic()
+        try:
+            for offset, frame in self.frames:
+                if ws.closed:
+                    break
+                if self.speed:
+                    delay = started + offset / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await ws.send_bytes(frame)
+                self.frames_sent += 1
+                self.bytes_sent += len(frame)
+        except ConnectionError:
+            pass
+        finally:
+            reader.cancel()
+            await ws.close()
+        return ws
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get(ROOM_INIT_PATH, self._room_init)
+        app.router.add_get(DANMU_INFO_PATH, self._danmu_info)
+        app.router.add_get(WS_PATH, self._sub)
+        return app
+
+    # ---- 运行 ----
+
+    async def _start_site(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # 端口为0时取实际监听的端口
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        """
+        在后台线程中启动服务器
+        :return: 服务器地址，可设置为环境变量 BILI_LIVE_API_BASE
+        """
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self._start_site())
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    """主函数"""
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 18081
+    frames_path = sys.argv[2] if len(sys.argv) > 2 else None
+    rate = 2000  # 模拟弹幕的每秒条数
+    duration = 60.0  # 模拟弹幕推送的秒数
+    speed = 1.0  # 回放速度倍数，0表示尽快推送
+
+    server = MockLiveServer(port=port, rate=rate, duration=duration, frames_path=frames_path, speed=speed)
+    base_url = server.start()
+    print(f"模拟直播弹幕服务器已启动: {base_url}（直播间 {server.room_id}，短号 {server.short_id}）")
+    print(f"在运行采集程序前设置环境变量 BILI_LIVE_API_BASE={base_url}，按 Ctrl+C 停止")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"请求统计: {dict(server.requests)}, 推送 {server.frames_sent} 帧, 心跳 {server.heartbeats} 次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站API自适应限速器
+功能：按接口分别维护令牌桶；遇到风控错误码(-412/-352等)或HTTP 412时按AIMD策略
+成倍降速并暂停，响应正常时逐步提速；统计每个接口的实际请求速率。
+同一进程内的所有爬虫共享同一个限速器实例（见 get_rate_limiter）。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+# B站风控/限流相关错误码
+RISK_CONTROL_CODES = {-412, -352, -509, -799}
+# 表示被限流的HTTP状态码
+RISK_CONTROL_STATUS = {412, 429}
+
+
+def endpoint_of(url):
+    """从URL中取出接口路径作为限速分组，例如 /x/v2/reply"""
+    return urlparse(url).path or url
+
+
+class TokenBucket:
+    """单个接口的令牌桶，速率按AIMD策略自适应调整"""
+
+    def __init__(self, rate=2.0, capacity=4, min_rate=0.2, max_rate=8.0,
+                 increase_step=0.05, decrease_factor=0.5, cooldown=10.0,
+                 max_cooldown=120.0, window=60.0):
+        """
+        :param rate: 初始速率（请求/秒）
+        :param capacity: 桶容量，即允许的最大突发请求数
+        :param min_rate: 降速下限
+        :param max_rate: 提速上限
+        :param increase_step: 每次正常响应后增加的速率（加性增）
+        :param decrease_factor: 遇到风控后速率乘以的系数（乘性减）
+        :param cooldown: 遇到风控后暂停的基础秒数，连续风控时翻倍
+        :param max_cooldown: 暂停秒数上限
+        :param window: 统计实际请求速率的时间窗口（秒）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.window = window
+
+        self.tokens = float(capacity)
+        # 令牌开始累积的时间点；暂停期间会被推到未来
+        self.updated = time.monotonic()
+        self.consecutive_blocks = 0
+
+        self.created = self.updated
+        self.total_requests = 0
+        self.total_blocks = 0
+        self.recent = deque()
+
+    def reserve(self):
+        """
+        预订一个令牌
+        :return: 调用方在发出请求前需要等待的秒数
+        """
+        now = time.monotonic()
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+        # 令牌可以透支，透支部分按当前速率折算为等待时间
+        self.tokens -= 1
+        ready_at = self.updated + max(0.0, -self.tokens) / self.rate
+        wait = max(0.0, ready_at - now)
+
+        self.total_requests += 1
+        self.recent.append(now + wait)
+        self._prune(now)
+        return wait
+
+    def on_success(self):
+        """响应正常：加性提速"""
+        self.consecutive_blocks = 0
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_block(self):
+        """
+        遇到风控：乘性降速，并暂停一段时间，连续风控时暂停时间翻倍
+        暂停期间收到的风控来自暂停前已发出的请求，只计数，不再重复降速
+        """
+        self.total_blocks += 1
+        now = time.monotonic()
+        if now < self.updated:
+            return self.updated - now
+        self.consecutive_blocks += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+        pause = min(self.max_cooldown, self.cooldown * 2 ** (self.consecutive_blocks - 1))
+        # 清空已积攒的令牌，暂停结束后才重新开始累积
+        self.tokens = min(self.tokens, 0)
+        self.updated = max(self.updated, now + pause)
+        return pause
+
+    def _prune(self, now):
+        """丢弃统计窗口之外的请求时间，长时间运行时 recent 不会无限增长"""
+        while self.recent and self.recent[0] < now - self.window:
+            self.recent.popleft()
+
+    def effective_rate(self):
+        """最近 window 秒内的实际请求速率（请求/秒）"""
+        now = time.monotonic()
+        self._prune(now)
+        span = max(1.0, min(self.window, now - self.created))
+        return len([t for t in self.recent if t <= now]) / span
+
+
+class AdaptiveRateLimiter:
+    """按接口分组的自适应限速器，同时支持同步和异步调用"""
+
+    def __init__(self, **bucket_options):
+        """
+        :param bucket_options: 新建令牌桶时使用的默认参数，见 TokenBucket
+        """
+        self.bucket_options = bucket_options
+        self.endpoint_options = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def configure(self, endpoint, **options):
+        """为某个接口单独设置令牌桶参数，需在该接口首次请求前调用"""
+        self.endpoint_options[endpoint_of(endpoint)] = options
+
+    def _bucket(self, url):
+        endpoint = endpoint_of(url)
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            options = dict(self.bucket_options)
+            options.update(self.endpoint_options.get(endpoint, {}))
+            bucket = self._buckets[endpoint] = TokenBucket(**options)
+        return bucket
+
+    def _reserve(self, url):
+        with self._lock:
+            return self._bucket(url).reserve()
+
+    def acquire(self, url):
+        """同步等待直到可以请求 url"""
+        wait = self._reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, url):
+        """异步等待直到可以请求 url"""
+        wait = self._reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def feedback(self, url, status=200, code=0):
+        """
+        根据响应结果调整速率
+        :param url: 请求的URL
+        :param status: HTTP状态码
+        :param code: B站API返回的code，非JSON响应时传 None
+        :return: 是否触发了风控
+        """
+        blocked = status in RISK_CONTROL_STATUS or code in RISK_CONTROL_CODES
+        with self._lock:
+            bucket = self._bucket(url)
+            if blocked:
+                pause = bucket.on_block()
+                rate = bucket.rate
+            elif status == 200:
+                bucket.on_success()
+        if blocked:
+            print(f"触发风控 ({endpoint_of(url)}, HTTP {status}, 代码 {code})，"
+                  f"降速至 {rate:.2f} 次/秒，暂停 {pause:.1f} 秒")
+        return blocked
+
+    def current_rate(self, url):
+        """某个接口当前的限速（请求/秒），尚未请求过的接口返回初始速率"""
+        with self._lock:
+            return self._bucket(url).rate
+
+    def report(self):
+        """
+        各接口限速状态
+        :return: {接口: {'rate', 'effective_rate', 'requests', 'blocks'}}
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    "rate": round(bucket.rate, 3),
+                    "effective_rate": round(bucket.effective_rate(), 3),
+                    "requests": bucket.total_requests,
+                    "blocks": bucket.total_blocks,
+                }
+                for endpoint, bucket in self._buckets.items()
+            }
+
+    def print_report(self):
+        """打印各接口的限速状态和实际请求速率"""
+        stats = self.report()
+        if not stats:
+            return
+        print("\n限速统计:")
+        for endpoint, item in stats.items():
+            print(f"  {endpoint}: 当前限速 {item['rate']:.2f} 次/秒, "
+                  f"实际速率 {item['effective_rate']:.2f} 次/秒, "
+                  f"请求 {item['requests']} 次, 风控 {item['blocks']} 次")
+
+
+_shared_limiter = None
+
+
+def get_rate_limiter():
+    """获取进程内共享的限速器实例"""
+    global _shared_limiter
+    if _shared_limiter is None:
+        _shared_limiter = AdaptiveRateLimiter()
+    return _shared_limiter
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+从原始响应归档离线重建评论和弹幕数据
+功能：读取 response_archive 归档的API响应，用当前的解析逻辑重新生成评论Excel（或流式格式）
+和弹幕Excel，整个过程不发起任何网络请求。修改了解析逻辑或需要新字段时直接重新运行即可。
+使用方法: python replay_archive.py [BV号...]   不指定BV号时重建归档中的全部视频
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+# 添加当前目录到Python路径，以便使用爬虫中的解析函数
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_comments_crawler import replace_sub_replies
+from comment_schema import to_canonical
+from comment_sinks import SINK_EXTENSIONS, open_sink
+from comments_crawler import extract_top_comments, parse_comments_to_dataframe, save_to_excel
+from response_archive import DEFAULT_ARCHIVE_DIR, iter_records, list_bvids
+from rpid_index import RpidIndex
+from video_cache import get_video_cache, parse_view_data
+
+VIEW_ENDPOINT = "/x/web-interface/view"
+REPLY_ENDPOINT = "/x/v2/reply"
+REPLY_MAIN_ENDPOINT = "/x/v2/reply/main"
+REPLY_REPLY_ENDPOINT = "/x/v2/reply/reply"
+DANMU_ENDPOINT = "/x/v1/dm/list.so"
+DANMU_SEG_ENDPOINT = "/x/v2/dm/web/seg.so"
+
+
+def _ok(record):
+    data = record.get("data")
+    return isinstance(data, dict) and data.get("code") == 0 and data.get("data") is not None
+
+
+def _is_first_cursor_page(params):
+    """游标API的第一页（没有上一页游标）"""
+    if "next" in params:
+        return not params["next"]
+    try:
+        offset = json.loads(params.get("pagination_str") or "{}").get("offset")
+    except ValueError:
+        return False
+    return not offset
+
+
+def get_archived_title(bvid, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """从归档的视频信息（或视频元数据缓存）中取视频标题"""
+    title = None
+    for record in iter_records(VIEW_ENDPOINT, bvid, archive_dir):
+        if _ok(record):
+            title = record["data"]["data"].get("title") or title
+    if title:
+        return title
+
+    info = get_video_cache().get(bvid)
+    return info["title"] if info and info["title"] else bvid
+
+
+def load_archived_replies(bvid, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    读取归档的楼中楼回复
+    :return: {主评论ID: 按页码排列的回复对象列表}，同一页归档多次时以最后一次为准
+    """
+    pages = {}
+    for record in iter_records(REPLY_REPLY_ENDPOINT, bvid, archive_dir):
+        if not _ok(record):
+            continue
+        params = record.get("params") or {}
+        root = int(params.get("root", 0))
+        pages.setdefault(root, {})[int(params.get("pn", 1))] = record["data"]["data"].get("replies") or []
+
+    return {
+        root: [reply for pn in sorted(root_pages) for reply in root_pages[pn]]
+        for root, root_pages in pages.items()
+    }
+
+
+def iter_archived_pages(bvid, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    按抓取顺序重建每一页评论（含置顶评论和补全的回复）
+    有页码翻页记录时按页码排序，否则按游标翻页的写入顺序
+    """
+    expanded = load_archived_replies(bvid, archive_dir)
+
+    main_records = [r for r in iter_records(REPLY_MAIN_ENDPOINT, bvid, archive_dir) if _ok(r)]
+    page_records = [r for r in iter_records(REPLY_ENDPOINT, bvid, archive_dir) if _ok(r)]
+
+    top_df = None
+    for record in main_records:
+        if _is_first_cursor_page(record.get("params") or {}):
+            top_comments = extract_top_comments(record["data"])
+            if top_comments:
+                top_df = parse_comments_to_dataframe(top_comments, is_top=True)
+            break
+
+    if page_records:
+        # 页码翻页：游标API只用于获取置顶评论
+        page_records.sort(key=lambda r: int((r.get("params") or {}).get("pn", 1)))
+        records = page_records
+    else:
+        records = main_records
+
+    for record in records:
+        page_df = parse_comments_to_dataframe(record["data"])
+        if top_df is not None:
+            page_df = pd.concat([top_df, page_df], ignore_index=True)
+            top_df = None
+
+        roots = [root for root in page_df.loc[page_df['层级'] == '主评论', '评论ID'] if root in expanded]
+        if roots:
+            page_df, _ = replace_sub_replies(page_df, {root: expanded[root] for root in roots})
+        yield page_df
+
+
+def replay_comments(bvid, archive_dir=DEFAULT_ARCHIVE_DIR, output_dir="B站评论数据_离线重建",
+                    output_format="xlsx"):
+    """
+    从归档重建一个视频的全部评论并保存
+    :param output_format: xlsx，或 csv / jsonl / parquet / sqlite
+    :return: 保存的文件路径，归档中没有评论时返回 None
+    """
+    title = get_archived_title(bvid, archive_dir)
+    seen = RpidIndex(None, capacity=100000)
+
+    if output_format == "xlsx":
+        frames = [seen.drop_seen(page_df, record=True) for page_df in iter_archived_pages(bvid, archive_dir)]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if df.empty:
+            print(f"[{bvid}] 归档中没有评论数据")
+            return None
+        return save_to_excel(to_canonical(df), bvid, title, output_dir)
+
+    path = os.path.join(output_dir, f"【{bvid}】完整评论{SINK_EXTENSIONS[output_format]}")
+    with open_sink(path, output_format) as sink:
+        for page_df in iter_archived_pages(bvid, archive_dir):
+            sink.write(seen.drop_seen(page_df, record=True))
+        rows = sink.rows
+    if rows == 0:
+        print(f"[{bvid}] 归档中没有评论数据")
+        return None
+    print(f"[{bvid}] {rows} 条评论已保存至: {os.path.abspath(path)}")
+    return path
+
+
+def get_archived_parts(bvid, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    从归档的视频信息（或视频元数据缓存）中取分P列表
+    :return: [{'cid', 'page', 'part', 'duration'}, ...]，都没有时返回空列表
+    """
+    from danmu_crawler import list_parts
+
+    info = None
+    for record in iter_records(VIEW_ENDPOINT, bvid, archive_dir):
+        if _ok(record):
+            info = parse_view_data(record["data"]["data"])
+    if info is None:
+        info = get_video_cache().get(bvid)
+    return list_parts(info) if info and info["cid"] else []
+
+
+def load_archived_danmu(bvid, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    读取归档的弹幕，按分P整理：有分段弹幕的分P合并各分段（同一分段归档多次时以最后一次为准），
+    否则使用该分P最后一次归档的弹幕XML
+    :return: [(分P信息, 弹幕列表), ...]，格式同 danmu_crawler.fetch_video_danmu；归档中没有弹幕时返回 None
+    """
+    from danmu_crawler import merge_danmu_segments, parse_danmu_xml
+    from danmu_protobuf import parse_danmu_segment
+
+    segments = {}
+    for record in iter_records(DANMU_SEG_ENDPOINT, bvid, archive_dir):
+        params = record.get("params") or {}
+        cid = int(params.get("oid", 0))
+        segments.setdefault(cid, {})[int(params.get("segment_index", 1))] = \
+            base64.b64decode(record.get("base64") or "")
+
+    xml = {}
+    for record in iter_records(DANMU_ENDPOINT, bvid, archive_dir):
+        if record.get("text"):
+            xml[int((record.get("params") or {}).get("oid", 0))] = record["text"]
+
+    cids = list(dict.fromkeys(list(segments) + list(xml)))
+    if not cids:
+        return None
+
+    parts = [part for part in get_archived_parts(bvid, archive_dir) if part["cid"] in cids]
+    known = {part["cid"] for part in parts}
+    # 视频信息中没有的CID按出现顺序排在后面
+    for cid in cids:
+        if cid not in known:
+            parts.append({"cid": cid, "page": len(parts) + 1, "part": "", "duration": 0})
+
+    parts_data = []
+    for part in parts:
+        cid_segments = segments.get(part["cid"])
+        if cid_segments:
+            danmu_data = merge_danmu_segments([
+                elem for index in sorted(cid_segments) for elem in parse_danmu_segment(cid_segments[index])
+            ])
+        else:
+            danmu_data = parse_danmu_xml(xml[part["cid"]])
+        parts_data.append((part, danmu_data))
+    return parts_data
+
+
+def replay_danmu(bvid, archive_dir=DEFAULT_ARCHIVE_DIR, output_dir="B站评论数据_离线重建"):
+    """
+    从归档重建一个视频（全部分P）的弹幕并保存
+    :return: 保存的文件路径，归档中没有弹幕时返回 None
+    """
+    from danmu_crawler import build_video_danmu_dataframe, build_video_highlights, save_to_excel as save_danmu
+
+    parts_data = load_archived_danmu(bvid, archive_dir)
+    if parts_data is None:
+        return None
+
+    df = build_video_danmu_dataframe(parts_data)
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"danmu_{bvid}.xlsx")
+    if not save_danmu(df, path, {"高光时刻": build_video_highlights(parts_data)}):
+        return None
+    print(f"[{bvid}] {len(df)} 条弹幕已保存至: {os.path.abspath(path)}")
+    return path
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("B站原始响应归档离线重建工具")
+    print("=" * 60)
+
+    archive_dir = DEFAULT_ARCHIVE_DIR  # 归档目录
+    output_dir = "B站评论数据_离线重建"  # 重建结果的保存目录
+    output_format = "xlsx"  # xlsx，或 csv / jsonl / parquet / sqlite
+
+    bvids = sys.argv[1:] or list_bvids(archive_dir)
+    if not bvids:
+        print(f"归档目录 {archive_dir} 中没有任何数据")
+        return
+
+    start_time = time.time()
+    comment_count = danmu_count = 0
+    for i, bvid in enumerate(bvids, 1):
+        print(f"\n[进度 {i}/{len(bvids)}] 重建视频: {bvid}")
+        if replay_comments(bvid, archive_dir, output_dir, output_format):
+            comment_count += 1
+        if replay_danmu(bvid, archive_dir, output_dir):
+            danmu_count += 1
+
+    print("\n" + "=" * 60)
+    print(f"重建完成! 评论: {comment_count} 个视频, 弹幕: {danmu_count} 个视频, "
+          f"耗时 {time.time() - start_time:.1f} 秒")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
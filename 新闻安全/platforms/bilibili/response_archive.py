@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站API原始响应归档
+功能：把爬虫收到的原始响应追加写入压缩的 JSON Lines 文件，按接口和BV号分区：
+    <归档目录>/<接口>/<BV号>.jsonl.gz（或 .jsonl.zst，需要安装 zstandard）
+每行一条记录 {"time", "url", "params", "data"}，弹幕XML等非JSON响应存为 {"text": ...}，
+分段弹幕等二进制响应存为 {"base64": ...}。
+以后修改解析逻辑或需要新字段时，用 replay_archive.py 从归档重建数据，无需重新请求。
+"""
+
+import base64
+import gzip
+import io
+import json
+import os
+import re
+import threading
+import time
+
+from rate_limiter import endpoint_of
+
+DEFAULT_ARCHIVE_DIR = "B站原始数据"
+
+
+def partition_name(url):
+    """接口路径转换为目录名，例如 /x/v2/reply/main -> x_v2_reply_main"""
+    return re.sub(r"[^0-9A-Za-z]+", "_", endpoint_of(url)).strip("_") or "unknown"
+
+
+class ResponseArchive:
+    """按接口和BV号分区的追加式压缩归档"""
+
+    def __init__(self, root=DEFAULT_ARCHIVE_DIR, compression="gzip", max_open_files=64):
+        """
+        :param root: 归档目录
+        :param compression: gzip 或 zstd
+        :param max_open_files: 同时保持打开的分区文件数上限
+        """
+        if compression == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise ImportError("使用zstd压缩需要安装 zstandard: pip install zstandard")
+        elif compression != "gzip":
+            raise ValueError(f"不支持的压缩方式: {compression}")
+
+        self.root = root
+        self.compression = compression
+        self.extension = ".jsonl.gz" if compression == "gzip" else ".jsonl.zst"
+        self.max_open_files = max_open_files
+        self.records = 0
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _path(self, url, bvid):
+        return os.path.join(self.root, partition_name(url), f"{bvid or 'unknown'}{self.extension}")
+
+    def _open(self, path):
+        handle = self._files.pop(path, None)
+        if handle is None:
+            if len(self._files) >= self.max_open_files:
+                # 关闭最早打开的分区文件
+                oldest = next(iter(self._files))
+                self._files.pop(oldest).close()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 追加模式会在文件末尾写入新的压缩段，读取时各段会被连续解压
+            if self.compression == "gzip":
+                handle = gzip.open(path, "at", encoding="utf-8")
+            else:
+                import zstandard
+                raw = zstandard.ZstdCompressor().stream_writer(open(path, "ab"), closefd=True)
+                handle = io.TextIOWrapper(raw, encoding="utf-8")
+        # 按最近使用顺序排列
+        self._files[path] = handle
+        return handle
+
+    def record(self, url, bvid, params=None, data=None, text=None, content=None):
+        """
+        追加一条响应
+        :param url: 请求URL（决定分区）
+        :param bvid: 视频BV号（决定分区）
+        :param params: 请求参数
+        :param data: JSON响应
+        :param text: 非JSON响应的原文
+        :param content: 二进制响应（如分段弹幕的protobuf），以base64保存
+        """
+        entry = {"time": time.time(), "url": url, "params": params or {}}
+        if content is not None:
+            entry["base64"] = base64.b64encode(content).decode("ascii")
+        elif text is not None:
+            entry["text"] = text
+        else:
+            entry["data"] = data
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+
+        with self._lock:
+            handle = self._open(self._path(url, bvid))
+            handle.write(line)
+            # 同步刷新压缩流，程序中断时已写入的记录仍可读取
+            handle.flush()
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            for handle in self._files.values():
+                handle.close()
+            self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _open_for_read(path):
+    if path.endswith(".zst"):
+        import zstandard
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+def list_bvids(root=DEFAULT_ARCHIVE_DIR):
+    """归档中出现过的全部BV号"""
+    bvids = set()
+    if not os.path.isdir(root):
+        return []
+    for partition in os.listdir(root):
+        directory = os.path.join(root, partition)
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.endswith((".jsonl.gz", ".jsonl.zst")):
+                bvids.add(name.split(".jsonl")[0])
+    return sorted(bvids)
+
+
+def iter_records(endpoint, bvid, root=DEFAULT_ARCHIVE_DIR):
+    """
+    按写入顺序读取某个接口、某个视频的全部归档记录
+    :param endpoint: 接口URL或路径，例如 /x/v2/reply/main
+    """
+    directory = os.path.join(root, partition_name(endpoint))
+    for extension in (".jsonl.gz", ".jsonl.zst"):
+        path = os.path.join(directory, bvid + extension)
+        if not os.path.exists(path):
+            continue
+        with _open_for_read(path) as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    yield json.loads(line)
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+                # 程序异常退出时最后一个压缩段或最后一行可能不完整
+                print(f"归档文件 {path} 末尾不完整，已读取完整部分")
+
+
+_shared_archive = None
+
+
+def enable_archive(root=DEFAULT_ARCHIVE_DIR, compression="gzip"):
+    """
+    开启进程内共享的原始响应归档，开启后所有爬虫都会把收到的响应写入归档
+    :return: ResponseArchive 实例
+    """
+    global _shared_archive
+    if _shared_archive is None:
+        import atexit
+        _shared_archive = ResponseArchive(root, compression)
+        atexit.register(_shared_archive.close)
+    return _shared_archive
+
+
+def get_response_archive():
+    """获取共享的原始响应归档，未开启时返回 None"""
+    return _shared_archive
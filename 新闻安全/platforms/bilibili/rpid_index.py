@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评论ID（rpid）去重索引
+功能：记录已经写出过的评论ID，爬虫写出评论、合并脚本合并文件前先查询索引，丢弃重复评论。
+精确记录保存在 SQLite（rpid 作为整数主键，每条约十几个字节），
+前面用布隆过滤器快速判断"一定没见过"，绝大多数新评论无需查询数据库，
+数千万条评论ID时仍然很快。不指定路径时只在内存中去重。
+"""
+
+import atexit
+import math
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_INDEX_PATH = os.path.join("B站评论数据", "rpid_index.db")
+
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_SALT = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix64(x):
+    """splitmix64 混合函数，把评论ID打散为64位哈希"""
+    x = (x ^ (x >> np.uint64(30))) * _MIX1
+    x = (x ^ (x >> np.uint64(27))) * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+
+def to_rpid_array(values):
+    """把评论ID序列转换为 int64 数组，无法转换的值（空值等）被丢弃"""
+    ids = pd.to_numeric(pd.Series(values), errors="coerce").dropna()
+    return ids.astype("int64").to_numpy()
+
+
+class BloomFilter:
+    """基于 numpy 位数组的布隆过滤器，批量判断和插入整数ID"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        :param capacity: 预计容纳的ID数量
+        :param error_rate: 期望的误判率
+        """
+        self.capacity = max(1, int(capacity))
+        self.error_rate = error_rate
+        self.num_bits = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, ids):
+        # 双重哈希：第 i 个哈希位置为 h1 + i*h2
+        x = np.asarray(ids, dtype=np.int64).view(np.uint64)
+        h1 = _mix64(x)
+        h2 = _mix64(x ^ _SALT) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def add(self, ids):
+        if len(ids) == 0:
+            return
+        positions = self._positions(ids).ravel()
+        byte_index = (positions >> np.uint64(3)).astype(np.int64)
+        bit_index = (positions & np.uint64(7)).astype(np.uint8)
+        # 同一字节可能出现多次：按位分8轮写入，每轮写入的值相同，重复下标不会互相覆盖
+        for bit in range(8):
+            selected = byte_index[bit_index == bit]
+            self.bits[selected] |= np.uint8(1 << bit)
+        self.count += len(ids)
+
+    def might_contain(self, ids):
+        """
+        :return: 布尔数组，False 表示一定不存在，True 表示可能存在
+        """
+        if len(ids) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(ids)
+        hits = (self.bits[(positions >> np.uint64(3)).astype(np.int64)]
+                >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return hits.all(axis=1)
+
+    def save(self, path):
+        np.savez(path, bits=self.bits,
+                 meta=np.array([self.capacity, self.num_bits, self.num_hashes, self.count], dtype=np.int64),
+                 error_rate=np.array([self.error_rate]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            capacity, num_bits, num_hashes, count = (int(v) for v in data["meta"])
+            bloom = cls.__new__(cls)
+            bloom.capacity = capacity
+            bloom.error_rate = float(data["error_rate"][0])
+            bloom.num_bits = num_bits
+            bloom.num_hashes = num_hashes
+            bloom.bits = data["bits"].copy()
+            bloom.count = count
+        return bloom
+
+
+class RpidIndex:
+    """评论ID去重索引：布隆过滤器 + 精确记录（SQLite 或内存集合）"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, capacity=10_000_000, error_rate=0.001):
+        """
+        :param path: 索引数据库路径，None表示只在内存中去重
+        :param capacity: 布隆过滤器的初始容量，记录数超过容量时自动扩容重建
+        :param error_rate: 布隆过滤器误判率（误判只会多查一次精确记录，不会误删评论）
+        """
+        self.path = path
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._memory = None
+        self.conn = None
+
+        if path is None:
+            self._memory = set()
+            self.bloom = BloomFilter(capacity, error_rate)
+            return
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS rpids (rpid INTEGER PRIMARY KEY, bvid TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_rpids_bvid ON rpids (bvid)")
+
+        self.bloom = self._load_bloom(capacity)
+
+    @property
+    def bloom_path(self):
+        return self.path + ".bloom.npz"
+
+    def __len__(self):
+        if self._memory is not None:
+            return len(self._memory)
+        return self.conn.execute("SELECT COUNT(*) FROM rpids").fetchone()[0]
+
+    def _load_bloom(self, capacity):
+        """读取保存的布隆过滤器；与数据库记录数不一致时（例如上次异常退出）重新构建"""
+        total = len(self)
+        if os.path.exists(self.bloom_path):
+            try:
+                bloom = BloomFilter.load(self.bloom_path)
+                if bloom.count == total:
+                    return bloom
+            except Exception as e:
+                print(f"读取布隆过滤器失败，将重新构建: {e}")
+        return self._build_bloom(max(capacity, total * 2))
+
+    def _build_bloom(self, capacity):
+        bloom = BloomFilter(capacity, self.error_rate)
+        if self._memory is not None:
+            bloom.add(np.fromiter(self._memory, dtype=np.int64, count=len(self._memory)))
+            return bloom
+
+        cursor = self.conn.execute("SELECT rpid FROM rpids")
+        while True:
+            rows = cursor.fetchmany(500000)
+            if not rows:
+                break
+            bloom.add(np.array([row[0] for row in rows], dtype=np.int64))
+        return bloom
+
+    def _exact_contains(self, ids):
+        if self._memory is not None:
+            return np.array([int(i) in self._memory for i in ids], dtype=bool)
+
+        found = set()
+        for start in range(0, len(ids), 500):
+            chunk = [int(i) for i in ids[start:start + 500]]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT rpid FROM rpids WHERE rpid IN ({placeholders})", chunk
+            ))
+        return np.array([int(i) in found for i in ids], dtype=bool)
+
+    def _contains(self, ids):
+        result = self.bloom.might_contain(ids)
+        # 只有布隆过滤器判断"可能存在"的ID需要查精确记录
+        maybe = np.flatnonzero(result)
+        if len(maybe):
+            result[maybe] = self._exact_contains(ids[maybe])
+        return result
+
+    def contains(self, rpids):
+        """
+        批量判断评论ID是否已记录
+        :param rpids: 整数评论ID序列
+        :return: 布尔数组
+        """
+        ids = np.asarray(rpids, dtype=np.int64)
+        with self._lock:
+            return self._contains(ids)
+
+    def add(self, rpids, bvid=None):
+        """
+        记录一批评论ID
+        :param bvid: 评论所属视频，用于 forget
+        """
+        ids = np.unique(np.asarray(rpids, dtype=np.int64))
+        if len(ids) == 0:
+            return
+        with self._lock:
+            new_ids = ids[~self._contains(ids)]
+            if len(new_ids) == 0:
+                return
+            if self._memory is not None:
+                self._memory.update(new_ids.tolist())
+            else:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO rpids (rpid, bvid) VALUES (?, ?)",
+                        ((i, bvid) for i in new_ids.tolist())
+                    )
+            self.bloom.add(new_ids)
+
+            # 超过容量后误判率会上升，按两倍容量重建
+            if self.bloom.count > self.bloom.capacity:
+                self.bloom = self._build_bloom(max(self.bloom.capacity, self.bloom.count) * 2)
+
+    def drop_seen(self, df, column="评论ID", record=False, bvid=None):
+        """
+        丢弃已记录过的评论，以及本批内重复的评论
+        :param df: 评论DataFrame
+        :param column: 评论ID列名
+        :param record: 是否同时把保留下来的评论ID记入索引；
+                       需要先写出再记录时（例如配合检查点）传 False，写出后调用 add_frame
+        :return: 去重后的DataFrame
+        """
+        if df.empty or column not in df.columns:
+            return df
+
+        ids = pd.to_numeric(df[column], errors="coerce")
+        valid = ids.notna().to_numpy()
+        rpids = ids[valid].astype("int64").to_numpy()
+
+        duplicated = pd.Series(rpids).duplicated().to_numpy() | self.contains(rpids)
+        keep = np.ones(len(df), dtype=bool)
+        keep[np.flatnonzero(valid)[duplicated]] = False
+
+        if record:
+            self.add(rpids[~duplicated], bvid)
+        return df[keep] if not keep.all() else df
+
+    def add_frame(self, df, column="评论ID", bvid=None):
+        """把DataFrame中的评论ID记入索引"""
+        if df.empty or column not in df.columns:
+            return
+        self.add(to_rpid_array(df[column]), bvid)
+
+    def forget(self, bvid):
+        """
+        删除某个视频记录过的评论ID（例如检查点重置、视频需要重新完整抓取时）
+        布隆过滤器无法删除，残留的位只会让这些ID多查一次精确记录
+        """
+        if self.conn is None:
+            return
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM rpids WHERE bvid = ?", (bvid,))
+            self.bloom.count = len(self)
+
+    def save(self):
+        """保存布隆过滤器，下次启动时无需从数据库重建"""
+        if self.conn is not None:
+            with self._lock:
+                self.bloom.save(self.bloom_path)
+
+    def close(self):
+        if self.conn is not None:
+            self.save()
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_shared_index = None
+
+
+def get_rpid_index():
+    """获取进程内共享的评论ID索引"""
+    global _shared_index
+    if _shared_index is None:
+        _shared_index = RpidIndex()
+        # 退出时保存布隆过滤器，下次启动无需重建
+        atexit.register(_shared_index.close)
+    return _shared_index
@@ -5,10 +5,12 @@
 针对特定UP主和时间范围
 """
 
-import subprocess
 import sys
 import os
 
+# 添加当前目录到Python路径，以便直接导入UP主评论爬取模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
 def run_up_comments_crawler():
     # 设置参数
     up_name = "哔哩哔哩英雄联盟赛事"
@@ -30,30 +32,12 @@ def run_up_comments_crawler():
         print("错误：未找到BILI_COOKIE，请确保.env文件中包含有效的Cookie")
         return
     
-    # 准备输入
-    inputs = f"{cookie}\n{up_name}\n{start_date}\n{end_date}\n{max_videos}\n"
-    
-    # 运行主爬取脚本
+    # 在当前进程内直接调用UP主评论爬取，不再通过子进程和标准输入传参
     try:
-        process = subprocess.Popen([
-            sys.executable, 
-            os.path.join(os.path.dirname(__file__), 'up_comments_crawler.py')
-        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-           text=True, encoding='utf-8')
-        
-        stdout, stderr = process.communicate(input=inputs, timeout=3600)  # 1小时超时
-        
-        print("STDOUT:")
-        print(stdout)
-        
-        if stderr:
-            print("STDERR:")
-            print(stderr)
-            
-        print(f"进程退出码: {process.returncode}")
-        
-    except subprocess.TimeoutExpired:
-        print("任务超时")
+        import up_comments_crawler
+        up_comments_crawler.main(
+            up_name=up_name, start_date=start_date, end_date=end_date, max_videos=max_videos
+        )
     except Exception as e:
         print(f"运行出错: {str(e)}")
 
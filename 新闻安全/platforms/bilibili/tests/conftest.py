@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：在本机启动模拟B站API服务器（mock_bilibili_server.py），所有爬虫请求都发往模拟服务器，
+每个测试在独立的临时目录中运行，检查点、索引和缓存文件互不影响
+"""
+
+import os
+import socket
+import sys
+
+import pytest
+
+BILIBILI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BILIBILI_DIR)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# 爬虫在导入时读取 API 地址，必须在导入任何爬虫模块之前设置；
+# Cookie池指向不存在的文件，测试不会读取本机配置的真实账号
+MOCK_PORT = _free_port()
+os.environ["BILI_API_BASE"] = f"http://127.0.0.1:{MOCK_PORT}"
+os.environ["BILI_COOKIE_POOL"] = os.path.join(BILIBILI_DIR, "tests", "no_such_cookie_pool.json")
+
+# 测试用限速参数：不限速，风控后只暂停很短的时间
+FAST_LIMITER = {"rate": 10000.0, "capacity": 10000, "min_rate": 1000.0, "max_rate": 10000.0,
+                "cooldown": 0.01, "max_cooldown": 0.05}
+
+
+@pytest.fixture(scope="session")
+def mock_server():
+    from mock_bilibili_server import MockBilibiliServer
+    from rate_limiter import get_rate_limiter
+
+    get_rate_limiter().bucket_options.update(FAST_LIMITER)
+    server = MockBilibiliServer(port=MOCK_PORT)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def server(mock_server, tmp_path, monkeypatch):
+    """每个测试开始时清除上一个测试设置的风控错误，并切换到临时目录"""
+    monkeypatch.chdir(tmp_path)
+    mock_server.error_rate = 0.0
+    mock_server.error_paths = None
+    mock_server.reset_stats()
+    yield mock_server
+    mock_server.error_rate = 0.0
+    mock_server.error_paths = None
+
+
+@pytest.fixture
+def limiter():
+    """每个测试使用新的限速器，上一个测试的降速不会带到下一个测试"""
+    from rate_limiter import AdaptiveRateLimiter
+    return AdaptiveRateLimiter(**FAST_LIMITER)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""async_comments_crawler 在模拟服务器上的行为：评论条数、评论ID唯一、断点续抓和增量抓取"""
+
+import asyncio
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from async_comments_crawler import AsyncCommentCrawler, crawl_comments
+from crawl_checkpoint import CrawlCheckpoint
+from mock_bilibili_server import DEFAULT_PAGE_SIZE, PREVIEW_REPLIES, REPLY_PATH, REPLY_REPLY_PATH, SyntheticVideo
+from rpid_index import RpidIndex
+from video_cache import VideoCache
+
+
+def expected_rows(server, bvid, expand_replies=True):
+    """模拟视频应抓取到的评论数：主评论 + 置顶评论 + 回复（不补全时只有预览回复）"""
+    video = SyntheticVideo(bvid, **server.video_options)
+    if expand_replies:
+        replies = video.reply_total
+    else:
+        replies = sum(min(PREVIEW_REPLIES, len(subs)) for subs in video.replies.values())
+    return len(video.by_time) + 1 + replies
+
+
+def crawl(bvid, limiter, checkpoint=None, **options):
+    """用独立的限速器和视频缓存抓取一个视频，返回 crawl_video 的结果"""
+    async def run():
+        async with AsyncCommentCrawler(rate_limiter=limiter, checkpoint=checkpoint,
+                                       video_cache=VideoCache("video_cache.db"), **options) as crawler:
+            return await crawler.crawl_video(bvid)
+
+    return asyncio.run(run())
+
+
+def assert_unique(df):
+    assert not df['评论ID'].duplicated().any()
+
+
+@pytest.mark.parametrize("pagination", ["page", "cursor"])
+def test_crawl_video_expands_all_replies(server, limiter, pagination):
+    bvid = f"BVtest{pagination}01"
+    result = crawl(bvid, limiter, pagination=pagination, expand_replies=True)
+
+    assert result["rows"] == expected_rows(server, bvid)
+    assert_unique(result["df"])
+
+
+def test_crawl_video_without_expansion_keeps_previews(server, limiter):
+    bvid = "BVtestpreview01"
+    result = crawl(bvid, limiter, pagination="cursor", expand_replies=False)
+
+    assert result["rows"] == expected_rows(server, bvid, expand_replies=False)
+    assert_unique(result["df"])
+
+
+def test_failed_reply_expansion_stops_before_saving_page(server, limiter):
+    bvid = "BVtestexpandfail01"
+    server.error_paths = {REPLY_REPLY_PATH}
+    server.error_rate = 1.0
+
+    result = crawl(bvid, limiter, pagination="cursor", expand_replies=True, max_retries=0)
+
+    # 第1页就有需要补全回复的主评论，补全失败时这一页不应只带着预览回复被保存
+    assert result["rows"] == 0
+
+
+def test_resume_recovers_replies_after_expansion_failures(server, limiter):
+    bvid = "BVtestexpandresume01"
+    server.error_paths = {REPLY_REPLY_PATH}
+    server.error_rate = 0.3
+
+    with CrawlCheckpoint("checkpoint.db") as checkpoint:
+        for _ in range(30):
+            result = crawl(bvid, limiter, checkpoint, pagination="cursor", expand_replies=True, max_retries=1)
+            if checkpoint.get_state(bvid)["done"]:
+                break
+        assert checkpoint.get_state(bvid)["done"]
+
+    assert result["rows"] == expected_rows(server, bvid)
+    assert_unique(result["df"])
+
+
+def test_resume_after_failed_page(server, limiter):
+    bvid = "BVtestresume01"
+    expected = expected_rows(server, bvid, expand_replies=False)
+
+    with CrawlCheckpoint("checkpoint.db") as checkpoint:
+        # 第3页之后所有请求都被风控，第一次运行只能保存前几页
+        def fail_after_page_3(page, page_df, total):
+            if page == 3:
+                server.error_rate = 1.0
+
+        async def first_run():
+            async with AsyncCommentCrawler(rate_limiter=limiter, checkpoint=checkpoint, max_retries=0,
+                                           page_window=1, video_cache=VideoCache("video_cache.db")) as crawler:
+                return await crawler.crawl_video(bvid, on_page=fail_after_page_3)
+
+        first = asyncio.run(first_run())
+        state = checkpoint.get_state(bvid)
+        assert not state["done"]
+        assert state["next_page"] == 4
+        assert 0 < first["rows"] < expected
+
+        server.error_rate = 0.0
+        server.reset_stats()
+        second = crawl(bvid, limiter, checkpoint)
+
+        assert checkpoint.get_state(bvid)["done"]
+        # 第二次运行从第4页继续，不重新请求已保存的页
+        assert server.requests[REPLY_PATH] == page_count(server, bvid) - 3
+        assert second["rows"] == expected
+        assert_unique(second["df"])
+
+
+def page_count(server, bvid):
+    """模拟视频按页码翻页的总页数"""
+    video = SyntheticVideo(bvid, **server.video_options)
+    return -(-len(video.by_time) // DEFAULT_PAGE_SIZE)
+
+
+def test_incremental_rerun_adds_nothing_when_unchanged(server, limiter):
+    bvid = "BVtestincr01"
+    options = {"pagination": "cursor", "sort_mode": 2, "incremental": True, "expand_replies": True}
+
+    with CrawlCheckpoint("checkpoint.db") as checkpoint:
+        first = crawl(bvid, limiter, checkpoint, **options)
+        assert checkpoint.get_state(bvid)["done"]
+        assert checkpoint.get_state(bvid)["newest_rpid"]
+
+        second = crawl(bvid, limiter, checkpoint, **options)
+
+    assert first["rows"] == second["rows"] == expected_rows(server, bvid)
+    assert_unique(second["df"])
+
+
+class FailingPageCrawler(AsyncCommentCrawler):
+    """第 fail_page 次请求游标翻页接口时返回失败"""
+
+    fail_page = 2
+
+    async def fetch_main_page(self, aid, bvid, offset=""):
+        self.main_pages = getattr(self, "main_pages", 0) + 1
+        if self.main_pages == self.fail_page:
+            return None
+        return await super().fetch_main_page(aid, bvid, offset)
+
+
+def test_incremental_failure_keeps_watermark(server, limiter):
+    bvid = "BVtestincrfail01"
+    options = {"pagination": "cursor", "sort_mode": 2, "incremental": True, "expand_replies": False}
+
+    with CrawlCheckpoint("checkpoint.db") as checkpoint:
+        crawl(bvid, limiter, checkpoint, **options)
+        saved = checkpoint.load_comments(bvid)
+
+        # 把最新评论记录退回到第50新的主评论，相当于之后又新增了49条主评论（超过两页）
+        root = SyntheticVideo(bvid, **server.video_options).by_time[49]
+        old_ctime = datetime.fromtimestamp(root["ctime"]).strftime('%Y-%m-%d %H:%M:%S')
+        with checkpoint.conn:
+            checkpoint.conn.execute("UPDATE videos SET newest_ctime = ?, newest_rpid = ? WHERE bvid = ?",
+                                    (old_ctime, root["rpid"], bvid))
+
+        async def failing_run():
+            async with FailingPageCrawler(rate_limiter=limiter, checkpoint=checkpoint,
+                                          video_cache=VideoCache("video_cache.db"), **options) as crawler:
+                return await crawler.crawl_video(bvid)
+
+        asyncio.run(failing_run())
+
+        # 第2页失败：不追加第1页的新评论，也不推进最新评论记录
+        state = checkpoint.get_state(bvid)
+        assert (state["newest_ctime"], state["newest_rpid"]) == (old_ctime, root["rpid"])
+        assert len(checkpoint.load_comments(bvid)) == len(saved)
+
+        crawl(bvid, limiter, checkpoint, **options)
+        newest = SyntheticVideo(bvid, **server.video_options).by_time[0]
+        assert checkpoint.get_state(bvid)["newest_ctime"] == \
+            datetime.fromtimestamp(newest["ctime"]).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_rerun_without_checkpoint_exports_all_comments(server, limiter):
+    bvid = "BVtestrerun01"
+    with RpidIndex("rpid_index.db") as index:
+        options = dict(rate_limiter=limiter, video_cache=VideoCache("video_cache.db"), rpid_index=index,
+                       pagination="cursor")
+        first, = crawl_comments(bvid, checkpoint_path=None, **options)
+        second, = crawl_comments(bvid, checkpoint_path=None, **options)
+
+    assert first["rows"] == second["rows"] == expected_rows(server, bvid)
+    assert len(pd.read_excel(second["path"])) == expected_rows(server, bvid)
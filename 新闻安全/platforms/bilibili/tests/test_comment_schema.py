@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""comment_schema 时间转换：整列换算与逐条 datetime.fromtimestamp 一致，包括夏令时前后"""
+
+import time
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from comment_schema import to_local_datetime
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_local_datetime_follows_dst(new_york):
+    # 2024-03-10 和 2024-11-03 的夏令时切换前后
+    seconds = np.array([1710054000 - 1, 1710054000, 1730613600 - 1, 1730613600, 1718000000])
+
+    expected = [np.datetime64(datetime.fromtimestamp(int(s)), "s") for s in seconds]
+    assert to_local_datetime(seconds).tolist() == [e.item() for e in expected]
+    assert (to_local_datetime(seconds * 1000 + 250, "ms") - to_local_datetime(seconds).astype("datetime64[ms]")
+            == np.timedelta64(250, "ms")).all()
+    assert len(to_local_datetime([])) == 0
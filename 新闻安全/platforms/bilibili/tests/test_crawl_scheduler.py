@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""crawl_scheduler 的抓取顺序：按每请求价值排序后覆盖曲线前高后低，已完成的视频只计增量"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from crawl_checkpoint import CrawlCheckpoint
+from crawl_scheduler import coverage_at, estimate_requests, plan_crawl
+
+RESULTS_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "bilibili_results_20251219_153805.csv")
+
+
+def synthetic_jobs(count=60):
+    """评论数和播放量无关的任务列表：评论数决定请求数，播放量决定价值"""
+    return [{'BV号': f"BVsched{i:05d}", '评论数': (i * 7919) % 5000, '播放量': (i * 104729) % 2000000}
+            for i in range(count)]
+
+
+def assert_front_loaded(plan):
+    total_seconds = plan['预计耗时(秒)'].iloc[-1]
+    for share in (0.25, 0.5):
+        assert coverage_at(plan, total_seconds * share) > share + 0.05
+    values = plan['每请求价值'].tolist()
+    assert values == sorted(values, reverse=True)
+
+
+def test_coverage_is_front_loaded():
+    assert_front_loaded(plan_crawl(synthetic_jobs(), checkpoint_path=None, rate=5))
+
+
+@pytest.mark.skipif(not os.path.exists(RESULTS_CSV), reason="缺少搜索结果CSV")
+def test_coverage_is_front_loaded_on_search_results():
+    assert_front_loaded(plan_crawl(RESULTS_CSV, checkpoint_path=None, rate=5))
+
+
+def test_cheap_popular_video_goes_first():
+    jobs = [
+        {'BV号': "BVbig", '评论数': 20000, '播放量': 3000000},
+        {'BV号': "BVcheap", '评论数': 200, '播放量': 1000000},
+        {'BV号': "BVquiet", '评论数': 200, '播放量': 1000},
+    ]
+    plan = plan_crawl(jobs, checkpoint_path=None, rate=1)
+    assert plan['BV号'].tolist() == ["BVcheap", "BVbig", "BVquiet"]
+    assert plan['累计请求数'].iloc[-1] == sum(estimate_requests(job['评论数']) for job in jobs)
+
+
+def test_done_videos_only_count_new_comments(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    with CrawlCheckpoint(path) as checkpoint:
+        checkpoint.start_video("BVdone", 1, "", "cursor", "time")
+        checkpoint.save_page("BVdone", pd.DataFrame(), {"next_page": 2, "cursor": "", "total": 4900})
+        checkpoint.mark_done("BVdone")
+    jobs = [{'BV号': "BVdone", '评论数': 5000, '播放量': 5000000},
+            {'BV号': "BVnew", '评论数': 500, '播放量': 100000}]
+    plan = plan_crawl(jobs, checkpoint_path=path, rate=1).set_index('BV号')
+    assert plan.loc["BVdone", '预计评论数'] == 100
+    assert plan.loc["BVdone", '价值'] == 100
+    assert plan.index.tolist() == ["BVnew", "BVdone"]
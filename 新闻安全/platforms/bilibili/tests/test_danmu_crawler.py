@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""danmu_crawler 在模拟服务器上的行为：XML 和分段接口获取的弹幕条数与弹幕ID唯一"""
+
+import asyncio
+
+import pytest
+
+from danmu_crawler import fetch_video_danmu
+
+
+@pytest.mark.parametrize("mode", ["xml", "seg"])
+def test_fetch_video_danmu_gets_every_danmu(server, mode):
+    parts = asyncio.run(fetch_video_danmu(f"BVtestdanmu{mode}", mode=mode))
+
+    assert len(parts) == server.video_options["parts"]
+    for part, df in parts:
+        assert len(df) == server.video_options["danmu"]
+        assert not df['弹幕ID'].duplicated().any()
+
+
+def test_fetch_video_danmu_retries_risk_control(server, monkeypatch):
+    import danmu_crawler
+    monkeypatch.setattr(danmu_crawler, "MAX_RETRIES", 30)
+    server.error_rate = 0.5
+
+    async def fetch_all():
+        return await asyncio.gather(*(fetch_video_danmu(f"BVtestdanmuretry{i}", mode="seg") for i in range(10)))
+
+    videos = asyncio.run(fetch_all())
+
+    assert sum(server.errors.values()) > 0
+    for parts in videos:
+        assert len(parts) == server.video_options["parts"]
+        for part, df in parts:
+            assert len(df) == server.video_options["danmu"]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""danmu_timeline 按秒统计：bincount 与逐秒分组一致，滑动密度和高光时刻"""
+
+import numpy as np
+import pandas as pd
+
+from danmu_timeline import find_highlights, format_time, per_second_counts, rolling_density, second_labels, to_seconds
+
+
+def test_per_second_counts_match_groupby():
+    rng = np.random.default_rng(7)
+    times = rng.uniform(-1.0, 600.0, 5000)
+    seconds = to_seconds(times)
+
+    counts = per_second_counts(seconds, length=700)
+    expected = pd.Series(np.maximum(np.floor(times), 0).astype(int)).value_counts()
+
+    assert len(counts) == 700
+    assert counts.sum() == len(times)
+    assert all(counts[second] == count for second, count in expected.items())
+
+    labels = second_labels(counts)[seconds]
+    assert labels[0] == f"{format_time(seconds[0])} (共{counts[seconds[0]]}条)"
+
+
+def test_rolling_density_keeps_total():
+    counts = np.zeros(100, dtype=np.int64)
+    counts[50] = 30
+
+    density = rolling_density(counts, window=10)
+    assert np.isclose(density.max(), 3.0)
+    assert np.count_nonzero(density) == 10
+    assert np.allclose(rolling_density(np.ones(20), window=5), 1.0)
+
+
+def test_find_highlights_locates_burst():
+    rng = np.random.default_rng(3)
+    background = rng.uniform(0, 1200, 1200)
+    burst = rng.uniform(300, 305, 400)
+    times = np.concatenate([background, burst])
+    texts = ["普通弹幕"] * len(background) + ["名场面"] * len(burst)
+
+    highlights = find_highlights(times, texts, top=3)
+    first = highlights.iloc[0]
+    assert first['开始(秒)'] <= 300 and first['结束(秒)'] >= 305
+    assert 300 <= first['峰值秒'] <= 305
+    assert first['代表弹幕'] == "名场面"
+    assert first['弹幕数'] >= len(burst)
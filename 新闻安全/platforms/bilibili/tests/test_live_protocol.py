@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""live_protocol 拆包：普通包、zlib 压缩的多个子包、不完整的帧和解压失败的包"""
+
+import zlib
+
+from live_protocol import (HEADER_SIZE, OP_AUTH_REPLY, OP_HEARTBEAT_REPLY, OP_MESSAGE, PROTO_JSON,
+                           PROTO_ZLIB, decode_frame, encode_packet)
+
+
+def danmu(text):
+    return {"cmd": "DANMU_MSG", "info": [[0], text, [1, "用户"]]}
+
+
+def compressed(*packets):
+    return encode_packet(OP_MESSAGE, zlib.compress(b"".join(packets)), protover=PROTO_ZLIB)
+
+
+def test_plain_packets_in_one_frame():
+    frame = encode_packet(OP_AUTH_REPLY, {"code": 0}) + encode_packet(OP_HEARTBEAT_REPLY, (42).to_bytes(4, "big"))
+
+    assert decode_frame(frame) == [(OP_AUTH_REPLY, b'{"code":0}'), (OP_HEARTBEAT_REPLY, (42).to_bytes(4, "big"))]
+
+
+def test_zlib_packet_is_split_into_sub_packets():
+    inner = [encode_packet(OP_MESSAGE, danmu(f"弹幕{i}"), protover=PROTO_JSON) for i in range(3)]
+    packets = decode_frame(compressed(*inner) + encode_packet(OP_HEARTBEAT_REPLY, b"\x00\x00\x00\x01"))
+
+    assert [op for op, _ in packets] == [OP_MESSAGE] * 3 + [OP_HEARTBEAT_REPLY]
+    assert all(b"DANMU_MSG" in body for _, body in packets[:3])
+    assert "弹幕2".encode("utf-8") in packets[2][1]
+
+
+def test_truncated_frame_keeps_complete_packets():
+    frame = encode_packet(OP_MESSAGE, danmu("完整")) + encode_packet(OP_MESSAGE, danmu("被截断"))
+
+    packets = decode_frame(frame[:-5])
+    assert len(packets) == 1
+    assert decode_frame(frame[:HEADER_SIZE - 1]) == []
+
+
+def test_corrupt_zlib_packet_does_not_drop_other_packets():
+    good = compressed(encode_packet(OP_MESSAGE, danmu("正常"), protover=PROTO_JSON))
+    bad = encode_packet(OP_MESSAGE, b"not zlib data", protover=PROTO_ZLIB)
+
+    packets = decode_frame(bad + good)
+    assert packets[0] == (OP_MESSAGE, b"not zlib data")
+    assert len(packets) == 2 and b"DANMU_MSG" in packets[1][1]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""rate_limiter 令牌桶：请求时间统计只保留窗口内的记录"""
+
+import rate_limiter
+from rate_limiter import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_recent_requests_stay_within_window(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    bucket = TokenBucket(rate=100.0, capacity=100, max_rate=100.0, window=1.0)
+
+    for _ in range(2000):
+        clock.now += 0.01
+        bucket.reserve()
+
+    assert bucket.total_requests == 2000
+    assert len(bucket.recent) <= 101
+    assert abs(bucket.effective_rate() - 100.0) < 2.0
+
+
+def test_blocks_during_pause_decrease_rate_once(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    bucket = TokenBucket(rate=4.0, capacity=8, cooldown=10.0)
+
+    # 暂停前已发出的8个请求陆续返回风控
+    for _ in range(8):
+        bucket.reserve()
+    for _ in range(8):
+        clock.now += 0.1
+        bucket.on_block()
+
+    assert bucket.rate == 2.0
+    assert bucket.total_blocks == 8
+
+    # 暂停结束后仍被风控：再降一次，暂停时间翻倍
+    clock.now += 10.0
+    bucket.reserve()
+    assert bucket.on_block() == 20.0
+    assert bucket.rate == 1.0
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""rpid_index 去重：批内重复、跨批次已记录、持久化和按视频 forget"""
+
+import pandas as pd
+
+from rpid_index import RpidIndex
+
+
+def frame(rpids):
+    return pd.DataFrame({"评论ID": rpids, "内容": [f"评论{i}" for i in rpids]})
+
+
+def test_drop_seen_removes_batch_and_recorded_duplicates():
+    index = RpidIndex(None, capacity=1000)
+
+    first = index.drop_seen(frame([1, 2, 2, 3]), record=True)
+    assert first["评论ID"].tolist() == [1, 2, 3]
+
+    second = index.drop_seen(frame([3, 4, 1, 5]), record=True)
+    assert second["评论ID"].tolist() == [4, 5]
+    assert index.contains([1, 4, 6]).tolist() == [True, True, False]
+
+
+def test_drop_seen_without_record_leaves_index_unchanged():
+    index = RpidIndex(None, capacity=1000)
+
+    assert len(index.drop_seen(frame([7, 8]))) == 2
+    assert len(index) == 0
+    index.add_frame(frame([7, 8]), bvid="BVa")
+    assert index.drop_seen(frame([7, 8, 9]))["评论ID"].tolist() == [9]
+
+
+def test_forget_only_drops_that_video_and_persists(tmp_path):
+    path = str(tmp_path / "rpid_index.db")
+    with RpidIndex(path, capacity=1000) as index:
+        index.add_frame(frame([1, 2, 3]), bvid="BVa")
+        index.add_frame(frame([10, 11]), bvid="BVb")
+        index.forget("BVa")
+        assert index.contains([1, 2, 3, 10, 11]).tolist() == [False, False, False, True, True]
+
+    with RpidIndex(path, capacity=1000) as index:
+        assert len(index) == 2
+        assert index.drop_seen(frame([1, 10]))["评论ID"].tolist() == [1]
+
+
+def test_bloom_grows_past_capacity():
+    index = RpidIndex(None, capacity=100)
+    index.add(range(1000))
+
+    assert len(index) == 1000
+    assert index.bloom.capacity >= 1000
+    assert index.contains(range(1000)).all()
+    assert not index.contains(range(1000, 1100)).any()
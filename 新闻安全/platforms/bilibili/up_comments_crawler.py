@@ -7,16 +7,20 @@ B站UP主评论批量爬取工具
 
 import os
 import sys
-import time
 import json
 import csv
 import pandas as pd
 from datetime import datetime
 import subprocess
-import importlib.util
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 添加当前目录到Python路径，以便在进程内调用评论抓取引擎
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_comments_crawler import crawl_comments
+from crawl_scheduler import plan_crawl, print_plan
+from rpid_index import RpidIndex
 
 def get_bilibili_cookie():
     """获取B站Cookie"""
@@ -120,7 +124,9 @@ def collect_up_videos(up_name, start_date, end_date, max_videos=100):
                         'BV号': row['BV号'],
                         '标题': row.get('标题', ''),
                         '发布时间': row.get('发布时间', ''),
-                        'URL': row.get('URL', '')
+                        'URL': row.get('URL', ''),
+                        '播放量': row.get('播放量', '0'),
+                        '评论数': row.get('评论数', '0')
                     })
         
         print(f"共收集到 {len(videos)} 个视频")
@@ -140,39 +146,12 @@ def crawl_video_comments(bvid, cookie, output_dir="UP主评论数据"):
     :return: 是否成功
     """
     print(f"开始爬取视频 {bvid} 的评论...")
-    
-    # 准备comments_crawler.py的输入
-    comments_file = os.path.join(os.path.dirname(__file__), 'comments_crawler.py')
-    
-    if not os.path.exists(comments_file):
-        print("错误：找不到comments_crawler.py文件")
-        return False
-    
     try:
-        # 运行comments_crawler.py并自动输入参数
-        process = subprocess.Popen([
-            sys.executable, comments_file
-        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-           text=True, encoding='utf-8')
-        
-        # 自动输入cookie和BV号
-        inputs = f"{cookie}\n{bvid}\n"
-        stdout, stderr = process.communicate(input=inputs, timeout=300)  # 5分钟超时
-        
-        print(f"视频 {bvid} 评论爬取完成")
-        if stdout:
-            print(stdout)
-        if stderr:
-            print("stderr:", stderr)
-            
-        return True
-        
-    except subprocess.TimeoutExpired:
-        print(f"视频 {bvid} 评论爬取超时")
-        return False
+        results = crawl_comments([bvid], cookie=cookie, output_dir=output_dir)
     except Exception as e:
         print(f"爬取视频 {bvid} 评论时出错: {str(e)}")
         return False
+    return bool(results and results[0].get("path"))
 
 
 def merge_excel_files(up_name, output_dir="UP主评论数据"):
@@ -197,15 +176,19 @@ def merge_excel_files(up_name, output_dir="UP主评论数据"):
     
     print(f"找到 {len(excel_files)} 个Excel文件，开始合并...")
     
-    # 合并所有数据
+    # 合并所有数据，同一条评论（评论ID相同）只保留一次
     all_data = []
+    seen = RpidIndex(None, capacity=1000000)
+    duplicates = 0
     for file in excel_files:
         try:
             df = pd.read_excel(file)
             # 添加视频标识列
             video_bvid = os.path.basename(file).split('【')[1].split('】')[0] if '【' in file and '】' in file else '未知'
             df['视频BV号'] = video_bvid
-            all_data.append(df)
+            deduped = seen.drop_seen(df, record=True)
+            duplicates += len(df) - len(deduped)
+            all_data.append(deduped)
         except Exception as e:
             print(f"读取文件 {file} 时出错: {str(e)}")
     
@@ -215,6 +198,8 @@ def merge_excel_files(up_name, output_dir="UP主评论数据"):
     
     # 合并所有数据框
     merged_df = pd.concat(all_data, ignore_index=True)
+    if duplicates:
+        print(f"已去除 {duplicates} 条重复评论")
     
     # 保存合并后的文件
     output_file = os.path.join(output_dir, f'{up_name}_全部评论_合并版.xlsx')
@@ -263,38 +248,31 @@ def main(up_name=None, start_date=None, end_date=None, max_videos=None):
     
     print(f"\n开始批量爬取 {len(videos)} 个视频的评论...")
     
-    # 爬取每个视频的评论
+    # 在同一进程内并发爬取全部视频的评论，共享连接池、限速器和检查点；
+    # 已爬取过的视频不再跳过：评论爬虫会根据检查点只补抓新增评论
+    # 按每个请求能获得的评论数和播放量排列抓取顺序，中途中断时已抓取的是最重要的视频
+    output_dir = "UP主评论数据"
+    plan = plan_crawl(videos)
+    print_plan(plan)
+    bvids = plan['BV号'].tolist()
+    try:
+        results = crawl_comments(bvids, cookie=cookie, output_dir=output_dir)
+    except Exception as e:
+        print(f"批量爬取评论时出错: {str(e)}")
+        results = []
+
     success_count = 0
-    for i, video in enumerate(videos, 1):
-        print(f"\n[{i}/{len(videos)}] 处理视频: {video['BV号']} - {video['标题']}")
-        
-        # 检查是否已经爬取过该视频的评论
-        output_dir = "B站评论数据"
-        expected_file = os.path.join(output_dir, f"【{video['BV号']}】*_完整评论.xlsx")
-        
-        # 检查是否存在匹配的文件
-        import glob
-        existing_files = glob.glob(expected_file)
-        if existing_files:
-            print(f"视频 {video['BV号']} 的评论已存在，跳过")
+    for result in results:
+        if result.get("path"):
             success_count += 1
-            continue
-        
-        # 爬取评论
-        if crawl_video_comments(video['BV号'], cookie, output_dir):
-            success_count += 1
-            print(f"视频 {video['BV号']} 评论爬取成功")
         else:
-            print(f"视频 {video['BV号']} 评论爬取失败")
-        
-        # 添加延迟避免被封
-        time.sleep(3)
-    
+            print(f"视频 {result['bvid']} 评论爬取失败")
+
     print(f"\n评论爬取完成: {success_count}/{len(videos)} 个视频成功")
     
     # 合并所有评论文件
     print("\n开始合并所有评论文件...")
-    merge_excel_files(up_name)
+    merge_excel_files(up_name, output_dir)
     
     print("\n所有任务完成!")
 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频元数据缓存（SQLite）
+功能：按BV号缓存 /x/web-interface/view 的结果，评论、弹幕和互动数据爬虫共用，
+避免同一视频反复请求该接口。aid、cid、标题、分P等不会变化的字段永久有效，
+播放量、点赞数等统计数据超过 stats_ttl 秒后视为过期，需要重新请求。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join("B站评论数据", "video_cache.db")
+# 统计数据的有效期（秒）
+STATS_TTL = 6 * 3600
+
+
+def parse_view_data(data):
+    """
+    从 /x/web-interface/view 返回的 data 字段中提取需要缓存的内容
+    :return: {'bvid', 'aid', 'cid', 'title', 'pubdate', 'owner', 'pages', 'stat'}
+    """
+    return {
+        "bvid": data.get("bvid"),
+        "aid": data.get("aid"),
+        "cid": data.get("cid"),
+        "title": data.get("title", ""),
+        "pubdate": data.get("pubdate"),
+        "owner": (data.get("owner") or {}).get("name", ""),
+        "pages": [
+            {
+                "cid": page.get("cid"),
+                "page": page.get("page"),
+                "part": page.get("part", ""),
+                "duration": page.get("duration", 0),
+            }
+            for page in data.get("pages") or []
+        ],
+        "stat": data.get("stat") or {},
+    }
+
+
+class VideoCache:
+    """按BV号缓存视频元数据，内存和磁盘两级"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, stats_ttl=STATS_TTL):
+        """
+        :param path: 缓存数据库路径
+        :param stats_ttl: 统计数据有效期（秒）
+        """
+        self.path = path
+        self.stats_ttl = stats_ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._memory = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS video_meta (
+                    bvid TEXT PRIMARY KEY,
+                    aid INTEGER,
+                    cid INTEGER,
+                    title TEXT,
+                    pubdate INTEGER,
+                    owner TEXT,
+                    pages_json TEXT,
+                    stat_json TEXT,
+                    stat_updated REAL
+                )
+            """)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _load(self, bvid):
+        row = self.conn.execute(
+            "SELECT aid, cid, title, pubdate, owner, pages_json, stat_json, stat_updated"
+            " FROM video_meta WHERE bvid = ?",
+            (bvid,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        aid, cid, title, pubdate, owner, pages_json, stat_json, stat_updated = row
+        return {
+            "bvid": bvid,
+            "aid": aid,
+            "cid": cid,
+            "title": title,
+            "pubdate": pubdate,
+            "owner": owner,
+            "pages": json.loads(pages_json or "[]"),
+            "stat": json.loads(stat_json or "{}"),
+            "stat_updated": stat_updated or 0,
+        }
+
+    def get(self, bvid, need_stats=False):
+        """
+        读取缓存的视频信息
+        :param need_stats: 是否需要未过期的统计数据；统计数据过期时视为未命中
+        :return: 视频信息字典（格式同 parse_view_data，另含 stat_updated），未命中时返回 None
+        """
+        with self._lock:
+            info = self._memory.get(bvid)
+            if info is None:
+                info = self._load(bvid)
+                if info is not None:
+                    self._memory[bvid] = info
+
+            if info is None or (need_stats and time.time() - info["stat_updated"] > self.stats_ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(info)
+
+    def put(self, bvid, data):
+        """
+        写入一次 view 接口的返回结果
+        :param data: view 接口返回的 data 字段
+        :return: 缓存后的视频信息
+        """
+        info = parse_view_data(data)
+        info["bvid"] = bvid
+        info["stat_updated"] = time.time()
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO video_meta"
+                    " (bvid, aid, cid, title, pubdate, owner, pages_json, stat_json, stat_updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (bvid, info["aid"], info["cid"], info["title"], info["pubdate"], info["owner"],
+                     json.dumps(info["pages"], ensure_ascii=False),
+                     json.dumps(info["stat"], ensure_ascii=False), info["stat_updated"])
+                )
+            self._memory[bvid] = info
+        return dict(info)
+
+    def invalidate(self, bvid):
+        """删除视频的缓存"""
+        with self._lock:
+            self._memory.pop(bvid, None)
+            with self.conn:
+                self.conn.execute("DELETE FROM video_meta WHERE bvid = ?", (bvid,))
+
+
+_shared_cache = None
+
+
+def get_video_cache():
+    """获取进程内共享的视频元数据缓存"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = VideoCache()
+    return _shared_cache